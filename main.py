@@ -0,0 +1,50 @@
+import os
+import threading
+import uvicorn
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from google.adk.cli.fast_api import get_fast_api_app
+from tool_agent.sub_agents import meter_reading
+from tool_agent.sub_agents import downsampling
+from tool_agent.sub_agents import utilitiy_data
+
+load_dotenv()
+
+# ADK API server (the same routes as `adk api_server`, /run_sse included) plus the endpoints the
+# React UI reads directly instead of going through the agent.
+#
+#   uvicorn main:app --port 8000
+AGENTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ALLOWED_ORIGINS = [origin.strip() for origin in os.getenv("ALLOWED_ORIGINS", "*").split(",") if origin.strip()]
+
+app = get_fast_api_app(agents_dir=AGENTS_DIR, allow_origins=ALLOWED_ORIGINS, web=False)
+
+
+def _warm_up_vertex_clients():
+    print(f"Vertex AI clients warmed up: {utilitiy_data.warm_up_vertex_clients()}")
+
+
+if utilitiy_data.VERTEX_WARM_UP:
+    # In the background, so the server accepts requests meanwhile (an early query resolves them itself)
+    threading.Thread(target=_warm_up_vertex_clients, daemon=True).start()
+
+
+@app.get("/apps/tool_agent/users/{user_id}/meter-history")
+async def meter_history(user_id: str, meter_id: int = None, points: int = None, method: str = None, start: int = None, end: int = None):
+    """
+    History of the user's latest meter (or of meter_id, one of the user's meters), downsampled to at most points readings
+    (METER_HISTORY_POINTS by default, capped at METER_HISTORY_MAX_POINTS) with method "lttb" or "minmax".
+    start / end are epoch seconds.
+    """
+    if method is not None and method not in downsampling.METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(downsampling.METHODS)}")
+    if points is not None and points < 1:
+        raise HTTPException(status_code=400, detail="points must be at least 1")
+    result = await meter_reading.get_meter_history_points(user_id, meter_id, points, method, start, end)
+    if isinstance(result, str):
+        raise HTTPException(status_code=404 if result.startswith("Error: No meter") else 502, detail=result)
+    return result
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
@@ -0,0 +1,62 @@
+import asyncio
+
+import httpx
+
+from tool_agent.sub_agents import der_dispatch, http_client
+from tool_agent.sub_agents.der_registry import DerRecord
+
+
+def _records(count):
+    return [DerRecord(der_id=1000 + i, user="user", er_id=i, appliance_id=1) for i in range(count)]
+
+
+def _dispatch(monkeypatch, handler, records, **kwargs):
+    async def main():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(http_client, "get_async_client", lambda: client)
+        try:
+            return await der_dispatch.dispatch_async(records, False, **kwargs)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(main())
+
+
+def test_posts_in_flight_stay_under_the_concurrency(monkeypatch):
+    in_flight = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return httpx.Response(200, json={})
+
+    report = _dispatch(monkeypatch, handler, _records(50), concurrency=4)
+
+    assert report["succeeded"] == 50
+    assert report["failed"] == 0
+    assert peak == 4
+
+
+def test_retryable_errors_are_retried_and_other_4xx_are_final(monkeypatch):
+    attempts = {}
+
+    async def handler(request):
+        er_id = int(request.url.path.rsplit("/", 1)[-1])
+        attempts[er_id] = attempts.get(er_id, 0) + 1
+        if er_id == 0:
+            return httpx.Response(404, text="no such DER")
+        if er_id == 1 and attempts[er_id] == 1:
+            return httpx.Response(503, text="busy")
+        return httpx.Response(200, json={})
+
+    report = _dispatch(monkeypatch, handler, _records(3), retries=2, backoff=0.001)
+
+    assert report["succeeded"] == 2
+    assert report["failed"] == 1
+    assert report["retried"] == 1
+    assert attempts == {0: 1, 1: 2, 2: 1}
+    assert report["failures"][0]["er_id"] == 0
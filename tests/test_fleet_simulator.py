@@ -0,0 +1,21 @@
+import pytest
+
+from tool_agent.sub_agents import fleet_simulator
+
+
+@pytest.mark.parametrize("event_start_hour", [0, 6, 12, 17, 21])
+def test_shed_potential_never_exceeds_the_event_load_plus_battery_discharge(event_start_hour):
+    report = fleet_simulator.simulate(fleet_simulator.default_households(), event_start_hour, 3)
+
+    for transformer in report["transformers"]:
+        # An exporting transformer has no load to shed; its batteries can still discharge
+        limit = max(transformer["event_net_load_kw"], 0) + transformer["battery_discharge_kw"]
+        # The three figures are each rounded to 0.1 kW
+        assert transformer["shed_potential_kw"] <= limit + 0.15, transformer
+
+
+def test_default_fleet_stays_within_transformer_capacity():
+    report = fleet_simulator.simulate_fleet_flexibility()
+
+    assert report["households"] == fleet_simulator.default_households()
+    assert all(transformer["peak_utilization"] < 1 for transformer in report["transformers"])
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from tool_agent.sub_agents.singleflight import SingleFlight
+
+
+def test_followers_share_the_leaders_result():
+    flights = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"ok": True}
+
+    async def main():
+        return await asyncio.gather(*(flights.ado("key", fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == [{"ok": True}] * 5
+    assert len(calls) == 1
+    assert flights.stats()["coalesced"] == 4
+
+
+def test_cancelled_leader_does_not_fail_its_followers():
+    flights = SingleFlight()
+    release = None
+
+    async def fetch():
+        await release.wait()
+        return "result"
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        leader = asyncio.create_task(flights.ado("key", fetch))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(flights.ado("key", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(main()) == ["result"] * 3
+    assert flights.stats()["upstream"] == 1
+
+
+def test_errors_reach_every_caller_and_are_not_kept():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    async def main():
+        results = await asyncio.gather(*(flights.ado("key", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+        async def succeed():
+            return "recovered"
+
+        return await flights.ado("key", succeed)
+
+    assert asyncio.run(main()) == "recovered"
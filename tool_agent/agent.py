@@ -13,7 +13,13 @@ from .sub_agents.utilitiy_data import get_utility_data
 from .sub_agents.er_house_hold import create_er_house_hold,get_er_house_hold
 from .sub_agents.meter_reading import create_meter_data,get_meter_history
 from .sub_agents.der import create_der,toggle_der
-
+from .sub_agents.discovery import discover_solar_offerings
+from .sub_agents.transformer_load import get_transformer_placement_report_async
+from .sub_agents.transformer_rollup import get_transformer_rollup_async
+from .sub_agents.load_profile import analyze_load_profile
+from .sub_agents.der_dispatch import dispatch_ders
+from .sub_agents.der_shed import plan_der_shed_async,dispatch_der_shed,set_shed_priority_async
+from .sub_agents.fleet_simulator import simulate_fleet_flexibility_async
 
 import asyncio
 
@@ -46,6 +52,16 @@ root_agent = Agent(
 
     ---
 
+    ### 0. Discovering Everything at Once
+
+    - Use `discover_solar_offerings` when the user says:
+        - "what can I get for going solar?", "what options do I have?", "show me everything available", "what subsidies, programs and installers are there?"
+        - or any broad question spanning **several of the catalogs below** (subsidies, demand flexibility programs, solar retail, solar services, connections).
+        - It searches all of them in one call; prefer it over calling the individual `search_*` tools one after another.
+        - If a catalog reports `"status": "timeout"`, present the others and offer to retry that one with its own `search_*` tool.
+
+    ---
+
     ### 1. Subsidies
 
     - Use `search_subsidies_data` when the user says:
@@ -175,6 +191,7 @@ root_agent = Agent(
         - "get my meter reading history", "show past meter readings", "what were my meter readings last month?", "electricity meter history"
         - or any request for **historical data from their energy meter**.
         - If the user asks for "meter readings" without specifying a period, you can offer to show the most recent ones or ask for a specific date range.
+        - The readings are downsampled: leave `points` at its default for an overview, raise it only when the user wants more detail, and use `method="minmax"` when the highs and lows matter.
 
     ---
 
@@ -187,6 +204,51 @@ root_agent = Agent(
 
     ---
 
+    ### 10. Transformer Placement
+
+    - Use `get_transformer_placement_report` when the user (typically a utility operator) says:
+        - "how loaded are the transformers?", "show the transformer placement report", "which transformer gets the next meter?"
+        - or any request about **meters and DER load per transformer**.
+        - Summarize the most loaded transformers and their utilization first.
+    - Use `get_transformer_rollup` when the operator asks about **measured consumption** rather than placement:
+        - "what is the load on transformer 183 right now?", "how much is the whole utility drawing?", "show transformer 180's load over the last 6 hours"
+        - Give the latest interval's kW and utilization, and mention how many meters reported in it.
+
+    ---
+
+    ### 11. Load Profile Analytics
+
+    - Use `analyze_load_profile` when the user says:
+        - "when do I use the most power?", "what are my peak hours?", "what is my base load?", "how does this month compare to last month?"
+        - or any question about **patterns in their electricity use** rather than the raw readings.
+        - Answer from the summary (peak window, base load, monthly change); use `get_meter_history` only when the user asks for the readings themselves.
+
+    ---
+
+    ### 12. Demand Flexibility Event Dispatch
+
+    - Use `dispatch_ders` when a utility operator says:
+        - "start the battery discharge event", "switch off all enrolled air conditioners", "turn the water pumps of energy resources 1915 and 1916 back on"
+        - or any command to **switch many DERs at once** rather than one appliance of their own (use `toggle_der` for that).
+        - Confirm the target state and the appliances before dispatching. Only households enrolled in a demand flexibility program are dispatched.
+        - The fleet-wide tools of this section are reserved to utility operators: if a tool answers that the user is not an operator, say so and do not retry.
+        - Report how many DERs were switched, how many failed, and the completion time (p50 / p99).
+    - When the utility asks for a **load reduction in kW** ("PG&E needs 500 kW shed from 5 to 8 pm"), use `plan_der_shed` with the target instead of picking appliances yourself:
+        - Present the plan (planned kW, any shortfall, DERs and households per appliance) and dispatch it with `dispatch_der_shed` and its `plan_id` once the operator confirms.
+    - Use `set_shed_priority` when a household says which appliances they need most or least during events, e.g. "never switch off my Refrigerator" (priority 0) or "the Water pump can go first" (priority 1).
+
+    ---
+
+    ### 13. Flexibility Capacity Planning
+
+    - Use `simulate_fleet_flexibility` when a utility operator asks:
+        - "how much could each transformer shed between 5 and 8 pm?", "is it worth enrolling households in the Home Battery Discharge Program?"
+        - or any **what-if question about the fleet's flexibility** before households are enrolled or an event is planned.
+        - Pass the event start hour and duration, and `households` only when the operator gives a fleet size (the default is sized from the transformers' capacity); results are estimates from simulated households, say so and do not present them as metered data.
+        - Summarize the fleet shed potential and battery discharge first, then the transformers with the least headroom.
+
+    ---
+
     Always use the **full API response**, but return only **relevant, clear, and concise information** based on the user's query. If the query is broad, provide a summary and offer to give more details.
     """,
     tools=[
@@ -218,7 +280,16 @@ root_agent = Agent(
         get_meter_history,
         # create_der,
         toggle_der,
-        ], # Pass the function directly
+        discover_solar_offerings,
+        get_transformer_placement_report_async,
+        get_transformer_rollup_async,
+        analyze_load_profile,
+        dispatch_ders,
+        plan_der_shed_async,
+        dispatch_der_shed,
+        set_shed_priority_async,
+        simulate_fleet_flexibility_async,
+        ], # Async variants, registered under the sync tool names so the ADK runner never blocks its event loop
 )
 
 async def main():
@@ -0,0 +1,217 @@
+from dotenv import load_dotenv
+import os
+import re
+import uuid
+import json
+from datetime import datetime, timezone
+from types import MappingProxyType
+
+load_dotenv()
+
+# Precompiled payload builders.
+# Each template is parsed once at import. Its skeleton is serialized once into literal JSON
+# segments with holes for the per-request fields, so building a payload is a single join
+# of those segments with the JSON-encoded field values instead of json.loads + json.dumps per call.
+
+# Field name -> path inside the payload, shared by the Beckn modules
+ORDER_FIELDS = {
+    "provider_id": ("message", "order", "provider", "id"),
+    "item_id": ("message", "order", "items", 0, "id"),
+}
+STATUS_FIELDS = {
+    "order_id": ("message", "order_id"),
+}
+
+# Context fields taken from the environment once, and fields regenerated on every build
+_ENV_CONTEXT_FIELDS = ("bap_id", "bap_uri", "bpp_id", "bpp_uri")
+_PER_REQUEST_CONTEXT_FIELDS = ("transaction_id", "message_id", "timestamp")
+
+_PLACEHOLDER_RE = re.compile(r'"\{\{(\w+)\}\}"')
+# The C string encoder behind json.dumps, without building a JSONEncoder per call
+_encode_string = json.encoder.encode_basestring
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class PayloadBuilder:
+    """
+    A payload template compiled once, producing request bytes with only the per-request fields filled in.
+
+    For Beckn templates (those with a "context"), bap/bpp ids come from the environment and
+    transaction_id, message_id and timestamp are generated on every build.
+    Other fields are declared by name with their path in the payload, e.g.
+    PayloadBuilder(TEMPLATE, provider_id=("message", "order", "provider", "id")).
+    """
+
+    def __init__(self, template: str, **fields: tuple):
+        skeleton = json.loads(template)
+        self.fields = dict(fields)
+
+        context = skeleton.get("context") if isinstance(skeleton, dict) else None
+        self._context_fields = ()
+        if isinstance(context, dict):
+            # Some templates (e.g. the subsidy search) deliberately do not send a message_id
+            self._context_fields = tuple(name for name in _ENV_CONTEXT_FIELDS + _PER_REQUEST_CONTEXT_FIELDS if name in context)
+            for name in self._context_fields:
+                context[name] = "{{%s}}" % name
+
+        for name, path in self.fields.items():
+            node = skeleton
+            for key in path[:-1]:
+                node = node[key]
+            node[path[-1]] = "{{%s}}" % name
+
+        self.skeleton = _freeze(skeleton)
+        self._raw = json.dumps(skeleton, ensure_ascii=False, separators=(",", ":"))
+
+        unknown = set(_PLACEHOLDER_RE.findall(self._raw)) - set(self.fields) - set(self._context_fields)
+        if unknown:
+            raise ValueError(f"Template placeholders without a declared field: {sorted(unknown)}")
+
+        # (segments, slots), replaced as one value so a thread building concurrently never sees
+        # the segments of one compilation with the slots of another.
+        # Compiled here (builders are module constants, created after load_dotenv), or on the first
+        # build once the BAP/BPP environment variables are set.
+        self._compiled = None
+        self._compiled = self._compile_from_env()
+
+    @property
+    def domain(self):
+        context = self.skeleton.get("context") or {}
+        return context.get("domain")
+
+    @property
+    def action(self):
+        context = self.skeleton.get("context") or {}
+        return context.get("action")
+
+    def refresh(self):
+        """Forgets the compiled segments so the next build re-reads the BAP/BPP environment variables."""
+        self._compiled = None
+
+    def _compile_from_env(self):
+        """
+        Bakes the environment values into the literal segments.
+
+        Returns:
+            (segments, slots), or None when a BAP/BPP environment variable is not set.
+        """
+        env_values = {name: os.getenv(name) for name in _ENV_CONTEXT_FIELDS if name in self._context_fields}
+        if not all(env_values.values()):
+            return None
+        raw = self._raw
+        for name, value in env_values.items():
+            raw = raw.replace('"{{%s}}"' % name, json.dumps(value, ensure_ascii=False))
+        parts = _PLACEHOLDER_RE.split(raw)
+        # parts alternates literal, field name, literal, field name, ..., literal
+        return tuple(parts[0::2]), tuple(parts[1::2])
+
+    def build(self, **values):
+        """
+        Builds the request body.
+
+        Args:
+            **values: Values for the declared fields (e.g. provider_id, item_id, order_id).
+
+        Returns:
+            A (payload_bytes, error_message) tuple. payload_bytes is None when error_message is set.
+        """
+        compiled = self._compiled
+        if compiled is None:
+            compiled = self._compile_from_env()
+            if compiled is None:
+                return None, "Error: BAP_ID, BAP_URI, BPP_ID, or BPP_URI environment variables are not set."
+            self._compiled = compiled
+        segments, slots = compiled
+
+        if self._context_fields:
+            if "transaction_id" not in values:
+                values["transaction_id"] = str(uuid.uuid4())
+            if "message_id" not in values:
+                values["message_id"] = str(uuid.uuid4())
+            if "timestamp" not in values:
+                # ISO 8601 format timestamp with UTC timezone
+                values["timestamp"] = datetime.now(timezone.utc).isoformat()
+
+        parts = [segments[0]]
+        for index, name in enumerate(slots):
+            value = values[name]
+            if isinstance(value, str):
+                parts.append(_encode_string(value))
+            else:
+                parts.append(json.dumps(value))
+            parts.append(segments[index + 1])
+        return "".join(parts).encode("utf-8"), None
+
+
+if __name__ == "__main__":
+    # Micro-benchmark: per-call CPU of the old json.loads(TEMPLATE) + mutate + json.dumps
+    # path versus a precompiled builder. Run with: python tool_agent/sub_agents/beckn_payloads.py
+    import timeit
+
+    for name in _ENV_CONTEXT_FIELDS:
+        os.environ.setdefault(name, f"{name}.example.becknprotocol.io")
+
+    SELECT_TEMPLATE = """
+    {
+        "context": {
+            "domain": "deg:retail", "action": "select",
+            "location": {"country": {"code": "USA"}, "city": {"code": "NANP:628"}},
+            "version": "1.1.0",
+            "bap_id": "{{bap_id}}", "bap_uri": "{{bap_uri}}", "bpp_id": "{{bpp_id}}", "bpp_uri": "{{bpp_uri}}",
+            "transaction_id": "{{transaction_id}}", "message_id": "{{message_id}}", "timestamp": "{{timestamp}}"
+        },
+        "message": {"order": {"provider": {"id": "{{provider_id}}"}, "items": [{"id": "{{item_id}}"}]}}
+    }
+    """
+
+    def legacy_build():
+        payload_dict = json.loads(SELECT_TEMPLATE)
+        payload_dict["context"]["bap_id"] = os.getenv("bap_id")
+        payload_dict["context"]["bap_uri"] = os.getenv("bap_uri")
+        payload_dict["context"]["bpp_id"] = os.getenv("bpp_id")
+        payload_dict["context"]["bpp_uri"] = os.getenv("bpp_uri")
+        payload_dict["context"]["transaction_id"] = str(uuid.uuid4())
+        payload_dict["context"]["message_id"] = str(uuid.uuid4())
+        payload_dict["context"]["timestamp"] = datetime.now(timezone.utc).isoformat()
+        payload_dict["message"]["order"]["provider"]["id"] = "27"
+        payload_dict["message"]["order"]["items"][0]["id"] = "33"
+        return json.dumps(payload_dict).encode("utf-8")
+
+    builder = PayloadBuilder(SELECT_TEMPLATE, **ORDER_FIELDS)
+
+    def builder_build():
+        return builder.build(provider_id="27", item_id="33")[0]
+
+    assert json.loads(builder_build())["message"] == json.loads(legacy_build())["message"]
+
+    runs = 20000
+    legacy = min(timeit.repeat(legacy_build, number=runs, repeat=5)) / runs
+    compiled = min(timeit.repeat(builder_build, number=runs, repeat=5)) / runs
+
+    # The same comparison without the uuid4 / timestamp generation both paths share
+    fixed = {"transaction_id": str(uuid.uuid4()), "message_id": str(uuid.uuid4()), "timestamp": datetime.now(timezone.utc).isoformat()}
+
+    def legacy_serialize():
+        payload_dict = json.loads(SELECT_TEMPLATE)
+        payload_dict["context"].update(fixed)
+        payload_dict["message"]["order"]["provider"]["id"] = "27"
+        payload_dict["message"]["order"]["items"][0]["id"] = "33"
+        return json.dumps(payload_dict).encode("utf-8")
+
+    def builder_serialize():
+        return builder.build(provider_id="27", item_id="33", **fixed)[0]
+
+    legacy_only = min(timeit.repeat(legacy_serialize, number=runs, repeat=5)) / runs
+    compiled_only = min(timeit.repeat(builder_serialize, number=runs, repeat=5)) / runs
+
+    print(f"{'':34}{'per call':>12}{'serialization only':>22}")
+    print(f"{'json.loads + json.dumps':34}{legacy * 1e6:9.2f} us{legacy_only * 1e6:19.2f} us")
+    print(f"{'PayloadBuilder.build':34}{compiled * 1e6:9.2f} us{compiled_only * 1e6:19.2f} us")
+    print(f"{'speed-up':34}{legacy / compiled:10.1f}x{legacy_only / compiled_only:20.1f}x")
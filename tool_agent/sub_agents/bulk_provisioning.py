@@ -0,0 +1,194 @@
+from dotenv import load_dotenv
+import os
+import csv
+import sys
+import time
+import asyncio
+import argparse
+from . import durable_store
+from . import meter_reading
+from . import er_house_hold
+
+load_dotenv()
+
+# Bulk household provisioning.
+# confirm_connection_data creates one meter and one energy resource per chat turn. For utility-led
+# onboarding, households are provisioned from a CSV instead: rows are streamed from the file and each
+# one gets a meter (placed on the least-loaded transformer) and an energy resource, with at most
+# BULK_PROVISIONING_CONCURRENCY households in flight against the meter-data-simulator.
+#
+# Every row's outcome is written to the provisioning_rows table of the durable store, under a job
+# name (the CSV path by default). Running the same job again resumes it: rows already provisioned are
+# skipped, and rows whose meter was created but not their energy resource only get the energy resource.
+#
+# CSV columns (all optional): "name" is the household name, "user_id" the user the meter and energy
+# resource are recorded for. Rows without a user_id are all recorded under one scope per job
+# ("bulk:<job>"), so a large CSV takes one slot of the state store's users rather than evicting chat
+# users; the rows themselves are tracked in provisioning_rows.
+#
+#   python -m tool_agent.sub_agents.bulk_provisioning households.csv --concurrency 32
+BULK_PROVISIONING_CONCURRENCY = int(os.getenv("BULK_PROVISIONING_CONCURRENCY", "16"))
+
+# Row statuses
+PROVISIONED = "ok"
+METER_ONLY = "meter_only"
+FAILED = "failed"
+
+# Failed rows listed in the summary, the others are in provisioning_rows
+MAX_REPORTED_FAILURES = 20
+
+
+def _created_id(response_data):
+    if isinstance(response_data, dict) and isinstance(response_data.get("data"), dict):
+        return response_data["data"].get("id")
+    return None
+
+
+def _previous_results(job: str) -> dict:
+    """row number -> (status, meter_id) of the rows already attempted in the job."""
+    rows = durable_store.store.rows("SELECT row_number, status, meter_id FROM provisioning_rows WHERE job = ?", (job,))
+    return {row_number: (status, meter_id) for row_number, status, meter_id in rows}
+
+
+_SAVE_RESULT = (
+    "INSERT OR REPLACE INTO provisioning_rows (job, row_number, household, status, meter_id, er_id, error, finished_at)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def _save_result(job: str, row_number: int, household: str, status: str, meter_id=None, er_id=None, error: str = None):
+    durable_store.store.execute(_SAVE_RESULT, (job, row_number, household, status, meter_id, er_id, error, time.time()))
+
+
+def _checkpoint_meter(job: str, row_number: int, household: str, meter_id) -> bool:
+    # Committed synchronously (not queued with the other results), so the row is on disk before the
+    # energy resource is created and a resumed job does not create a second meter
+    return durable_store.store.commit(_SAVE_RESULT, (job, row_number, household, METER_ONLY, meter_id, None, None, time.time()))
+
+
+async def _create_meter(scope: str):
+    """Returns (meter_id, error_message)."""
+    response_data, error_msg = await meter_reading.create_meter(scope)
+    if error_msg:
+        return None, error_msg
+    meter_id = _created_id(response_data)
+    if meter_id is None:
+        return None, response_data if isinstance(response_data, str) else f"Unexpected meter response: {response_data}"
+    return meter_id, None
+
+
+async def _create_energy_resource(scope: str, meter_id, name: str):
+    """Returns (er_id, error_message)."""
+    response_data, error_msg = await er_house_hold.create_energy_resource(meter_id, scope, name)
+    if error_msg:
+        return None, error_msg
+    er_id = _created_id(response_data)
+    if er_id is None:
+        return None, response_data if isinstance(response_data, str) else f"Unexpected energy resource response: {response_data}"
+    return er_id, None
+
+
+async def _provision_row(job: str, row_number: int, row: dict, meter_id=None) -> str:
+    """Creates the meter (unless meter_id is given) and energy resource of one row, and returns its status."""
+    household = (row.get("name") or "").strip() or er_house_hold.ER_HOUSE_HOLD_NAME
+    scope = (row.get("user_id") or "").strip() or f"bulk:{job}"
+    try:
+        if meter_id is None:
+            meter_id, error_msg = await _create_meter(scope)
+            if error_msg:
+                _save_result(job, row_number, household, FAILED, error=error_msg)
+                return FAILED
+            if not await asyncio.to_thread(_checkpoint_meter, job, row_number, household, meter_id):
+                # Not on disk: stop at the meter rather than provision a row a resumed job would redo
+                _save_result(job, row_number, household, METER_ONLY, meter_id=meter_id, error="Error: Could not record the created meter.")
+                return METER_ONLY
+
+        er_id, error_msg = await _create_energy_resource(scope, meter_id, household)
+        if error_msg:
+            _save_result(job, row_number, household, METER_ONLY, meter_id=meter_id, error=error_msg)
+            return METER_ONLY
+        _save_result(job, row_number, household, PROVISIONED, meter_id=meter_id, er_id=er_id)
+        return PROVISIONED
+    except Exception as e:
+        _save_result(job, row_number, household, METER_ONLY if meter_id is not None else FAILED, meter_id=meter_id, error=f"An unexpected error occurred: {e}")
+        return METER_ONLY if meter_id is not None else FAILED
+
+
+async def provision_households_async(csv_path: str, job: str = None, concurrency: int = BULK_PROVISIONING_CONCURRENCY, resume: bool = True) -> dict:
+    """
+    Provisions a meter and an energy resource for every row of a CSV file.
+
+    Args:
+        csv_path: The CSV file, with optional "name" and "user_id" columns.
+        job: The job name results are recorded under (defaults to the absolute CSV path).
+        concurrency: Max households provisioned at once.
+        resume: Skip the rows the job already provisioned (and reuse the meters it already created).
+
+    Returns:
+        A summary with the number of rows per status, the elapsed time and the throughput in households/sec.
+    """
+    job = job or os.path.abspath(csv_path)
+    previous = _previous_results(job) if resume else {}
+    counts = {PROVISIONED: 0, METER_ONLY: 0, FAILED: 0, "skipped": 0}
+    failed_rows = []
+    pending = {}  # task -> row number
+
+    def collect(done):
+        for task in done:
+            status = task.result()
+            counts[status] += 1
+            if status != PROVISIONED and len(failed_rows) < MAX_REPORTED_FAILURES:
+                failed_rows.append(pending[task])
+            del pending[task]
+
+    started = time.monotonic()
+    with open(csv_path, newline="", encoding="utf-8") as csv_file:
+        for row_number, row in enumerate(csv.DictReader(csv_file), start=1):
+            status, meter_id = previous.get(row_number, (None, None))
+            if status == PROVISIONED:
+                counts["skipped"] += 1
+                continue
+            if len(pending) >= concurrency:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                collect(done)
+            task = asyncio.create_task(_provision_row(job, row_number, row, meter_id if status == METER_ONLY else None))
+            pending[task] = row_number
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            collect(done)
+    elapsed = time.monotonic() - started
+    durable_store.store.flush()
+
+    return {
+        "job": job,
+        "provisioned": counts[PROVISIONED],
+        "meter_only": counts[METER_ONLY],
+        "failed": counts[FAILED],
+        "skipped": counts["skipped"],
+        "failed_rows": sorted(failed_rows),
+        "elapsed_s": round(elapsed, 3),
+        "households_per_sec": round(counts[PROVISIONED] / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def provision_households(csv_path: str, job: str = None, concurrency: int = BULK_PROVISIONING_CONCURRENCY, resume: bool = True) -> dict:
+    """Sync entry point of provision_households_async, for scripts."""
+    return asyncio.run(provision_households_async(csv_path, job, concurrency, resume))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Provision a meter and an energy resource for every household of a CSV file.")
+    parser.add_argument("csv_path")
+    parser.add_argument("--job", help="job name results are recorded under (default: the CSV path)")
+    parser.add_argument("--concurrency", type=int, default=BULK_PROVISIONING_CONCURRENCY)
+    parser.add_argument("--no-resume", action="store_true", help="provision every row again")
+    args = parser.parse_args(argv)
+
+    summary = provision_households(args.csv_path, args.job, args.concurrency, resume=not args.no_resume)
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+    return 0 if summary["failed"] == 0 and summary["meter_only"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
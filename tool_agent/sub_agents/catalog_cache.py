@@ -0,0 +1,231 @@
+from dotenv import load_dotenv
+import os
+import json
+import time
+import threading
+import asyncio
+from . import http_client
+from . import singleflight
+
+load_dotenv()
+
+# Search-result cache shared by the search_* tools.
+# The search tools always send the same fixed intent per domain (e.g. descriptor name "solar"),
+# so the catalog they get back only changes when the BPP changes it. Results are kept per
+# (domain, intent, location) and served from memory:
+#   - younger than CATALOG_CACHE_TTL seconds: returned as is
+#   - older, but within CATALOG_CACHE_STALE_TTL more seconds: returned as is, and refreshed in the background
+#   - older than that (or missing): fetched upstream before returning
+# Error responses are never cached, nor are the responses of fetches that started before the entry
+# was invalidated (they may predate the change the invalidation is for). Concurrent fetches of an
+# entry are coalesced per invalidation generation, so a search made after an invalidation never
+# joins a fetch started before it. The confirm tools invalidate their domain, since an order can
+# use up stock or a quota the catalog shows. CATALOG_CACHE_TTL=0 disables the cache.
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+CATALOG_CACHE_STALE_TTL = float(os.getenv("CATALOG_CACHE_STALE_TTL", "1800"))
+
+
+def _canonical(value) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+
+def search_key(builder) -> tuple:
+    """
+    Returns the (domain, intent, location) cache key of a search payload builder.
+    """
+    skeleton = builder.skeleton
+    context = skeleton.get("context") or {}
+    message = skeleton.get("message") or {}
+    return (context.get("domain"), _canonical(_thaw(message.get("intent"))), _canonical(_thaw(context.get("location"))))
+
+
+def _thaw(value):
+    # The builder skeleton is frozen (MappingProxyType / tuples)
+    if hasattr(value, "items"):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+class CatalogCache:
+    """
+    TTL cache with stale-while-revalidate for search responses.
+    Sync callers refresh stale entries on a daemon thread, async callers on an event loop task.
+    """
+
+    def __init__(self, ttl: float = CATALOG_CACHE_TTL, stale_ttl: float = CATALOG_CACHE_STALE_TTL):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = {}  # key -> (response, fetched_at)
+        self._refreshing = set()
+        self._invalidations = 0  # invalidate() calls for all domains
+        self._domain_invalidations = {}  # domain -> invalidate(domain) calls
+        self._lock = threading.Lock()
+        self._tasks = set()  # keeps background refresh tasks referenced until they finish
+        self.listeners = []  # called with (key, response) for every successful upstream response
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        """Returns (response, needs_refresh). response is None when an upstream fetch is required."""
+        if self.ttl <= 0:
+            return None, False
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, False
+        response, fetched_at = entry
+        age = time.monotonic() - fetched_at
+        if age < self.ttl:
+            self.hits += 1
+            return response, False
+        if age < self.ttl + self.stale_ttl:
+            self.stale_hits += 1
+            with self._lock:
+                if key in self._refreshing:
+                    return response, False
+                self._refreshing.add(key)
+            return response, True
+        self.misses += 1
+        return None, False
+
+    def _generation(self, key) -> tuple:
+        """Changes whenever the entry of key is invalidated."""
+        return self._invalidations, self._domain_invalidations.get(key[0], 0)
+
+    def _store(self, key, response, generation):
+        if isinstance(response, dict):
+            with self._lock:
+                # Not cached if invalidated while it was fetched
+                if self.ttl > 0 and generation == self._generation(key):
+                    self._entries[key] = (response, time.monotonic())
+            for listener in self.listeners:
+                try:
+                    listener(key, response)
+                except Exception as e:
+                    print(f"Warning: Search response listener failed: {e}")
+        return response
+
+    def _refresh_done(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _fetch(self, key, generation, fetch):
+        # Coalesced with the identical fetches of the same generation only
+        return singleflight.flights.do(f"catalog {key} {generation}", fetch, "search")
+
+    async def _afetch(self, key, generation, afetch):
+        return await singleflight.flights.ado(f"catalog {key} {generation}", afetch, "search")
+
+    def get(self, key, fetch):
+        """
+        Returns the cached response for key, calling fetch() when it is missing or expired.
+
+        Args:
+            key: The cache key, see search_key.
+            fetch: A callable returning the decoded response (dict) or an error message string.
+        """
+        generation = self._generation(key)
+        response, needs_refresh = self._lookup(key)
+        if response is None:
+            return self._store(key, self._fetch(key, generation, fetch), generation)
+        if needs_refresh:
+            def refresh():
+                try:
+                    self._store(key, self._fetch(key, generation, fetch), generation)
+                finally:
+                    self._refresh_done(key)
+            threading.Thread(target=refresh, daemon=True).start()
+        return response
+
+    async def aget(self, key, afetch):
+        """
+        Async counterpart of get. afetch is a coroutine function.
+        """
+        generation = self._generation(key)
+        response, needs_refresh = self._lookup(key)
+        if response is None:
+            return self._store(key, await self._afetch(key, generation, afetch), generation)
+        if needs_refresh:
+            async def refresh():
+                try:
+                    self._store(key, await self._afetch(key, generation, afetch), generation)
+                finally:
+                    self._refresh_done(key)
+            task = asyncio.get_running_loop().create_task(refresh())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return response
+
+    def invalidate(self, domain: str = None):
+        """
+        Drops cached search responses, for one domain (e.g. "deg:retail") or all of them.
+
+        Returns:
+            The number of entries dropped.
+        """
+        with self._lock:
+            if domain is None:
+                self._invalidations += 1
+            else:
+                self._domain_invalidations[domain] = self._domain_invalidations.get(domain, 0) + 1
+            keys = [key for key in self._entries if domain is None or key[0] == domain]
+            for key in keys:
+                self._entries.pop(key, None)
+        return len(keys)
+
+
+cache = CatalogCache()
+# builder -> search_key(builder), the skeletons never change
+_keys = {}
+
+
+def key_for(builder) -> tuple:
+    """Returns the cache key of a search payload builder, computed once per builder."""
+    key = _keys.get(builder)
+    if key is None:
+        key = _keys[builder] = search_key(builder)
+    return key
+
+
+def search(builder, url: str):
+    """
+    Sends the search built by builder to url, answering from the catalog cache when possible.
+
+    Returns:
+        The decoded JSON response, or an error message string.
+    """
+    def fetch():
+        payload, error_msg = builder.build()
+        if error_msg:
+            return error_msg
+        return http_client.request_json("POST", url, action="search", data=payload, headers=http_client.JSON_HEADERS)
+    return cache.get(key_for(builder), fetch)
+
+
+async def asearch(builder, url: str):
+    """
+    Async counterpart of search.
+    """
+    async def afetch():
+        payload, error_msg = builder.build()
+        if error_msg:
+            return error_msg
+        return await http_client.arequest_json("POST", url, action="search", data=payload, headers=http_client.JSON_HEADERS)
+    return await cache.aget(key_for(builder), afetch)
+
+
+def add_listener(listener):
+    """
+    Registers listener(key, response), called with every search response fetched upstream.
+    """
+    cache.listeners.append(listener)
+
+
+def invalidate(domain: str = None) -> int:
+    """
+    Drops cached search responses for a domain, or all domains when domain is None.
+    """
+    return cache.invalidate(domain)
@@ -0,0 +1,195 @@
+import re
+import threading
+from . import catalog_cache
+from .entity_extractor import extractor
+
+# Provider / item index per search catalog.
+# Each Beckn module used to keep a hand-written provider_name_to_id / provider_id_to_items pair and
+# resolve the user's query with nested substring scans over them. The index keeps those mappings
+# as seed entries and adds every provider and item seen in that module's search responses, with
+# hash maps by normalized name and by id plus a reverse item -> providers map. Names are also
+# registered in the shared entity extractor, so finding the provider and item mentioned in a query
+# is a single scan of the query however large the catalog grows.
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def normalize(text) -> str:
+    """
+    Lowercases and keeps only the alphanumeric words, e.g.
+    "5KW Solar Panel System – Polycrystalline & Mono PERC" -> "5kw solar panel system polycrystalline mono perc".
+    """
+    return " ".join(_TOKEN_RE.findall(str(text).lower()))
+
+
+def iter_catalog(search_response):
+    """
+    Yields (provider_id, provider_name, [(item_id, item_name), ...]) for every provider of a Beckn
+    search (on_search) response. Providers and items without an id or a name are skipped.
+    """
+    if not isinstance(search_response, dict):
+        return
+    for response in search_response.get("responses") or []:
+        catalog = ((response or {}).get("message") or {}).get("catalog") or {}
+        for provider in catalog.get("providers") or []:
+            provider_id = provider.get("id")
+            provider_name = (provider.get("descriptor") or {}).get("name")
+            if provider_id is None or not provider_name:
+                continue
+            items = []
+            for item in provider.get("items") or []:
+                item_name = (item.get("descriptor") or {}).get("name")
+                if item.get("id") is not None and item_name:
+                    items.append((item["id"], item_name))
+            yield provider_id, provider_name, items
+
+
+class CatalogIndex:
+    """
+    Providers and items of one search catalog (one domain + intent).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.provider_names = {}   # provider_id -> provider name
+        self.provider_ids = {}     # normalized provider name -> provider_id
+        self.items = {}            # provider_id -> {item_id: item name}
+        self.item_ids = {}         # (provider_id, normalized item name) -> item_id
+        self.item_providers = {}   # normalized item name -> {provider_id: item_id}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.provider_names)
+
+    def add_provider(self, provider_id, name: str):
+        provider_id = str(provider_id)
+        key = normalize(name)
+        if not key:
+            return
+        with self._lock:
+            previous = self.provider_names.get(provider_id)
+            if previous is not None and normalize(previous) != key:
+                self.provider_ids.pop(normalize(previous), None)
+                extractor.remove(previous, "provider", provider_id, scope=self.name)
+            self.provider_names[provider_id] = name
+            self.provider_ids[key] = provider_id
+            self.items.setdefault(provider_id, {})
+            extractor.add(name, "provider", provider_id, scope=self.name)
+
+    def add_item(self, provider_id, item_id, name: str):
+        provider_id, item_id = str(provider_id), str(item_id)
+        key = normalize(name)
+        if not key:
+            return
+        with self._lock:
+            items = self.items.setdefault(provider_id, {})
+            previous = items.get(item_id)
+            if previous is not None and normalize(previous) != key:
+                self.item_ids.pop((provider_id, normalize(previous)), None)
+                self.item_providers.get(normalize(previous), {}).pop(provider_id, None)
+                extractor.remove(previous, "item", (provider_id, item_id), scope=self.name)
+            items[item_id] = name
+            self.item_ids[(provider_id, key)] = item_id
+            self.item_providers.setdefault(key, {})[provider_id] = item_id
+            extractor.add(name, "item", (provider_id, item_id), scope=self.name)
+
+    def seed(self, provider_name_to_id: dict, provider_id_to_items: dict):
+        """
+        Loads a module's hand-written mappings. Items may be a {name: id} dict or a [{"name", "id"}] list.
+        """
+        for provider_name, provider_id in provider_name_to_id.items():
+            self.add_provider(provider_id, provider_name)
+        for provider_id, items in provider_id_to_items.items():
+            if isinstance(items, dict):
+                items = [{"name": name, "id": item_id} for name, item_id in items.items()]
+            for item in items:
+                self.add_item(provider_id, item["id"], item["name"])
+
+    def ingest(self, search_response) -> int:
+        """
+        Adds the providers and items of a Beckn search (on_search) response.
+
+        Returns:
+            The number of providers found in the response.
+        """
+        count = 0
+        for provider_id, provider_name, items in iter_catalog(search_response):
+            self.add_provider(provider_id, provider_name)
+            count += 1
+            for item_id, item_name in items:
+                self.add_item(provider_id, item_id, item_name)
+        return count
+
+    # --- Lookups ---
+
+    def provider_id(self, name_or_id) -> str | None:
+        """Returns the provider id for a provider name (any case/punctuation) or id."""
+        if name_or_id is None:
+            return None
+        if str(name_or_id) in self.provider_names:
+            return str(name_or_id)
+        return self.provider_ids.get(normalize(name_or_id))
+
+    def provider_name(self, provider_id) -> str | None:
+        return self.provider_names.get(str(provider_id))
+
+    def item_id(self, provider_id, name_or_id) -> str | None:
+        """Returns the id of an item of the given provider, by item name or id."""
+        provider_id = str(provider_id)
+        if str(name_or_id) in self.items.get(provider_id, {}):
+            return str(name_or_id)
+        return self.item_ids.get((provider_id, normalize(name_or_id)))
+
+    def item_names(self, provider_id) -> list:
+        """Returns the item names offered by a provider."""
+        return list(self.items.get(str(provider_id), {}).values())
+
+    def providers_for_item(self, item_name: str) -> list:
+        """Returns the names of the providers offering an item."""
+        return [self.provider_names[provider_id] for provider_id in self.item_providers.get(normalize(item_name), {})]
+
+    def find_provider(self, search_query: str) -> str | None:
+        """Returns the name of the provider mentioned in the query (the longest match), or None."""
+        match = extractor.best(search_query, "provider", self.name)
+        return self.provider_names[match.value] if match else None
+
+    def find_item(self, search_query: str, provider_id=None) -> str | None:
+        """
+        Returns the name of the item mentioned in the query (the longest match), or None.
+        Items of provider_id are preferred over items of other providers.
+        """
+        matches = extractor.find_all(search_query, "item", self.name)
+        if provider_id is not None:
+            own = [match for match in matches if match.value[0] == str(provider_id)]
+            matches = own or matches
+        if not matches:
+            return None
+        match = max(matches, key=lambda match: match.end - match.start)
+        item_provider_id, item_id = match.value
+        return self.items[item_provider_id][item_id]
+
+
+# search cache key -> CatalogIndex
+_indexes = {}
+
+
+def for_search(builder, provider_name_to_id: dict = None, provider_id_to_items: dict = None) -> CatalogIndex:
+    """
+    Returns the index fed by the responses of the given search payload builder, seeded with a module's mappings.
+    """
+    key = catalog_cache.key_for(builder)
+    index = _indexes.get(key)
+    if index is None:
+        index = _indexes[key] = CatalogIndex(f"{key[0]} {key[1]}")
+    if provider_name_to_id:
+        index.seed(provider_name_to_id, provider_id_to_items or {})
+    return index
+
+
+def _on_search_response(key, response):
+    index = _indexes.get(key)
+    if index is not None:
+        index.ingest(response)
+
+
+catalog_cache.add_listener(_on_search_response)
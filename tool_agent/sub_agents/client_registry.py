@@ -0,0 +1,76 @@
+import time
+import threading
+
+# Process-wide registry of expensive SDK clients.
+# Some clients resolve a remote resource when they are constructed (the Vertex AI embedding model,
+# the Vector Search index and index endpoint), which used to happen on every tool call. Each client
+# is registered with a factory and built on first use, once per process: concurrent first callers
+# wait for the one building it, later calls are a dict read. A factory that fails is retried by the
+# next caller, so a transient error is not kept. warm_up builds clients ahead of the first query,
+# e.g. at server start.
+
+
+class _Entry:
+    __slots__ = ("factory", "client", "lock", "built_in")
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.client = None
+        self.lock = threading.Lock()
+        self.built_in = None  # seconds the factory took
+
+
+class ClientRegistry:
+    """
+    Lazily built clients by name. Each client has its own lock, so a slow one does not hold up the others.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def register(self, name: str, factory):
+        """Registers factory() as the builder of client name (not called until the client is needed)."""
+        self._entries[name] = _Entry(factory)
+
+    def get(self, name: str):
+        """Returns client name, building it on first use. Raises what the factory raises."""
+        entry = self._entries[name]
+        client = entry.client
+        if client is not None:
+            return client
+        with entry.lock:
+            if entry.client is None:
+                started = time.perf_counter()
+                entry.client = entry.factory()
+                entry.built_in = time.perf_counter() - started
+            return entry.client
+
+    def warm_up(self, names: list = None) -> dict:
+        """
+        Builds the given clients (all of them by default).
+
+        Returns:
+            {name: seconds it took to build, or the error message}
+        """
+        results = {}
+        for name in names or list(self._entries):
+            try:
+                self.get(name)
+                results[name] = round(self._entries[name].built_in or 0.0, 3)
+            except Exception as e:
+                results[name] = f"Error: {e}"
+        return results
+
+    def reset(self, name: str = None):
+        """Drops a built client (all of them by default), to be rebuilt on next use."""
+        for entry_name, entry in self._entries.items():
+            if name is None or entry_name == name:
+                with entry.lock:
+                    entry.client = None
+                    entry.built_in = None
+
+    def stats(self) -> dict:
+        return {name: {"built": entry.client is not None, "built_in_s": entry.built_in} for name, entry in self._entries.items()}
+
+
+clients = ClientRegistry()
@@ -1,14 +1,17 @@
-import requests
-from google.adk.agents import Agent
+from google.adk.tools import ToolContext
 from dotenv import load_dotenv
 import os
-import uuid
-from datetime import datetime, timezone
-import json # Added for loading string templates as JSON
+from . import http_client
+from . import beckn_payloads
+from . import catalog_cache
+from . import catalog_index
+from . import status_watcher
+from . import state_store
+from . import projection
 
 load_dotenv()
 
-# Mappings for Demand Flexibility Program
+# Mappings for Demand Flexibility Program (seed entries of CATALOG, which is extended from search responses)
 provider_name_to_id = {
     "Pacific Gas and Electric Company (PG&E)": "323"
 }
@@ -21,9 +24,6 @@ provider_id_to_items = {
     ]
 }
 
-# Global list to store DFP order IDs
-dfp_order_ids = []
-
 API_SEARCH_ENDPOINT = os.getenv("base_url") + "search"
 API_CONFIRM_ENDPOINT = os.getenv("base_url") + "confirm"
 API_STATUS_ENDPOINT = os.getenv("base_url") + "status"
@@ -145,7 +145,79 @@ STATUS_PAYLOAD_TEMPLATE = """
 }
 """
 
-def search_demand_flexibility_program_data(search_query: str) -> str:
+# Templates parsed once at import; build() fills only the per-request fields
+SEARCH_PAYLOAD = beckn_payloads.PayloadBuilder(SEARCH_PAYLOAD_TEMPLATE)
+CONFIRM_PAYLOAD = beckn_payloads.PayloadBuilder(CONFIRM_PAYLOAD_TEMPLATE, **beckn_payloads.ORDER_FIELDS)
+STATUS_PAYLOAD = beckn_payloads.PayloadBuilder(STATUS_PAYLOAD_TEMPLATE, **beckn_payloads.STATUS_FIELDS)
+
+# Providers and items, seeded with the mappings above and extended from every search response
+CATALOG = catalog_index.for_search(SEARCH_PAYLOAD, provider_name_to_id, provider_id_to_items)
+
+# Confirmed orders are polled in the background; the status tools read its table
+status_watcher.register("demand_flexibility_program", STATUS_PAYLOAD, API_STATUS_ENDPOINT)
+
+
+def _extract_provider_and_item_dfp(search_query: str):
+    found_provider_name = CATALOG.find_provider(search_query)
+    provider_id = CATALOG.provider_id(found_provider_name)
+    # Items of the named provider are preferred over items of other providers
+    found_item_name = CATALOG.find_item(search_query, provider_id)
+
+    if not found_provider_name and not found_item_name:
+        return None, None, "Error: Could not identify a provider or item. Please specify provider (e.g., 'Pacific Gas and Electric Company (PG&E)') and item (e.g., 'Home Battery Discharge Program')."
+
+    if found_provider_name and not found_item_name:
+        available_items_names = CATALOG.item_names(provider_id)
+        if not available_items_names:
+            return None, None, f"Error: No items found for provider '{found_provider_name}'."
+        return None, None, f"Error: Please specify item for '{found_provider_name}'. Available: {', '.join(available_items_names)}."
+
+    if not found_provider_name and found_item_name:
+        possible_providers = CATALOG.providers_for_item(found_item_name)
+        if possible_providers:
+            return None, None, f"Error: Please specify provider for '{found_item_name}'. Available from: {', '.join(possible_providers)}."
+        else:
+            return None, None, f"Error: Item '{found_item_name}' found, but no associated provider."
+
+    item_id = CATALOG.item_id(provider_id, found_item_name)
+
+    if not item_id:
+        actual_items_names = CATALOG.item_names(provider_id)
+        return None, None, (f"Error: Item '{found_item_name}' is not valid for provider '{found_provider_name}'. "
+                           f"Available items: {', '.join(actual_items_names) if actual_items_names else 'No items'}.")
+
+    return provider_id, item_id, None
+
+
+def _build_confirm_payload(search_query: str):
+    provider_id, item_id, error_msg = _extract_provider_and_item_dfp(search_query)
+    if error_msg:
+        return None, error_msg
+    return CONFIRM_PAYLOAD.build(provider_id=provider_id, item_id=item_id)
+
+
+def _latest_order_id(tool_context):
+    order_id = state_store.latest(tool_context, "demand_flexibility_program_order")
+    if order_id is None:
+        return None, "Error: No DFP order ID available for status. Please confirm a DFP order first."
+    return order_id, None
+
+
+def _record_confirm(confirm_response_data, tool_context):
+    """Extracts and stores the order ID of a successful confirm response."""
+    if not isinstance(confirm_response_data, dict):
+        return
+    try:
+        order_id_val = confirm_response_data['responses'][0]['message']['order']['id']
+        state_store.record(tool_context, "demand_flexibility_program_order", order_id_val)
+        status_watcher.watch("demand_flexibility_program", order_id_val)
+        # The order may have used up stock or a quota the cached catalog still shows
+        catalog_cache.invalidate(SEARCH_PAYLOAD.domain)
+    except (KeyError, IndexError, TypeError) as e:
+        print(f"Warning: Could not extract order_id from DFP confirm response: {e} - Response: {confirm_response_data}")
+
+
+async def search_demand_flexibility_program_data(search_query: str) -> str:
     """
     Searches for demand flexibility program data based on a given search query.
     This function will be used as a tool by the agent.
@@ -153,53 +225,10 @@ def search_demand_flexibility_program_data(search_query: str) -> str:
      Returns:
         A string representation of the JSON response from the API, containing all demand flexibility program data.
     """
-    try:
-        bap_id = os.getenv("bap_id")
-        bap_uri = os.getenv("bap_uri")
-        bpp_id = os.getenv("bpp_id")
-        bpp_uri = os.getenv("bpp_uri")
-
-        if not all([bap_id, bap_uri, bpp_id, bpp_uri]):
-            return "Error: BAP_ID, BAP_URI, BPP_ID, or BPP_URI environment variables are not set."
-
-        transaction_id = str(uuid.uuid4())
-        message_id = str(uuid.uuid4())
-
-        # ISO 8601 format timestamp with UTC timezone
-        timestamp = datetime.now(timezone.utc).isoformat()
-
-        current_payload = SEARCH_PAYLOAD_TEMPLATE.replace("{{bap_id}}", bap_id) \
-                                     .replace("{{bap_uri}}", bap_uri) \
-                                     .replace("{{bpp_id}}", bpp_id) \
-                                     .replace("{{bpp_uri}}", bpp_uri) \
-                                     .replace("{{transaction_id}}", transaction_id) \
-                                     .replace("{{message_id}}", message_id) \
-                                     .replace("{{timestamp}}", timestamp)
-
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(API_SEARCH_ENDPOINT, data=current_payload, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as http_err:
-        # Try to get more specific error information from the response body if available
-        error_details = ""
-        try:
-            error_details = response.text
-        except Exception:
-            pass # Ignore if response.text is not available or causes an error
-        return f"HTTP error occurred: {http_err} - {error_details}"
-    except requests.exceptions.RequestException as e:
-        return f"Error calling API: {e}"
-    except ValueError as json_err:
-        error_details = ""
-        try:
-            error_details = response.text
-        except Exception:
-            pass
-        return f"Error decoding JSON response: {json_err} - Response was: {error_details}"
-
-
-def confirm_demand_flexibility_program_data(search_query: str) -> str:
+    return projection.project(await catalog_cache.asearch(SEARCH_PAYLOAD, API_SEARCH_ENDPOINT), "search", SEARCH_PAYLOAD.domain)
+
+
+async def confirm_demand_flexibility_program_data(search_query: str, tool_context: ToolContext = None) -> str:
     """
     Confirms demand flexibility program data based on a given search query,
     parsing provider and item names and using mappings to find IDs.
@@ -208,119 +237,15 @@ def confirm_demand_flexibility_program_data(search_query: str) -> str:
     Returns:
         A string representation of the JSON response from the API, or an error/prompt message.
     """
-    try:
-        found_provider_name = None
-        found_item_name = None
-        search_query_lower = search_query.lower()
-
-        for p_name in provider_name_to_id.keys():
-            if p_name.lower() in search_query_lower:
-                found_provider_name = p_name
-                break
-        
-        for p_id_map, item_list in provider_id_to_items.items():
-            for item_dict in item_list:
-                if item_dict["name"].lower() in search_query_lower:
-                    found_item_name = item_dict["name"]
-                    if found_provider_name and provider_name_to_id.get(found_provider_name) == p_id_map:
-                        break
-                    elif not found_provider_name:
-                        break
-            if found_item_name and (not found_provider_name or provider_name_to_id.get(found_provider_name) == p_id_map):
-                 break
-
-        if not found_provider_name and not found_item_name:
-            return "Error: Could not identify a provider or item. Please specify provider (e.g., 'Pacific Gas and Electric Company (PG&E)') and item (e.g., 'Home Battery Discharge Program')."
-
-        if found_provider_name and not found_item_name:
-            provider_id_for_items = provider_name_to_id[found_provider_name]
-            available_items_list = provider_id_to_items.get(provider_id_for_items, [])
-            available_items_names = [item["name"] for item in available_items_list]
-            if not available_items_names:
-                 return f"Error: No items found for provider '{found_provider_name}'."
-            return f"Error: Please specify item for '{found_provider_name}'. Available: {', '.join(available_items_names)}."
-
-        if not found_provider_name and found_item_name:
-            possible_providers = []
-            for p_name_map, p_id_val_map in provider_name_to_id.items():
-                items_for_this_provider = provider_id_to_items.get(p_id_val_map, [])
-                if any(item_dict["name"] == found_item_name for item_dict in items_for_this_provider):
-                    possible_providers.append(p_name_map)
-            if possible_providers:
-                return f"Error: Please specify provider for '{found_item_name}'. Available from: {', '.join(list(set(possible_providers)))}."
-            else: 
-                return f"Error: Item '{found_item_name}' found, but no associated provider."
-
-        provider_id = provider_name_to_id.get(found_provider_name)
-        item_id = None
-        if provider_id and provider_id in provider_id_to_items:
-            for item_detail in provider_id_to_items[provider_id]:
-                if item_detail["name"] == found_item_name:
-                    item_id = item_detail["id"]
-                    break
-        
-        if not item_id:
-            actual_items_list = provider_id_to_items.get(provider_id, [])
-            actual_items_names = [item["name"] for item in actual_items_list]
-            return (f"Error: Item '{found_item_name}' is not valid for provider '{found_provider_name}'. "
-                    f"Available items: {', '.join(actual_items_names) if actual_items_names else 'No items'}.")
-
-        bap_id = os.getenv("bap_id")
-        bap_uri = os.getenv("bap_uri")
-        bpp_id = os.getenv("bpp_id")
-        bpp_uri = os.getenv("bpp_uri")
-
-        if not all([bap_id, bap_uri, bpp_id, bpp_uri]):
-            return "Error: BAP_ID, BAP_URI, BPP_ID, or BPP_URI environment variables are not set."
-
-        transaction_id = str(uuid.uuid4())
-        message_id = str(uuid.uuid4())
-        timestamp = datetime.now(timezone.utc).isoformat()
-
-        payload_dict = json.loads(CONFIRM_PAYLOAD_TEMPLATE)
-        payload_dict["context"]["bap_id"] = bap_id
-        payload_dict["context"]["bap_uri"] = bap_uri
-        payload_dict["context"]["bpp_id"] = bpp_id
-        payload_dict["context"]["bpp_uri"] = bpp_uri
-        payload_dict["context"]["transaction_id"] = transaction_id
-        payload_dict["context"]["message_id"] = message_id
-        payload_dict["context"]["timestamp"] = timestamp
-        payload_dict["message"]["order"]["provider"]["id"] = provider_id
-        payload_dict["message"]["order"]["items"][0]["id"] = item_id
-        
-        current_payload = json.dumps(payload_dict)
-
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(API_CONFIRM_ENDPOINT, data=current_payload, headers=headers)
-        response.raise_for_status()
-        confirm_response_data = response.json()
-        try:
-            order_id_val = confirm_response_data['responses'][0]['message']['order']['id']
-            dfp_order_ids.append(order_id_val)
-        except (KeyError, IndexError, TypeError) as e:
-            print(f"Warning: Could not extract order_id from DFP confirm response: {e} - Response: {confirm_response_data}")
-        
-        return confirm_response_data
-    except requests.exceptions.HTTPError as http_err:
-        # Try to get more specific error information from the response body if available
-        error_details = ""
-        try:
-            error_details = response.text
-        except Exception:
-            pass # Ignore if response.text is not available or causes an error
-        return f"HTTP error occurred: {http_err} - {error_details}"
-    except requests.exceptions.RequestException as e:
-        return f"Error calling API: {e}"
-    except ValueError as json_err:
-        error_details = ""
-        try:
-            error_details = response.text
-        except Exception:
-            pass
-        return f"Error decoding JSON response: {json_err} - Response was: {error_details}"
-
-
-def status_demand_flexibility_program_data(search_query: str) -> str:
+    current_payload, error_msg = _build_confirm_payload(search_query)
+    if error_msg:
+        return error_msg
+    confirm_response_data = await http_client.arequest_json("POST", API_CONFIRM_ENDPOINT, action="confirm", data=current_payload, headers=http_client.JSON_HEADERS)
+    _record_confirm(confirm_response_data, tool_context)
+    return projection.project(confirm_response_data, "confirm", CONFIRM_PAYLOAD.domain)
+
+
+async def status_demand_flexibility_program_data(search_query: str, tool_context: ToolContext = None) -> str:
     """
     Searches for status data based on a given search query.
     This function will be used as a tool by the agent.
@@ -328,57 +253,8 @@ def status_demand_flexibility_program_data(search_query: str) -> str:
      Returns:
         A string representation of the JSON response from the API, containing all demand flexibility program data.
     """
-    try:
-        bap_id = os.getenv("bap_id")
-        bap_uri = os.getenv("bap_uri")
-        bpp_id = os.getenv("bpp_id")
-        bpp_uri = os.getenv("bpp_uri")
-
-        if not all([bap_id, bap_uri, bpp_id, bpp_uri]):
-            return "Error: BAP_ID, BAP_URI, BPP_ID, or BPP_URI environment variables are not set."
-
-        if not dfp_order_ids:
-            return "Error: No DFP order ID available for status. Please confirm a DFP order first."
-        
-        latest_order_id = dfp_order_ids[-1]
-
-        transaction_id = str(uuid.uuid4())
-        message_id = str(uuid.uuid4())
-        timestamp = datetime.now(timezone.utc).isoformat()
-
-        payload_dict = json.loads(STATUS_PAYLOAD_TEMPLATE)
-        payload_dict["context"]["bap_id"] = bap_id
-        payload_dict["context"]["bap_uri"] = bap_uri
-        payload_dict["context"]["bpp_id"] = bpp_id
-        payload_dict["context"]["bpp_uri"] = bpp_uri
-        payload_dict["context"]["transaction_id"] = transaction_id
-        payload_dict["context"]["message_id"] = message_id
-        payload_dict["context"]["timestamp"] = timestamp
-        payload_dict["message"]["order_id"] = latest_order_id
-
-        current_payload = json.dumps(payload_dict)
-
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(API_STATUS_ENDPOINT, data=current_payload, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as http_err:
-        # Try to get more specific error information from the response body if available
-        error_details = ""
-        try:
-            error_details = response.text
-        except Exception:
-            pass # Ignore if response.text is not available or causes an error
-        return f"HTTP error occurred: {http_err} - {error_details}"
-    except requests.exceptions.RequestException as e:
-        return f"Error calling API: {e}"
-    except ValueError as json_err:
-        error_details = ""
-        try:
-            error_details = response.text
-        except Exception:
-            pass
-        return f"Error decoding JSON response: {json_err} - Response was: {error_details}"
-    
-
-
+    order_id, error_msg = _latest_order_id(tool_context)
+    if error_msg:
+        return error_msg
+    # Answered from the status watcher's table; only an order never polled yet goes upstream
+    return projection.project(await status_watcher.watcher.astatus("demand_flexibility_program", order_id), "status", STATUS_PAYLOAD.domain)
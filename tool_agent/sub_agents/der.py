@@ -1,11 +1,13 @@
-import requests
-from google.adk.agents import Agent
+from google.adk.tools import ToolContext
 from dotenv import load_dotenv
-import os
-import uuid
-from datetime import datetime, timezone
-from .er_house_hold import er_household_ids_list
 import json
+from . import http_client
+from . import beckn_payloads
+from . import state_store
+from . import transformer_load
+from . import household_graph
+from . import der_registry
+from .entity_extractor import extractor
 
 load_dotenv()
 
@@ -28,9 +30,24 @@ APPLIANCE_MAPPING = {
     "Water pump": 11,
 }
 
-# Global list to store details of created DERs
-# Each element will be a dict: {"id": der_id, "appliance_id": appliance_id, "er_id": er_id}
-created_ders_details = []
+# Nominal power of each appliance in kW, counted in the load of the DER's transformer
+APPLIANCE_NOMINAL_KW = {
+    "Air Conditioner(1.5 Ton)": 1.5,
+    "Ceiling Fan": 0.075,
+    "Electric Geyser": 2.0,
+    "Laptop Charger": 0.065,
+    "LED Bulb(10 W)": 0.01,
+    "Microwave Oven": 1.2,
+    "Refrigerator": 0.2,
+    "Room Heater": 2.0,
+    "Solar Panel(production)": 3.0,  # export capacity of a rooftop array
+    "Television(LED)": 0.1,
+    "Washing machine": 0.5,
+    "Water pump": 0.75,
+}
+transformer_load.index.set_appliance_kw({APPLIANCE_MAPPING[name]: kw for name, kw in APPLIANCE_NOMINAL_KW.items()})
+
+# Created DERs are kept in the DER registry (der_registry.py), indexed by user and appliance id
 
 CREATE_DER_TEMPLATE = '''
 {
@@ -38,105 +55,66 @@ CREATE_DER_TEMPLATE = '''
     "appliance":5
 }
 '''
+CREATE_DER_PAYLOAD = beckn_payloads.PayloadBuilder(CREATE_DER_TEMPLATE, energy_resource=("energy_resource",), appliance=("appliance",))
 
-def create_der(search_query: str) -> str:
-    """
-    Creates a new DER (Distributed Energy Resource) using the latest energy resource ID
-    and an appliance ID mapped from the search query.
-    The ID of the created DER is stored globally.
+for appliance_name, mapped_appliance_id in APPLIANCE_MAPPING.items():
+    extractor.add(appliance_name, "appliance", (appliance_name, mapped_appliance_id), scope="der")
 
-    Args:
-        search_query (str): The search query containing the appliance name to create the DER for.
-                            Example: "Create a DER for Ceiling Fan"
+def _find_appliance(search_query: str):
+    # Longest appliance name mentioned in the query
+    match = extractor.best(search_query, "appliance", "der")
+    if match is None:
+        return None, None
+    return match.value
 
-    Returns:
-        str: A string representation of the JSON response from the API, containing the created DER,
-        or an error message.
-    """
-    global er_household_ids_list
-    global created_ders_details
-
-    if not er_household_ids_list:
-        return "Error: No energy resource IDs available. Cannot create a DER without an energy resource."
-
-    latest_er_id = er_household_ids_list[-1]
-    
-    selected_appliance_name = None
-    appliance_id = None
-    
-    for key_in_map in APPLIANCE_MAPPING.keys():
-        if key_in_map.lower() in search_query.lower():
-            selected_appliance_name = key_in_map
-            appliance_id = APPLIANCE_MAPPING[selected_appliance_name]
-            break
-            
+
+def _build_create_der_payload(search_query: str, tool_context):
+    latest_er_id = state_store.latest(tool_context, "er_household")
+    if latest_er_id is None:
+        return None, None, None, "Error: No energy resource IDs available. Cannot create a DER without an energy resource."
+
+    _, appliance_id = _find_appliance(search_query)
     if appliance_id is None:
-        return f"Error: Could not find a recognized appliance name in the search query: '{search_query}'. Available appliances: {list(APPLIANCE_MAPPING.keys())}"
+        return None, None, None, f"Error: Could not find a recognized appliance name in the search query: '{search_query}'. Available appliances: {list(APPLIANCE_MAPPING.keys())}"
 
-    try:
-        payload_dict = json.loads(CREATE_DER_TEMPLATE)
-        payload_dict["energy_resource"] = latest_er_id
-        payload_dict["appliance"] = appliance_id
-        current_payload = json.dumps(payload_dict)
-
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(API_CREATE_DER_ENDPOINT, data=current_payload, headers=headers)
-        response.raise_for_status()
-
-        response_data = response.json()
-
-        # Extract and store the DER ID and its details
-        # Assuming response structure like: {"data": {"id": "der_id", ...}} or {"id": "der_id"}
-        der_id = None
-        if "data" in response_data and isinstance(response_data["data"], dict) and "id" in response_data["data"]:
-            der_id = response_data["data"]["id"]
-        elif "id" in response_data:
-            der_id = response_data["id"]
-        
-        if der_id is not None:
-            created_ders_details.append({
-                "id": der_id,
-                "appliance_id": appliance_id,
-                "er_id": latest_er_id
-            })
-            # print(f"Current DERs: {created_ders_details}") # For debugging
-        else:
-            return f"Successfully called API, but could not extract DER ID from response: {response_data}"
-            
-        return json.dumps(response_data)
-
-    except requests.exceptions.HTTPError as http_err:
-        error_details = ""
-        if hasattr(response, 'text'):
-            try:
-                error_details = response.text
-            except Exception:
-                pass # Keep error_details empty if response.text is not accessible
-        return f"HTTP error occurred: {http_err} - Details: {error_details}"
-    except requests.exceptions.RequestException as req_err:
-        return f"Error calling API: {req_err}"
-    except json.JSONDecodeError as json_err:
-        return f"Error decoding JSON: {json_err}"
-    except Exception as e:
-        return f"An unexpected error occurred in create_der: {e}"
+    payload, _ = CREATE_DER_PAYLOAD.build(energy_resource=latest_er_id, appliance=appliance_id)
+    return payload, appliance_id, latest_er_id, None
 
 
-def toggle_der(search_query: str) -> str:
+def _record_der(response_data, appliance_id, er_id, tool_context) -> str:
     """
-    Toggles the state of the latest DER matching the appliance name found in the search query.
-    It sends a POST request to an API endpoint like /der/{der_id}/on or /der/{der_id}/off.
+    Stores the created DER and returns the tool output.
+    """
+    household_graph.graphs.invalidate_energy_resource(er_id)
+    if isinstance(response_data, str):
+        # Error string from the HTTP client
+        return response_data
 
-    Args:
-        search_query (str): The search query to toggle the DER. 
-                            Example: "Turn on the Ceiling Fan" or "Switch Laptop Charger off".
+    # Extract and store the DER ID and its details
+    # Assuming response structure like: {"data": {"id": "der_id", ...}} or {"id": "der_id"}
+    der_id = None
+    if "data" in response_data and isinstance(response_data["data"], dict) and "id" in response_data["data"]:
+        der_id = response_data["data"]["id"]
+    elif "id" in response_data:
+        der_id = response_data["id"]
 
-    Returns:
-        str: A string representation of the JSON response from the API, or an error message.
+    if der_id is None:
+        return f"Successfully called API, but could not extract DER ID from response: {response_data}"
+
+    der_registry.add(tool_context, der_id, er_id, appliance_id)
+    transformer_load.index.add_der(er_id, appliance_id)
+    return json.dumps(response_data)
+
+
+def _build_toggle_request(search_query: str, tool_context):
     """
-    global created_ders_details
+    Resolves the toggle URL and payload for the latest DER matching the appliance in the query.
 
-    if not created_ders_details:
-        return "Error: No DERs have been created yet. Cannot toggle."
+    Returns:
+        A (url, payload, der_record, error_message) tuple.
+    """
+    if not der_registry.has_ders(tool_context):
+        return None, None, None, "Error: No DERs have been created yet. Cannot toggle."
 
     # Parse action (on/off) and appliance name
     switched_on_flag = None
@@ -149,67 +127,91 @@ def toggle_der(search_query: str) -> str:
         switched_on_flag = False
     # General check if specific phrases didn't match
     elif " on" in search_query_lower and not (" off on" in search_query_lower) : # Avoid "off on"
-         switched_on_flag = True
+        switched_on_flag = True
     elif " off" in search_query_lower:
-         switched_on_flag = False
+        switched_on_flag = False
 
     if switched_on_flag is None:
-        return f"Error: Could not determine action (on/off) from search query: '{search_query}'"
-
-    target_appliance_name = None
-    target_appliance_id = None
-    for key_in_map in APPLIANCE_MAPPING.keys():
-        if key_in_map.lower() in search_query_lower:
-            target_appliance_name = key_in_map
-            target_appliance_id = APPLIANCE_MAPPING[target_appliance_name]
-            break
-    
+        return None, None, None, f"Error: Could not determine action (on/off) from search query: '{search_query}'"
+
+    target_appliance_name, target_appliance_id = _find_appliance(search_query)
     if not target_appliance_id:
-        return f"Error: Could not find a recognized appliance name in search query: '{search_query}'. Available: {list(APPLIANCE_MAPPING.keys())}"
+        return None, None, None, f"Error: Could not find a recognized appliance name in search query: '{search_query}'. Available: {list(APPLIANCE_MAPPING.keys())}"
 
     # Find the latest DER ID and associated ER ID for this appliance type
     der_id_to_toggle = None
     er_id_for_toggle = None
-    for der_info in reversed(created_ders_details):
-        if der_info["appliance_id"] == target_appliance_id:
-            der_id_to_toggle = der_info["id"]
-            er_id_for_toggle = der_info["er_id"]
-            break
-            
+    der_record = der_registry.latest(tool_context, target_appliance_id)
+    if der_record is not None:
+        der_id_to_toggle = der_record.der_id
+        er_id_for_toggle = der_record.er_id
+
     if not der_id_to_toggle or not er_id_for_toggle:
-        return f"Error: No DER found for appliance '{target_appliance_name}' with an associated ER ID. Please create one first."
+        return None, None, None, f"Error: No DER found for appliance '{target_appliance_name}' with an associated ER ID. Please create one first."
 
+    # Construct the new API URL: API_TOOGLE_DER_ENDPOINT/{er_id}
+    # Ensure no double slashes if API_TOOGLE_DER_ENDPOINT ends with /
+    base_toggle_url = API_TOOGLE_DER_ENDPOINT.rstrip('/')
+    toggle_api_url = f"{base_toggle_url}/{er_id_for_toggle}"
+
+    payload = {
+        "der_id": str(der_id_to_toggle), # Ensure der_id is a string if API expects it
+        "switched_on": switched_on_flag
+    }
+    return toggle_api_url, payload, der_record, None
+
+
+def _toggle_output(response_data, der_record, payload) -> str:
+    household_graph.graphs.invalidate_energy_resource(der_record.er_id)
+    if not http_client.is_error(response_data):
+        der_registry.registry.set_switched_on(der_record.der_id, payload["switched_on"])
+    # Return JSON if possible, otherwise the text (or error string) from the HTTP client
+    if isinstance(response_data, str):
+        return response_data
+    return json.dumps(response_data)
+
+
+async def create_der(search_query: str, tool_context: ToolContext = None) -> str:
+    """
+    Creates a new DER (Distributed Energy Resource) using the latest energy resource ID
+    and an appliance ID mapped from the search query.
+    The ID of the created DER is stored in the user's state.
+
+    Args:
+        search_query (str): The search query containing the appliance name to create the DER for.
+                            Example: "Create a DER for Ceiling Fan"
+
+    Returns:
+        str: A string representation of the JSON response from the API, containing the created DER,
+        or an error message.
+    """
+    try:
+        current_payload, appliance_id, er_id, error_msg = _build_create_der_payload(search_query, tool_context)
+        if error_msg:
+            return error_msg
+        response_data = await http_client.arequest_json("POST", API_CREATE_DER_ENDPOINT, action="der", data=current_payload, headers=http_client.JSON_HEADERS)
+        return _record_der(response_data, appliance_id, er_id, tool_context)
+    except Exception as e:
+        return f"An unexpected error occurred in create_der: {e}"
+
+
+async def toggle_der(search_query: str, tool_context: ToolContext = None) -> str:
+    """
+    Toggles the state of the latest DER matching the appliance name found in the search query.
+    It sends a POST request to an API endpoint like /der/{der_id}/on or /der/{der_id}/off.
+
+    Args:
+        search_query (str): The search query to toggle the DER. 
+                            Example: "Turn on the Ceiling Fan" or "Switch Laptop Charger off".
+
+    Returns:
+        str: A string representation of the JSON response from the API, or an error message.
+    """
     try:
-        # Construct the new API URL: API_TOOGLE_DER_ENDPOINT/{er_id}
-        # Ensure no double slashes if API_TOOGLE_DER_ENDPOINT ends with /
-        base_toggle_url = API_TOOGLE_DER_ENDPOINT.rstrip('/')
-        toggle_api_url = f"{base_toggle_url}/{er_id_for_toggle}"
-        
-        payload = {
-            "der_id": str(der_id_to_toggle), # Ensure der_id is a string if API expects it
-            "switched_on": switched_on_flag
-        }
-        
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(toggle_api_url, json=payload, headers=headers)
-        response.raise_for_status()
-        
-        # Try to return JSON if possible, otherwise text
-        try:
-            response_data = response.json()
-            return json.dumps(response_data)
-        except json.JSONDecodeError:
-            return response.text if response.text else "Success (No content in response)"
-
-    except requests.exceptions.HTTPError as http_err:
-        error_details = ""
-        if hasattr(response, 'text'):
-            try:
-                error_details = response.text
-            except Exception:
-                pass
-        return f"HTTP error occurred while toggling DER: {http_err} - Details: {error_details}"
-    except requests.exceptions.RequestException as req_err:
-        return f"Error calling toggle API: {req_err}"
+        toggle_api_url, payload, der_record, error_msg = _build_toggle_request(search_query, tool_context)
+        if error_msg:
+            return error_msg
+        response_data = await http_client.arequest_json("POST", toggle_api_url, action="der", text_fallback=True, json=payload, headers=http_client.JSON_HEADERS)
+        return _toggle_output(response_data, der_record, payload)
     except Exception as e:
         return f"An unexpected error occurred in toggle_der: {e}"
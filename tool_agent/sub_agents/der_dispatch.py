@@ -0,0 +1,195 @@
+from dotenv import load_dotenv
+import os
+import time
+import random
+import asyncio
+import sqlite3
+import httpx
+import numpy as np
+from google.adk.tools import ToolContext
+from . import http_client
+from . import durable_store
+from . import state_store
+from . import der_registry
+from . import der
+from . import household_graph
+from .entity_extractor import extractor
+
+load_dotenv()
+
+# Bulk DER dispatch for demand-flexibility events.
+# toggle_der switches one appliance of one user per call. For an event (e.g. PG&E's Home Battery
+# Discharge Program) every matching DER of the fleet is switched at once: the DERs are selected from
+# the DER registry (by energy resource, by appliance, and by default only those of users enrolled in
+# a demand flexibility program, i.e. with a confirmed DFP order), then the toggle-der/{er_id} POSTs
+# are issued over the shared async client of http_client, at most DER_DISPATCH_CONCURRENCY in flight
+# (a semaphore; keep it under ASYNC_HTTP_MAX_CONNECTIONS so the POSTs do not queue for a pooled
+# connection). A POST failing with a connection error, a timeout, 429 or a 5xx is retried up to
+# DER_DISPATCH_RETRIES times with exponential backoff from DER_DISPATCH_BACKOFF seconds (plus
+# jitter, so retries of a burst do not land together); other 4xx answers are final.
+#
+# Dispatching switches other households' appliances, so it is reserved to the utility operators
+# listed in OPERATOR_USER_IDS (ADK user ids, comma-separated; nobody when empty), checked against the
+# user of the tool call, and it only ever targets the households enrolled in a program.
+#
+# The report gives the completion latency of each DER (from the start of the dispatch to its
+# confirmed toggle) and of each POST as percentiles, plus the failures.
+DER_DISPATCH_CONCURRENCY = int(os.getenv("DER_DISPATCH_CONCURRENCY", "64"))
+DER_DISPATCH_RETRIES = int(os.getenv("DER_DISPATCH_RETRIES", "2"))
+DER_DISPATCH_BACKOFF = float(os.getenv("DER_DISPATCH_BACKOFF", "0.2"))
+OPERATOR_USER_IDS = {user_id.strip() for user_id in os.getenv("OPERATOR_USER_IDS", "").split(",") if user_id.strip()}
+
+DFP_ORDER_KIND = "demand_flexibility_program_order"
+
+# Failures listed in the report
+MAX_REPORTED_FAILURES = 20
+
+
+def _percentiles_ms(seconds: np.ndarray) -> dict:
+    if len(seconds) == 0:
+        return {}
+    p50, p90, p99 = np.percentile(seconds, [50, 90, 99]) * 1000
+    return {"p50": round(float(p50), 1), "p90": round(float(p90), 1), "p99": round(float(p99), 1), "max": round(float(seconds.max()) * 1000, 1)}
+
+
+def authorize_operator(tool_context):
+    """Returns None if the user of the tool call is a utility operator, else an error message."""
+    if state_store.scope_of(tool_context) in OPERATOR_USER_IDS:
+        return None
+    return "Error: Only utility operators can dispatch DERs across households."
+
+
+def enrolled_users() -> set:
+    """The users with a demand flexibility program order."""
+    users = set(state_store.store.scopes_with(DFP_ORDER_KIND))
+    if durable_store.store.enabled:
+        try:
+            users.update(user_id for (user_id,) in durable_store.store.rows(
+                "SELECT DISTINCT user_id FROM orders WHERE domain = ?", (DFP_ORDER_KIND[:-len("_order")],)))
+        except sqlite3.Error as e:
+            print(f"Warning: Could not read the enrolled users from {durable_store.store.path}: {e}")
+    return users
+
+
+async def _post_toggle(record: der_registry.DerRecord, switched_on: bool, timeout: httpx.Timeout):
+    """Returns (ok, retryable, error message) of one toggle POST."""
+    url = f"{der.API_TOOGLE_DER_ENDPOINT.rstrip('/')}/{record.er_id}"
+    try:
+        response = await http_client.get_async_client().post(url, json={"der_id": str(record.der_id), "switched_on": switched_on}, headers=http_client.JSON_HEADERS, timeout=timeout)
+    except httpx.HTTPError as e:
+        return False, True, f"Error calling API: {e!r}"
+    if response.is_success:
+        return True, False, None
+    return False, response.status_code == 429 or response.status_code >= 500, f"HTTP {response.status_code}: {response.text[:200]}"
+
+
+async def dispatch_async(records: list, switched_on: bool, concurrency: int = DER_DISPATCH_CONCURRENCY,
+                         retries: int = DER_DISPATCH_RETRIES, backoff: float = DER_DISPATCH_BACKOFF) -> dict:
+    """
+    Switches every given DER on or off.
+
+    Args:
+        records: The der_registry.DerRecords to switch.
+        switched_on: The target state.
+        concurrency: Max toggle POSTs in flight.
+        retries: Extra attempts of a POST failing with a retryable error.
+        backoff: Delay before the first retry, in seconds, doubled for each further one.
+
+    Returns:
+        A report with the number of DERs switched and failed, the retries, the elapsed time, the
+        throughput, and the completion and per-POST latency percentiles in ms.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    connect_timeout, read_timeout = http_client.get_timeout("der")
+    timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+    completion = np.full(len(records), np.nan)
+    request_times = []
+    failures = []
+    counts = {"succeeded": 0, "failed": 0, "retried": 0}
+    started = time.monotonic()
+
+    async def switch(position: int, record: der_registry.DerRecord):
+        error = None
+        for attempt in range(retries + 1):
+            if attempt:
+                counts["retried"] += 1
+                # Backing off outside the semaphore: the slot goes to another DER meanwhile
+                await asyncio.sleep(backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            async with semaphore:
+                sent_at = time.monotonic()
+                ok, retryable, error = await _post_toggle(record, switched_on, timeout)
+                request_times.append(time.monotonic() - sent_at)
+            if ok or not retryable:
+                break
+        if ok:
+            completion[position] = time.monotonic() - started
+            counts["succeeded"] += 1
+            der_registry.registry.set_switched_on(record.der_id, switched_on)
+            household_graph.graphs.invalidate_energy_resource(record.er_id)
+        else:
+            counts["failed"] += 1
+            if len(failures) < MAX_REPORTED_FAILURES:
+                failures.append({"der_id": record.der_id, "er_id": record.er_id, "error": error})
+
+    await asyncio.gather(*(switch(position, record) for position, record in enumerate(records)))
+    elapsed = time.monotonic() - started
+
+    return {
+        "switched_on": switched_on,
+        "ders": len(records),
+        **counts,
+        "elapsed_s": round(elapsed, 3),
+        "ders_per_sec": round(counts["succeeded"] / elapsed, 1) if elapsed > 0 else 0.0,
+        "completion_ms": _percentiles_ms(completion[~np.isnan(completion)]),
+        "request_ms": _percentiles_ms(np.asarray(request_times)),
+        "failures": failures,
+    }
+
+
+def select_ders(appliances: str, er_ids: list, enrolled_only: bool):
+    """
+    Selects the DERs to dispatch from the DER registry.
+
+    Args:
+        appliances: Appliance names, e.g. "Air Conditioner(1.5 Ton), Water pump" (all appliances if empty).
+        er_ids: Energy resource ids (all energy resources if empty).
+        enrolled_only: Only the DERs of users with a demand flexibility program order.
+
+    Returns:
+        (DER records, error message)
+    """
+    appliance_ids = None
+    if appliances and appliances.strip():
+        matches = extractor.find_longest(appliances, "appliance", "der")
+        if not matches:
+            return None, f"Error: Could not find a recognized appliance name in '{appliances}'. Available: {list(der.APPLIANCE_MAPPING.keys())}"
+        appliance_ids = {match.value[1] for match in matches}
+    users = enrolled_users() if enrolled_only else None
+    records = der_registry.registry.select(er_ids=er_ids or None, appliance_ids=appliance_ids, users=users)
+    if not records:
+        return None, "Error: No DERs match the dispatch (check the appliances, energy resources and program enrollment)."
+    return records, None
+
+
+async def dispatch_ders(switched_on: bool, appliances: str = "", er_ids: list[int] = None, tool_context: ToolContext = None) -> dict:
+    """
+    Switches many DERs of the households enrolled in a demand flexibility program on or off at
+    once for an event, e.g. "turn off every Air Conditioner and Water pump". Utility operators only.
+    This function will be used as a tool by the agent.
+
+    Args:
+        switched_on: True to switch the DERs on, False to switch them off.
+        appliances: Appliance names to dispatch, e.g. "Air Conditioner(1.5 Ton), Electric Geyser" (all appliances if empty).
+        er_ids: Energy resource ids to dispatch (all energy resources if empty).
+
+    Returns:
+        A report with the DERs switched and failed, the elapsed time and the latency percentiles, or an error message.
+    """
+    error_msg = authorize_operator(tool_context)
+    if error_msg:
+        return error_msg
+    # The enrolled users are read from SQLite: off the event loop
+    records, error_msg = await asyncio.to_thread(select_ders, appliances, er_ids, True)
+    if error_msg:
+        return error_msg
+    return await dispatch_async(records, switched_on)
@@ -0,0 +1,194 @@
+from dotenv import load_dotenv
+import os
+import sys
+import time
+import sqlite3
+import threading
+from . import durable_store
+from . import state_store
+
+load_dotenv()
+
+# DER registry.
+# Created DERs used to be kept with the rest of a user's state, as dicts in a bounded history, so a
+# user with more DERs than the history limit lost track of their older appliances, and a DER could
+# not be found from its id or its energy resource. Every DER is now one DerRecord (__slots__, no
+# per-record dict) reachable from three indexes, each a plain dict lookup:
+#   - user -> appliance id -> latest DER of that appliance (what toggle_der resolves)
+#   - energy resource id -> DERs behind it, chained through the records themselves (newest first)
+#     rather than a list per energy resource
+#   - DER id -> DER
+# Records are shared between the indexes and user ids are interned, so a DER costs about 240 bytes
+# on top of its ids: 300k DERs take about 70 MB.
+# The registry is rebuilt on startup from the durable store's ders table.
+#
+# Each record also carries the DER's switch-off fatigue, for the shed optimizer: every switch-off
+# adds 1, decaying with a half-life of DER_FATIGUE_HALF_LIFE hours (kept in memory only).
+DER_FATIGUE_HALF_LIFE = float(os.getenv("DER_FATIGUE_HALF_LIFE", "24"))
+
+
+class DerRecord:
+    """One created DER."""
+    __slots__ = ("der_id", "user", "er_id", "appliance_id", "switched_on", "next_in_er", "fatigue", "fatigue_at")
+
+    def __init__(self, der_id, user: str, er_id, appliance_id):
+        self.der_id = der_id
+        self.user = user
+        self.er_id = er_id
+        self.appliance_id = appliance_id
+        self.switched_on = None  # last state set through toggle_der, None until then
+        self.next_in_er = None   # previous DER of the same energy resource
+        self.fatigue = 0.0       # switch-off fatigue as of fatigue_at (epoch seconds)
+        self.fatigue_at = 0.0
+
+    def fatigue_now(self, now: float = None) -> float:
+        if not self.fatigue:
+            return 0.0
+        hours = ((now if now is not None else time.time()) - self.fatigue_at) / 3600
+        return self.fatigue * 0.5 ** (hours / DER_FATIGUE_HALF_LIFE)
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.der_id,
+            "appliance_id": self.appliance_id,
+            "er_id": self.er_id,
+            "switched_on": self.switched_on,
+            "fatigue": round(self.fatigue_now(), 3),
+        }
+
+
+class DerRegistry:
+    """
+    DerRecords indexed by (user, appliance id), energy resource id and DER id.
+    Writes are serialized; lookups are single dict reads and take no lock.
+    """
+
+    def __init__(self):
+        self._by_id = {}    # DER id -> DerRecord
+        self._by_user = {}  # user -> {appliance id -> latest DerRecord}
+        self._by_er = {}    # energy resource id -> its latest DerRecord, the others chained by next_in_er
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def _add(self, record: DerRecord):
+        # Called with the lock held
+        previous = self._by_id.get(record.der_id)
+        if previous is not None:
+            # Same DER recorded again: replaced everywhere
+            self._unlink_er(previous)
+        self._by_id[record.der_id] = record
+        self._by_user.setdefault(record.user, {})[record.appliance_id] = record
+        record.next_in_er = self._by_er.get(record.er_id)
+        self._by_er[record.er_id] = record
+
+    def _unlink_er(self, record: DerRecord):
+        head = self._by_er.get(record.er_id)
+        if head is record:
+            if record.next_in_er is None:
+                del self._by_er[record.er_id]
+            else:
+                self._by_er[record.er_id] = record.next_in_er
+            return
+        while head is not None and head.next_in_er is not record:
+            head = head.next_in_er
+        if head is not None:
+            head.next_in_er = record.next_in_er
+
+    def add(self, user: str, der_id, er_id, appliance_id) -> DerRecord:
+        record = DerRecord(der_id, sys.intern(user), er_id, appliance_id)
+        with self._lock:
+            self._add(record)
+        return record
+
+    def get(self, der_id) -> DerRecord | None:
+        return self._by_id.get(der_id)
+
+    def latest(self, user: str, appliance_id) -> DerRecord | None:
+        """The user's latest DER of an appliance."""
+        appliances = self._by_user.get(user)
+        return appliances.get(appliance_id) if appliances else None
+
+    def for_user(self, user: str) -> list:
+        """The user's latest DER of each appliance."""
+        return list(self._by_user.get(user, {}).values())
+
+    def for_energy_resource(self, er_id) -> list:
+        """The DERs of an energy resource, newest first."""
+        records = []
+        record = self._by_er.get(er_id)
+        while record is not None:
+            records.append(record)
+            record = record.next_in_er
+        return records
+
+    def select(self, er_ids=None, appliance_ids=None, users=None) -> list:
+        """
+        DERs matching every filter given: behind one of er_ids, of one of appliance_ids, owned by
+        one of users. With er_ids the chains of those energy resources are walked, otherwise every DER.
+        """
+        if er_ids is not None:
+            candidates = [record for er_id in er_ids for record in self.for_energy_resource(er_id)]
+        else:
+            candidates = list(self._by_id.values())
+        if appliance_ids is not None:
+            appliance_ids = set(appliance_ids)
+            candidates = [record for record in candidates if record.appliance_id in appliance_ids]
+        if users is not None:
+            users = set(users)
+            candidates = [record for record in candidates if record.user in users]
+        return candidates
+
+    def has_user(self, user: str) -> bool:
+        return user in self._by_user
+
+    def set_switched_on(self, der_id, switched_on: bool) -> DerRecord | None:
+        record = self._by_id.get(der_id)
+        if record is not None:
+            if switched_on is False and record.switched_on is not False:
+                now = time.time()
+                record.fatigue = record.fatigue_now(now) + 1.0
+                record.fatigue_at = now
+            record.switched_on = switched_on
+        return record
+
+    def restore(self, rows):
+        """Adds (der_id, user_id, er_id, appliance_id) rows, oldest first."""
+        with self._lock:
+            for der_id, user_id, er_id, appliance_id in rows:
+                self._add(DerRecord(der_id, sys.intern(str(user_id)), er_id, appliance_id))
+
+    def stats(self) -> dict:
+        return {"ders": len(self._by_id), "users": len(self._by_user), "energy_resources": len(self._by_er)}
+
+
+registry = DerRegistry()
+
+
+def _restore():
+    if not durable_store.store.enabled:
+        return
+    try:
+        registry.restore(durable_store.store.rows("SELECT der_id, user_id, er_id, appliance_id FROM ders ORDER BY created_at"))
+    except sqlite3.Error as e:
+        print(f"Warning: Could not restore the DER registry from {durable_store.store.path}: {e}")
+
+
+_restore()
+
+
+def add(tool_context, der_id, er_id, appliance_id) -> DerRecord:
+    """Registers a created DER for the user of the tool call and queues its write to the durable store."""
+    scope = state_store.scope_of(tool_context)
+    record = registry.add(scope, der_id, er_id, appliance_id)
+    durable_store.save(scope, "der", {"id": der_id, "er_id": er_id, "appliance_id": appliance_id})
+    return record
+
+
+def latest(tool_context, appliance_id) -> DerRecord | None:
+    return registry.latest(state_store.scope_of(tool_context), appliance_id)
+
+
+def has_ders(tool_context) -> bool:
+    return registry.has_user(state_store.scope_of(tool_context))
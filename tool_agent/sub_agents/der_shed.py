@@ -0,0 +1,320 @@
+from dotenv import load_dotenv
+import os
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+from google.adk.tools import ToolContext
+from .tooling import async_variant
+from . import durable_store
+from . import state_store
+from . import der
+from . import der_dispatch
+from .entity_extractor import extractor
+
+load_dotenv()
+
+# Shed optimizer for demand flexibility events.
+# When the utility asks for X kW of reduction, the DERs to switch off are chosen instead of taken
+# from the operator's wording: every candidate DER (currently on, or in an unknown state) has
+#   - the nominal kW of its appliance (APPLIANCE_NOMINAL_KW in der.py), the load it sheds,
+#   - a comfort priority from 1 (switch off first) to 5 (switch off last): the appliance default
+#     below, SHED_PRIORITY_<APPLIANCE_ID> to change it fleet-wide, or the household's own choice
+#     (set_shed_priority; 0 means never switch it off),
+#   - its switch-off fatigue (see der_registry.py), so the same households are not shed every event.
+# Its cost is priority * (1 + SHED_FATIGUE_WEIGHT * fatigue), and the plan is a min-cost cover of the
+# target (a knapsack): DERs are taken in order of cost per kW until the target is met, the last one is
+# replaced by the cheapest single DER that covers the remaining kW if that is cheaper, and DERs made
+# unnecessary by the replacement are dropped, most expensive first. A plan costs at most one DER more
+# than the optimal selection. Everything but building the arrays is vectorized, so a plan over 100k
+# DERs takes about 50 ms.
+#
+# Plans are kept (the last SHED_PLANS_KEPT) until dispatched by dispatch_der_shed, which switches the
+# planned DERs off through the bulk dispatch engine.
+SHED_FATIGUE_WEIGHT = float(os.getenv("SHED_FATIGUE_WEIGHT", "0.5"))
+SHED_PLANS_KEPT = int(os.getenv("SHED_PLANS_KEPT", "16"))
+
+NEVER_SHED = 0
+
+# Comfort priority of each appliance, 1 (switch off first) to 5 (switch off last)
+APPLIANCE_SHED_PRIORITY = {
+    "Air Conditioner(1.5 Ton)": 3,
+    "Ceiling Fan": 3,
+    "Electric Geyser": 1,
+    "Laptop Charger": 2,
+    "LED Bulb(10 W)": 4,
+    "Microwave Oven": 3,
+    "Refrigerator": 5,
+    "Room Heater": 3,
+    "Solar Panel(production)": NEVER_SHED,  # switching production off adds load
+    "Television(LED)": 2,
+    "Washing machine": 1,
+    "Water pump": 1,
+}
+
+
+def get_default_priority(appliance_name: str) -> int:
+    appliance_id = der.APPLIANCE_MAPPING[appliance_name]
+    env_value = os.getenv(f"SHED_PRIORITY_{appliance_id}")
+    if env_value:
+        try:
+            return int(env_value)
+        except ValueError:
+            print(f"Warning: Ignoring invalid SHED_PRIORITY_{appliance_id} value: {env_value}")
+    return APPLIANCE_SHED_PRIORITY.get(appliance_name, 3)
+
+
+# Per-appliance-id lookup tables, indexed by appliance id
+_APPLIANCE_COUNT = max(der.APPLIANCE_MAPPING.values()) + 1
+APPLIANCE_KW = np.zeros(_APPLIANCE_COUNT)
+DEFAULT_PRIORITY = np.zeros(_APPLIANCE_COUNT)
+APPLIANCE_NAMES = {}
+for _name, _appliance_id in der.APPLIANCE_MAPPING.items():
+    APPLIANCE_KW[_appliance_id] = der.APPLIANCE_NOMINAL_KW.get(_name, 0.0)
+    DEFAULT_PRIORITY[_appliance_id] = get_default_priority(_name)
+    APPLIANCE_NAMES[_appliance_id] = _name
+
+
+class ShedPriorities:
+    """The households' own comfort priorities: (user, appliance id) -> priority."""
+
+    def __init__(self):
+        self._priorities = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._priorities)
+
+    def set(self, user: str, appliance_id, priority: int, persist: bool = True):
+        with self._lock:
+            self._priorities[(user, appliance_id)] = priority
+        if persist:
+            durable_store.store.execute(
+                "INSERT OR REPLACE INTO shed_priorities (user_id, appliance_id, priority, updated_at) VALUES (?, ?, ?, ?)",
+                (user, appliance_id, priority, time.time()),
+            )
+
+    def get(self, user: str, appliance_id):
+        return self._priorities.get((user, appliance_id))
+
+
+priorities = ShedPriorities()
+
+
+def _restore():
+    if not durable_store.store.enabled:
+        return
+    try:
+        for user_id, appliance_id, priority in durable_store.store.rows("SELECT user_id, appliance_id, priority FROM shed_priorities"):
+            priorities.set(user_id, appliance_id, priority, persist=False)
+    except sqlite3.Error as e:
+        print(f"Warning: Could not restore the shed priorities from {durable_store.store.path}: {e}")
+
+
+_restore()
+
+
+def plan(records: list, target_kw: float, now: float = None) -> dict:
+    """
+    Chooses the DERs to switch off to shed at least target_kw at the lowest comfort cost.
+
+    Args:
+        records: The candidate der_registry.DerRecords.
+        target_kw: The load reduction to reach.
+
+    Returns:
+        {"records": the DERs to switch off, "planned_kw", "cost", "shortfall_kw"}.
+    """
+    now = now if now is not None else time.time()
+    records = [record for record in records if record.switched_on is not False]
+    count = len(records)
+    appliance_ids = np.fromiter((record.appliance_id for record in records), dtype=np.int64, count=count)
+    appliance_ids[(appliance_ids < 0) | (appliance_ids >= _APPLIANCE_COUNT)] = 0
+    kw = APPLIANCE_KW[appliance_ids]
+    priority = DEFAULT_PRIORITY[appliance_ids]
+    if len(priorities):
+        for position, record in enumerate(records):
+            own = priorities.get(record.user, record.appliance_id)
+            if own is not None:
+                priority[position] = own
+    fatigue = np.fromiter((record.fatigue_now(now) for record in records), dtype=np.float64, count=count)
+    cost = priority * (1.0 + SHED_FATIGUE_WEIGHT * fatigue)
+
+    candidates = np.flatnonzero((kw > 0) & (priority > NEVER_SHED))
+    order = candidates[np.argsort(cost[candidates] / kw[candidates], kind="stable")]
+    cumulative_kw = np.cumsum(kw[order])
+    available_kw = float(cumulative_kw[-1]) if len(order) else 0.0
+
+    if target_kw <= 0:
+        chosen = np.empty(0, dtype=np.int64)
+    elif available_kw < target_kw:
+        # Not enough sheddable load: everything is switched off
+        chosen = order
+    else:
+        # Greedy prefix: the cheapest DERs per kW until the target is met
+        last = int(np.searchsorted(cumulative_kw, target_kw - 1e-9))
+        chosen = order[:last + 1]
+        # The last one may be replaced by the cheapest single DER covering what the prefix lacks
+        missing_kw = target_kw - (float(cumulative_kw[last - 1]) if last else 0.0)
+        rest = order[last:]
+        covering = rest[kw[rest] >= missing_kw - 1e-9]
+        replacement = covering[np.argmin(cost[covering])]
+        if cost[replacement] < cost[order[last]]:
+            chosen = np.append(order[:last], replacement)
+        # Drop DERs the target no longer needs, most expensive first
+        surplus_kw = float(kw[chosen].sum()) - target_kw
+        if surplus_kw > 0:
+            keep = np.ones(len(chosen), dtype=bool)
+            for position in np.argsort(-cost[chosen], kind="stable"):
+                if kw[chosen[position]] <= surplus_kw + 1e-9:
+                    keep[position] = False
+                    surplus_kw -= kw[chosen[position]]
+            chosen = chosen[keep]
+
+    planned_kw = float(kw[chosen].sum())
+    return {
+        "records": [records[position] for position in chosen],
+        "planned_kw": planned_kw,
+        "cost": float(cost[chosen].sum()),
+        "shortfall_kw": max(0.0, target_kw - planned_kw),
+    }
+
+
+class ShedPlans:
+    """The last SHED_PLANS_KEPT plans, by plan id, until dispatched."""
+
+    def __init__(self, limit: int = SHED_PLANS_KEPT):
+        self.limit = limit
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, records: list) -> str:
+        plan_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._plans[plan_id] = records
+            while len(self._plans) > self.limit:
+                self._plans.popitem(last=False)
+        return plan_id
+
+    def pop(self, plan_id: str):
+        with self._lock:
+            return self._plans.pop(plan_id, None)
+
+
+plans = ShedPlans()
+
+
+def _summary(plan_id: str, target_kw: float, candidates: int, result: dict, elapsed: float) -> dict:
+    by_appliance = {}
+    households = set()
+    for record in result["records"]:
+        name = APPLIANCE_NAMES.get(record.appliance_id, str(record.appliance_id))
+        entry = by_appliance.setdefault(name, {"ders": 0, "kw": 0.0})
+        entry["ders"] += 1
+        entry["kw"] += APPLIANCE_KW[record.appliance_id]
+        households.add(record.er_id)
+    return {
+        "plan_id": plan_id,
+        "target_kw": target_kw,
+        "planned_kw": round(result["planned_kw"], 3),
+        "shortfall_kw": round(result["shortfall_kw"], 3),
+        "ders": len(result["records"]),
+        "households": len(households),
+        "candidates": candidates,
+        "comfort_cost": round(result["cost"], 2),
+        "by_appliance": {name: {"ders": entry["ders"], "kw": round(float(entry["kw"]), 3)} for name, entry in by_appliance.items()},
+        "planning_ms": round(elapsed * 1000, 1),
+    }
+
+
+def plan_der_shed(target_kw: float, appliances: str = "", tool_context: ToolContext = None) -> dict:
+    """
+    Plans which DERs of the enrolled households to switch off to reduce the load by target_kw for a
+    demand flexibility event, favouring the appliances households need least and the DERs shed
+    least recently. Utility operators only.
+    Nothing is switched until the plan is dispatched with dispatch_der_shed.
+    This function will be used as a tool by the agent.
+
+    Args:
+        target_kw: The load reduction requested by the utility, in kW.
+        appliances: Only consider these appliances, e.g. "Air Conditioner(1.5 Ton), Water pump" (all if empty).
+
+    Returns:
+        The plan: its id, the planned kW and any shortfall, the DERs and households per appliance, or an error message.
+    """
+    error_msg = der_dispatch.authorize_operator(tool_context)
+    if error_msg:
+        return error_msg
+    return _plan(target_kw, appliances)
+
+
+def _plan(target_kw: float, appliances: str):
+    started = time.perf_counter()
+    records, error_msg = der_dispatch.select_ders(appliances, None, True)
+    if error_msg:
+        return error_msg
+    result = plan(records, float(target_kw))
+    plan_id = plans.add(result["records"]) if result["records"] else None
+    return _summary(plan_id, float(target_kw), len(records), result, time.perf_counter() - started)
+
+
+@async_variant(plan_der_shed)
+async def plan_der_shed_async(target_kw: float, appliances: str = "", tool_context: ToolContext = None) -> dict:
+    error_msg = der_dispatch.authorize_operator(tool_context)
+    if error_msg:
+        return error_msg
+    # CPU-bound planning and a SQLite read of the enrolled users: off the event loop
+    return await asyncio.to_thread(_plan, target_kw, appliances)
+
+
+async def dispatch_der_shed(plan_id: str, tool_context: ToolContext = None) -> dict:
+    """
+    Switches off the DERs of a plan made by plan_der_shed. Utility operators only.
+    This function will be used as a tool by the agent.
+
+    Args:
+        plan_id: The plan id returned by plan_der_shed.
+
+    Returns:
+        The dispatch report (DERs switched off and failed, latency percentiles), or an error message.
+    """
+    error_msg = der_dispatch.authorize_operator(tool_context)
+    if error_msg:
+        return error_msg
+    records = plans.pop(plan_id)
+    if records is None:
+        return f"Error: No pending shed plan '{plan_id}'. Plans can be dispatched once; make a new one with plan_der_shed."
+    return await der_dispatch.dispatch_async(records, False)
+
+
+def set_shed_priority(search_query: str, priority: int, tool_context: ToolContext = None) -> str:
+    """
+    Sets how much the user needs an appliance during demand flexibility events: 1 (switch it off
+    first) to 5 (switch it off last), or 0 to never switch it off.
+    This function will be used as a tool by the agent.
+
+    Args:
+        search_query: The appliance name, e.g. "my Refrigerator" or "the Water pump".
+        priority: 0 to 5.
+
+    Returns:
+        A confirmation, or an error message.
+    """
+    match = extractor.best(search_query, "appliance", "der")
+    if match is None:
+        return f"Error: Could not find a recognized appliance name in '{search_query}'. Available: {list(der.APPLIANCE_MAPPING.keys())}"
+    if not 0 <= int(priority) <= 5:
+        return "Error: The priority must be between 0 (never switch off) and 5."
+    appliance_name, appliance_id = match.value
+    priorities.set(state_store.scope_of(tool_context), appliance_id, int(priority))
+    if int(priority) == NEVER_SHED:
+        return f"{appliance_name} will never be switched off during demand flexibility events."
+    return f"{appliance_name} now has shed priority {int(priority)} (1 = switched off first, 5 = last)."
+
+
+@async_variant(set_shed_priority)
+async def set_shed_priority_async(search_query: str, priority: int, tool_context: ToolContext = None) -> str:
+    return set_shed_priority(search_query, priority, tool_context)
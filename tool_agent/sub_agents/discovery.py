@@ -0,0 +1,99 @@
+from dotenv import load_dotenv
+import os
+import time
+import asyncio
+from .catalog_index import iter_catalog
+from .subsidy import search_subsidies_data
+from .demand_flexibility_program import search_demand_flexibility_program_data
+from .solar_retail import search_solar_retail_data
+from .solar_service import search_solar_service_data
+from .connection import search_connection_data
+
+load_dotenv()
+
+# One-shot discovery across every catalog.
+# "What can I get for going solar?" used to take five sequential search tool calls. The discovery
+# tool runs the five searches concurrently and waits for each one only until its domain's deadline,
+# so the turn takes as long as the slowest domain (or the deadline) instead of the sum of all five.
+# A search that misses its deadline keeps running in the background and lands in the catalog
+# cache, so the next search of that domain is answered from memory.
+
+# Seconds to wait for each domain. DISCOVERY_DEADLINE sets the default,
+# DISCOVERY_DEADLINE_<NAME> (e.g. DISCOVERY_DEADLINE_SUBSIDIES=3) overrides one domain.
+DISCOVERY_DEADLINE = float(os.getenv("DISCOVERY_DEADLINE", "8"))
+
+# name -> (domain, search)
+DISCOVERY_SEARCHES = {
+    "subsidies": ("deg:schemes", search_subsidies_data),
+    "demand_flexibility_programs": ("deg:schemes", search_demand_flexibility_program_data),
+    "solar_retail": ("deg:retail", search_solar_retail_data),
+    "solar_service": ("deg:service", search_solar_service_data),
+    "connection": ("deg:service", search_connection_data),
+}
+
+# Searches still running after their deadline
+_background_tasks = set()
+
+
+def get_deadline(name: str) -> float:
+    env_value = os.getenv(f"DISCOVERY_DEADLINE_{name.upper()}")
+    if env_value:
+        try:
+            return float(env_value)
+        except ValueError:
+            print(f"Warning: Ignoring invalid DISCOVERY_DEADLINE_{name.upper()} value: {env_value}")
+    return DISCOVERY_DEADLINE
+
+
+def _summarize_domain(domain: str, response) -> dict:
+    """Reduces one search response to its providers and item names."""
+    if not isinstance(response, dict):
+        return {"domain": domain, "status": "error", "error": str(response)}
+    providers = [
+        {"id": provider_id, "name": provider_name, "items": [item_name for _, item_name in items]}
+        for provider_id, provider_name, items in iter_catalog(response)
+    ]
+    return {"domain": domain, "status": "ok", "providers": providers}
+
+
+def _timed_out(domain: str, deadline: float) -> dict:
+    return {"domain": domain, "status": "timeout", "error": f"No response within {deadline:g}s, try the domain's search again shortly."}
+
+
+async def discover_solar_offerings(search_query: str) -> dict:
+    """
+    Searches subsidies, demand flexibility programs, solar retail, solar services and grid connections
+    at once and returns a compact summary of every provider and item found.
+    This function will be used as a tool by the agent.
+
+    Args:
+        search_query: The user's request, e.g. "what can I get for going solar".
+
+    Returns:
+        A dict with one entry per catalog (subsidies, demand_flexibility_programs, solar_retail,
+        solar_service, connection), each holding its status ("ok", "timeout" or "error") and providers
+        with their item names, plus the total elapsed time in milliseconds.
+    """
+    started = time.monotonic()
+    loop = asyncio.get_running_loop()
+    tasks = {name: loop.create_task(search(search_query)) for name, (_, search) in DISCOVERY_SEARCHES.items()}
+
+    summary = {}
+    for name, task in tasks.items():
+        domain = DISCOVERY_SEARCHES[name][0]
+        deadline = get_deadline(name)
+        # asyncio.wait leaves the task running on timeout, unlike wait_for
+        await asyncio.wait({task}, timeout=max(0.0, deadline - (time.monotonic() - started)))
+        if not task.done():
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+            summary[name] = _timed_out(domain, deadline)
+            continue
+        try:
+            response = task.result()
+        except Exception as e:
+            response = f"An unexpected error occurred: {e}"
+        summary[name] = _summarize_domain(domain, response)
+
+    summary["elapsed_ms"] = round((time.monotonic() - started) * 1000)
+    return summary
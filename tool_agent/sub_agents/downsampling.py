@@ -0,0 +1,87 @@
+import numpy as np
+
+# Downsampling of meter readings to a target number of points.
+# A year of 15-minute readings is 35k points: far more than a chat answer or a chart can use. The
+# history is reduced before it leaves the backend, with one of two methods:
+#   - "lttb" (Largest-Triangle-Three-Buckets): one reading per bucket, the one forming the largest
+#     triangle with the previously kept reading and the next bucket's average, which keeps the
+#     visual shape of the curve. The highest reading is always kept as well.
+#   - "minmax": the lowest and highest reading of every bucket, so every peak and trough survives.
+# Either way the readings returned are actual readings (no averaging), oldest first.
+METHODS = ("lttb", "minmax")
+
+
+def _bucket_edges(count: int, buckets: int, start: int = 0) -> np.ndarray:
+    """Returns buckets + 1 increasing edges splitting [start, count) into buckets of near-equal size."""
+    return np.linspace(start, count, buckets + 1).astype(np.int64)
+
+
+def lttb(timestamps: np.ndarray, values: np.ndarray, points: int) -> np.ndarray:
+    """Returns the indices of the readings kept by LTTB, at most points of them."""
+    count = len(values)
+    if points >= count:
+        return np.arange(count)
+    if points < 3:
+        # Too few points for a bucket between the first and last reading
+        return np.array([0, count - 1][:max(points, 0)], dtype=np.int64)
+    x = (timestamps - timestamps[0]).astype(np.float64)
+    y = np.asarray(values, dtype=np.float64)
+
+    # The first and last readings are kept as is, the ones in between are split into points - 2 buckets
+    edges = _bucket_edges(count - 1, points - 2, start=1)
+    sizes = np.diff(edges)
+    # Average of each bucket, plus the last reading as the "next bucket" of the last one
+    avg_x = np.r_[np.add.reduceat(x[:-1], edges[:-1]) / sizes, x[-1]]
+    avg_y = np.r_[np.add.reduceat(y[:-1], edges[:-1]) / sizes, y[-1]]
+
+    kept = np.empty(points, dtype=np.int64)
+    kept[0], kept[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(points - 2):
+        low, high = edges[bucket], edges[bucket + 1]
+        # Twice the triangle area, the constant factor does not change the argmax
+        areas = np.abs((x[previous] - avg_x[bucket + 1]) * (y[low:high] - y[previous])
+                       - (x[previous] - x[low:high]) * (avg_y[bucket + 1] - y[previous]))
+        previous = kept[bucket + 1] = low + int(np.argmax(areas))
+
+    peak = int(np.argmax(y))
+    if peak not in (0, count - 1):
+        kept[int(np.searchsorted(edges, peak, side="right"))] = peak
+    return kept
+
+
+def minmax(values: np.ndarray, points: int) -> np.ndarray:
+    """Returns the indices of the lowest and highest reading of each of points // 2 buckets, in order."""
+    count = len(values)
+    if points >= count:
+        return np.arange(count)
+    y = np.asarray(values, dtype=np.float64)
+    if points < 2:
+        # No room for a low and a high: the peak alone
+        return np.array([int(np.argmax(y))][:max(points, 0)], dtype=np.int64)
+    buckets = points // 2
+    edges = _bucket_edges(count, buckets)
+    bucket_of = np.repeat(np.arange(buckets), np.diff(edges))
+
+    def first_matching(extremes):
+        # First index of each bucket holding the bucket's extreme value (the matches are in index order)
+        matches = np.flatnonzero(y == extremes[bucket_of])
+        first = np.r_[True, bucket_of[matches][1:] != bucket_of[matches][:-1]]
+        return matches[first]
+
+    lows = first_matching(np.minimum.reduceat(y, edges[:-1]))
+    highs = first_matching(np.maximum.reduceat(y, edges[:-1]))
+    return np.unique(np.concatenate([lows, highs]))
+
+
+def downsample(timestamps: np.ndarray, values: np.ndarray, points: int, method: str = "lttb"):
+    """
+    Returns (timestamps, values) reduced to at most points readings with the given method
+    ("lttb" or "minmax"). Series already within points are returned unchanged.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method '{method}', expected one of {', '.join(METHODS)}")
+    if points >= len(values):
+        return timestamps, values
+    kept = lttb(timestamps, values, points) if method == "lttb" else minmax(values, points)
+    return timestamps[kept], values[kept]
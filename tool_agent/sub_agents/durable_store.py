@@ -0,0 +1,356 @@
+from dotenv import load_dotenv
+import os
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+
+load_dotenv()
+
+# Durable copy of the tool state.
+# Orders, meters, energy resources and DERs created by the tools are written to an embedded SQLite
+# database (WAL mode, so the startup reads never block the writer), and the in-memory state store and
+# status table are rebuilt from it on startup with one query per table. The meter code high-water
+# mark is kept here as well (see id_allocator.py), so restarts do not mint codes the simulator already has.
+#
+# Writes are queued and applied by one writer thread, which groups everything queued within
+# STATE_DB_FLUSH_INTERVAL seconds (up to STATE_DB_BATCH_SIZE statements) into a single transaction:
+# the tools never wait on disk (commit is the exception, for checkpoints that must be on disk before
+# the caller goes on). STATE_DB_PATH="" disables the durable store.
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "state.db"))
+STATE_DB_FLUSH_INTERVAL = float(os.getenv("STATE_DB_FLUSH_INTERVAL", "0.05"))
+STATE_DB_BATCH_SIZE = int(os.getenv("STATE_DB_BATCH_SIZE", "500"))
+
+# Id columns are left untyped so the simulator's integer ids come back as integers
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    domain TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    status TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL,
+    PRIMARY KEY (domain, order_id)
+);
+CREATE INDEX IF NOT EXISTS orders_user ON orders (user_id, domain, created_at);
+
+CREATE TABLE IF NOT EXISTS meters (
+    meter_id PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    code TEXT,
+    transformer,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS meters_user ON meters (user_id, created_at);
+
+CREATE TABLE IF NOT EXISTS energy_resources (
+    er_id PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    meter_id,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS energy_resources_user ON energy_resources (user_id, created_at);
+CREATE INDEX IF NOT EXISTS energy_resources_meter ON energy_resources (meter_id);
+
+CREATE TABLE IF NOT EXISTS ders (
+    der_id PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    er_id,
+    appliance_id,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ders_user ON ders (user_id, appliance_id, created_at);
+CREATE INDEX IF NOT EXISTS ders_er ON ders (er_id);
+
+CREATE TABLE IF NOT EXISTS shed_priorities (
+    user_id TEXT NOT NULL,
+    appliance_id NOT NULL,
+    priority INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (user_id, appliance_id)
+);
+
+CREATE TABLE IF NOT EXISTS provisioning_rows (
+    job TEXT NOT NULL,
+    row_number INTEGER NOT NULL,
+    household TEXT,
+    status TEXT NOT NULL,
+    meter_id,
+    er_id,
+    error TEXT,
+    finished_at REAL NOT NULL,
+    PRIMARY KEY (job, row_number)
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+
+class DurableStore:
+    """
+    SQLite database with a batching writer thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._ready = False
+        self.batches = 0
+        self.writes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL only syncs at checkpoints: a power loss may drop the last batches, never corrupt
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _ensure_schema(self):
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = self._connect()
+            try:
+                connection.executescript(SCHEMA)
+            finally:
+                connection.close()
+            self._ready = True
+
+    def rows(self, sql: str, params=()) -> list:
+        """Runs a read query on its own connection and returns all rows."""
+        if not self.enabled:
+            return []
+        self._ensure_schema()
+        connection = self._connect()
+        try:
+            return connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+
+    def increment(self, key: str, count: int, floor: int = 0) -> int | None:
+        """
+        Atomically raises the meta value of key to at least floor, adds count and returns the new value.
+        Runs synchronously in its own transaction, so concurrent processes sharing the database never
+        get overlapping ranges. Returns None when the durable store is disabled or unavailable.
+        """
+        if not self.enabled:
+            return None
+        self._ensure_schema()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)", (key, floor))
+            (value,) = connection.execute(
+                "UPDATE meta SET value = MAX(value, ?) + ? WHERE key = ? RETURNING value", (floor, count, key)
+            ).fetchone()
+            connection.execute("COMMIT")
+            return value
+        except sqlite3.Error as e:
+            print(f"Warning: Could not update {key} in {self.path}: {e}")
+            return None
+        finally:
+            connection.close()
+
+    def execute(self, sql: str, params=()):
+        """Queues a write. It is committed with the next batch."""
+        if not self.enabled:
+            return
+        self._ensure_running()
+        self._queue.put((sql, params))
+
+    def commit(self, sql: str, params=()) -> bool:
+        """
+        Runs a write synchronously in its own transaction, for the writes that must be on disk before
+        the caller goes on. Returns False if it could not be committed (True when the store is disabled).
+        """
+        if not self.enabled:
+            return True
+        self._ensure_schema()
+        connection = self._connect()
+        try:
+            connection.execute(sql, params)
+            return True
+        except sqlite3.Error as e:
+            print(f"Warning: Could not write to {self.path}: {e}")
+            return False
+        finally:
+            connection.close()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Waits until every write queued so far is committed."""
+        if not self.enabled or self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _ensure_running(self):
+        if self._thread is not None:
+            return
+        self._ensure_schema()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="durable-store", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        connection = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + STATE_DB_FLUSH_INTERVAL
+            while len(batch) < STATE_DB_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            statements = [item for item in batch if not isinstance(item, threading.Event)]
+            if statements:
+                try:
+                    connection.execute("BEGIN")
+                    for sql, params in statements:
+                        connection.execute(sql, params)
+                    connection.execute("COMMIT")
+                    self.batches += 1
+                    self.writes += len(statements)
+                except sqlite3.Error as e:
+                    print(f"Warning: Could not write {len(statements)} state changes to {self.path}: {e}")
+                    if connection.in_transaction:
+                        connection.execute("ROLLBACK")
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+
+store = DurableStore(STATE_DB_PATH)
+atexit.register(store.flush)
+
+_ORDER_SUFFIX = "_order"
+
+
+def save(scope: str, kind: str, value, key=None, details: dict = None):
+    """
+    Queues the write of a value recorded in the state store.
+
+    Args:
+        scope: The user the value belongs to.
+        kind: The state store kind, e.g. "subsidy_order", "meter", "er_household" or "der".
+        value: The recorded value (an id, or the DER dict).
+        key: The state store key of the value, if any.
+        details: Extra columns: "code" and "transformer" for meters, "meter_id" for energy resources.
+    """
+    details = details or {}
+    now = time.time()
+    if kind.endswith(_ORDER_SUFFIX):
+        store.execute(
+            "INSERT OR IGNORE INTO orders (domain, user_id, order_id, created_at) VALUES (?, ?, ?, ?)",
+            (kind[:-len(_ORDER_SUFFIX)], scope, str(value), now),
+        )
+    elif kind == "meter":
+        store.execute(
+            "INSERT OR REPLACE INTO meters (meter_id, user_id, code, transformer, created_at) VALUES (?, ?, ?, ?, ?)",
+            (value, scope, details.get("code"), details.get("transformer"), now),
+        )
+    elif kind == "er_household":
+        store.execute(
+            "INSERT OR REPLACE INTO energy_resources (er_id, user_id, meter_id, created_at) VALUES (?, ?, ?, ?)",
+            (value, scope, details.get("meter_id"), now),
+        )
+    elif kind == "der":
+        store.execute(
+            "INSERT OR REPLACE INTO ders (der_id, user_id, er_id, appliance_id, created_at) VALUES (?, ?, ?, ?, ?)",
+            (value["id"], scope, value.get("er_id"), value.get("appliance_id"), now),
+        )
+
+
+def update_order_status(name: str, order_id, state: str):
+    """Queues the write of an order's latest state, as seen by the status watcher."""
+    store.execute(
+        "UPDATE orders SET status = ?, updated_at = ? WHERE domain = ? AND order_id = ?",
+        (state, time.time(), name, str(order_id)),
+    )
+
+
+def reserve(key: str, count: int, floor: int = 0) -> int | None:
+    """
+    Reserves the next count values of a persisted high-water mark (e.g. meter code numbers) and
+    returns the new high-water mark: the reserved values are (mark - count, mark].
+    """
+    return store.increment(key, count, floor)
+
+
+# Rows restored per user and kind; more than the state store retains would be dropped right away.
+# created_at comes first in every row, for merging the tables in time order.
+def _latest_rows(table: str, columns: str, partition: str, limit: int) -> list:
+    return store.rows(
+        f"SELECT created_at, {columns} FROM ("
+        f"  SELECT *, ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY created_at DESC) AS position FROM {table}"
+        f") WHERE position <= ? ORDER BY created_at",
+        (limit,),
+    )
+
+
+# Loaded on startup by restore()
+meta = {}
+
+
+def restore(state, watcher) -> dict:
+    """
+    Rebuilds the state store and the status table from the database, with one query per table,
+    and loads the meta values (high-water marks). DERs are restored by the DER registry.
+    The rows of all tables are replayed in creation order, so if there are more users than the state
+    store keeps, the most recently active ones are kept.
+
+    Args:
+        state: The state_store.StateStore to fill.
+        watcher: The status_watcher.StatusWatcher to track the restored orders in.
+
+    Returns:
+        The number of rows restored per table.
+    """
+    if not store.enabled:
+        return {}
+    limit = state.history_limit
+    try:
+        tables = {
+            "orders": _latest_rows("orders", "domain, user_id, order_id, status", "user_id, domain", limit),
+            "meters": _latest_rows("meters", "user_id, meter_id", "user_id", limit),
+            "energy_resources": _latest_rows("energy_resources", "user_id, er_id", "user_id", limit),
+        }
+        meta.update(store.rows("SELECT key, value FROM meta"))
+    except sqlite3.Error as e:
+        print(f"Warning: Could not restore the tool state from {store.path}: {e}")
+        return {}
+
+    tagged = [((row[0], table), row) for table, rows in tables.items() for row in rows]
+    tagged.sort(key=lambda item: item[0][0])
+    for (_, table), row in tagged:
+        if table == "orders":
+            _, domain, user_id, order_id, status = row
+            state.restore(user_id, domain + _ORDER_SUFFIX, order_id)
+            watcher.restore(domain, order_id, status)
+        elif table == "meters":
+            _, user_id, meter_id = row
+            state.restore(user_id, "meter", meter_id)
+        else:
+            _, user_id, er_id = row
+            state.restore(user_id, "er_household", er_id)
+    return {table: len(rows) for table, rows in tables.items()}
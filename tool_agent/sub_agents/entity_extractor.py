@@ -0,0 +1,163 @@
+import re
+import threading
+from collections import deque, namedtuple
+
+# Shared entity extractor.
+# All known provider, item and appliance names are compiled into one Aho–Corasick automaton over
+# words, so a query is scanned once, left to right, whatever the number of names, and every
+# mentioned entity comes back with its span in the query. Names are matched on whole words,
+# ignoring case and punctuation ("LED Bulb(10 W)" matches "led bulb 10 w") and simple plurals
+# ("Ceiling Fans" matches "Ceiling Fan"): words are reduced to a singular form on both sides.
+#
+# Adding or removing a name only touches its own trie path; the failure links are recomputed
+# once, on the first query after a batch of changes, instead of rebuilding the trie.
+
+_WORD_RE = re.compile(r"[^\W_]+")
+
+# start/end index the original query (query[start:end] is the matched text)
+Match = namedtuple("Match", ["start", "end", "text", "kind", "scope", "value"])
+
+
+class _Node:
+    __slots__ = ("children", "fail", "entities", "outputs", "depth")
+
+    def __init__(self, depth: int = 0):
+        self.children = {}
+        self.fail = None
+        self.entities = frozenset()  # (kind, scope, value) of the names ending here, replaced on change
+        self.outputs = ()      # nodes with entities on the fail chain, this node included
+        self.depth = depth     # name length, in words
+
+
+def _singular(word: str) -> str:
+    """Drops a plural "s" / "es" ending. Not a real stemmer: it only has to treat names and queries alike."""
+    if len(word) <= 3 or not word.endswith("s") or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("es") and word[:-2].endswith(("s", "x", "z", "ch", "sh")):
+        return word[:-2]
+    return word[:-1]
+
+
+def _words(text: str):
+    """Yields (word, start, end) for every word of the text, lowercased and singular."""
+    for match in _WORD_RE.finditer(text):
+        yield _singular(match.group(0).lower()), match.start(), match.end()
+
+
+class EntityExtractor:
+    """
+    Aho–Corasick automaton of entity names. Each name maps to one or more (kind, scope, value) entities,
+    e.g. ("provider", "deg:retail ...", "27") or ("appliance", "der", ("Ceiling Fan", 2)).
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._root.fail = self._root
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.size = 0
+
+    def _path(self, name: str, create: bool):
+        node = self._root
+        for word, _, _ in _words(name):
+            child = node.children.get(word)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[word] = _Node(node.depth + 1)
+                # Valid (if not yet optimal) until the next _link, for queries running concurrently
+                child.fail = self._root
+            node = child
+        return node if node is not self._root else None
+
+    def add(self, name: str, kind: str, value, scope: str = None):
+        """Registers a name. Names without any letter or digit are ignored."""
+        with self._lock:
+            node = self._path(name, create=True)
+            if node is None:
+                return
+            entity = (kind, scope, value)
+            if entity not in node.entities:
+                node.entities = node.entities | {entity}
+                self.size += 1
+                self._dirty = True
+
+    def remove(self, name: str, kind: str, value, scope: str = None):
+        with self._lock:
+            node = self._path(name, create=False)
+            entity = (kind, scope, value)
+            if node is not None and entity in node.entities:
+                node.entities = node.entities - {entity}
+                self.size -= 1
+                self._dirty = True
+
+    def _link(self):
+        # Breadth-first pass setting the failure link (longest proper suffix that is also a trie path)
+        # and the output list of every node.
+        root = self._root
+        root.outputs = ()
+        queue = deque()
+        for child in root.children.values():
+            child.fail = root
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            node.outputs = ((node,) if node.entities else ()) + node.fail.outputs
+            for word, child in node.children.items():
+                fail = node.fail
+                while fail is not root and word not in fail.children:
+                    fail = fail.fail
+                child.fail = fail.children.get(word, root)
+                queue.append(child)
+        self._dirty = False
+
+    def find_all(self, text: str, kind: str = None, scope: str = None) -> list:
+        """
+        Returns every entity mentioned in the text, overlapping ones included,
+        ordered by start position and longest first.
+        """
+        if self._dirty:
+            with self._lock:
+                if self._dirty:
+                    self._link()
+
+        root = self._root
+        node = root
+        starts = []
+        matches = []
+        for word, start, end in _words(text):
+            starts.append(start)
+            while node is not root and word not in node.children:
+                node = node.fail
+            node = node.children.get(word, root)
+            for output in node.outputs:
+                match_start = starts[len(starts) - output.depth]
+                for entity_kind, entity_scope, value in output.entities:
+                    if (kind is None or entity_kind == kind) and (scope is None or entity_scope == scope):
+                        matches.append(Match(match_start, end, text[match_start:end], entity_kind, entity_scope, value))
+        matches.sort(key=lambda match: (match.start, match.start - match.end))
+        return matches
+
+    def find_longest(self, text: str, kind: str = None, scope: str = None) -> list:
+        """
+        Returns the non-overlapping matches, keeping the longest one wherever matches overlap
+        (e.g. "Solar Panel" inside "Bluebird Solar Panel" is dropped).
+        """
+        selected = []
+        for match in sorted(self.find_all(text, kind, scope), key=lambda match: (match.start - match.end, match.start)):
+            if all(match.end <= kept.start or match.start >= kept.end for kept in selected):
+                selected.append(match)
+        selected.sort(key=lambda match: match.start)
+        return selected
+
+    def best(self, text: str, kind: str = None, scope: str = None):
+        """Returns the longest match (the first one on ties), or None."""
+        best_match = None
+        for match in self.find_all(text, kind, scope):
+            if best_match is None or match.end - match.start > best_match.end - best_match.start:
+                best_match = match
+        return best_match
+
+
+# The extractor shared by the catalog indexes and the DER tools
+extractor = EntityExtractor()
@@ -1,19 +1,13 @@
-import requests
-from google.adk.agents import Agent
+from google.adk.tools import ToolContext
 from dotenv import load_dotenv
-import os
-import uuid
-from datetime import datetime, timezone
-import json
-
-# Import meter_ids_list from meter_reading.py
-from .meter_reading import meter_ids_list
+from . import http_client
+from . import beckn_payloads
+from . import state_store
+from . import transformer_load
+from . import household_graph
 
 load_dotenv()
 
-# Global list to store Energy Resource household IDs from responses
-er_household_ids_list = []
-
 API_ER_HOUSE_HOLD_ENDPOINT = "http://world-engine-team7.becknprotocol.io/meter-data-simulator/energy-resources"
 # Base URL for GETting a specific energy resource. The ID will be appended.
 ER_HOUSE_HOLD_BASE_URL = "http://world-engine-team7.becknprotocol.io/meter-data-simulator/energy-resources"
@@ -23,17 +17,65 @@ ER_HOUSE_HOLD_GET_QUERY_PARAMS = "?populate[0]=meter.parent&populate[1]=meter.ch
 ER_HOUSE_HOLD_CREATE_TEMPLATE = """
 {
     "data": {
-        "name": "Mudit's Home",
+        "name": "{{name}}",
         "type": "CONSUMER",
         "meter": "{{latest_meter_id}}" 
     }
 }
 """
+ER_HOUSE_HOLD_CREATE_PAYLOAD = beckn_payloads.PayloadBuilder(ER_HOUSE_HOLD_CREATE_TEMPLATE, latest_meter_id=("data", "meter"), name=("data", "name"))
+ER_HOUSE_HOLD_NAME = "Mudit's Home"
+
+def _latest_meter_id(tool_context):
+    latest_meter_id = state_store.latest(tool_context, "meter")
+    if latest_meter_id is None:
+        return None, "Error: No meter IDs available. Cannot create an energy resource without a meter."
+    return latest_meter_id, None
+
+
+def _record_er_house_hold(response_data, meter_id, tool_context):
+    # The meter's household changed, whether or not the response can be read
+    household_graph.graphs.invalidate_meter(meter_id)
+    # Extract and store the ER household ID
+    if isinstance(response_data, dict) and "data" in response_data and "id" in response_data["data"]:
+        state_store.record(tool_context, "er_household", response_data["data"]["id"], details={"meter_id": meter_id})
+        transformer_load.index.bind_energy_resource(response_data["data"]["id"], meter_id)
+        household_graph.graphs.bind_energy_resource(response_data["data"]["id"], meter_id)
+
+
+async def create_energy_resource(meter_id, tool_context, name: str = ER_HOUSE_HOLD_NAME):
+    """
+    Creates the energy resource (household) of meter_id, and records it for tool_context
+    (a ToolContext or a state store scope).
+
+    Returns:
+        (response_data, error_message)
+    """
+    payload, error_msg = ER_HOUSE_HOLD_CREATE_PAYLOAD.build(latest_meter_id=meter_id, name=name)
+    if error_msg:
+        return None, error_msg
+    response_data = await http_client.arequest_json("POST", API_ER_HOUSE_HOLD_ENDPOINT, action="energy_resource", data=payload, headers=http_client.JSON_HEADERS)
+    _record_er_house_hold(response_data, meter_id, tool_context)
+    return response_data, None
+
+
+def _er_house_hold_url(tool_context):
+    # The prompt says "dynamically add the latest_meter_id to this api in the place of 1664".
+    # The API structure `energy-resources/{id}` usually means `id` is the ID of the energy resource,
+    # but we follow the original assumption that the ID in the path is the latest *meter ID*.
+    # If the API does not allow fetching an energy resource by its meter's ID like this,
+    # this function will need modification or clarification on how to get the ER ID.
+    latest_id_for_path = state_store.latest(tool_context, "meter")
+    if latest_id_for_path is None:
+        return None, None, "Error: No meter IDs available. Cannot determine which energy resource to fetch."
+
+    return f"{ER_HOUSE_HOLD_BASE_URL}/{latest_id_for_path}{ER_HOUSE_HOLD_GET_QUERY_PARAMS}", latest_id_for_path, None
+
 
-def create_er_house_hold(search_query: str) -> str:
+async def create_er_house_hold(search_query: str, tool_context: ToolContext = None) -> str:
     """
     Creates a new energy resource (ER) for a household using the latest meter ID.
-    The ID of the created ER is stored in a global list.
+    The ID of the created ER is stored in the user's state.
 
     Args:
         search_query (str): The search query to create the energy resource. (Currently unused but kept for future flexibility)
@@ -42,109 +84,29 @@ def create_er_house_hold(search_query: str) -> str:
         str: A string representation of the JSON response from the API, containing the created energy resource,
         or an error message.
     """
-    global meter_ids_list
-    global er_household_ids_list # Declare global to modify it
-
-    if not meter_ids_list:
-        return "Error: No meter IDs available. Cannot create an energy resource without a meter."
-
     try:
-        latest_meter_id = meter_ids_list[-1]
-
-        payload_dict = json.loads(ER_HOUSE_HOLD_CREATE_TEMPLATE)
-        payload_dict["data"]["meter"] = latest_meter_id
-        current_payload = json.dumps(payload_dict)
-
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(API_ER_HOUSE_HOLD_ENDPOINT, data=current_payload, headers=headers)
-        response.raise_for_status()
-
-        response_data = response.json()
-
-        # Extract and store the ER household ID
-        if "data" in response_data and "id" in response_data["data"]:
-            er_household_ids_list.append(response_data["data"]["id"])
-            # You can print or log the list to see it grow:
-            # print(f"Current ER Household IDs: {er_household_ids_list}")
-        
-        return response_data # Return the full response data
-
-    except requests.exceptions.HTTPError as http_err:
-        error_details = ""
-        if hasattr(response, 'text'):
-            try:
-                error_details = response.text
-            except Exception:
-                pass
-        return f"HTTP error occurred: {http_err} - {error_details}"
-    except requests.exceptions.RequestException as req_err:
-        return f"Error calling API: {req_err}"
-    except json.JSONDecodeError as json_err:
-        return f"Error decoding JSON template: {json_err}"
+        meter_id, error_msg = _latest_meter_id(tool_context)
+        if error_msg:
+            return error_msg
+        response_data, error_msg = await create_energy_resource(meter_id, tool_context)
+        return error_msg or response_data
     except Exception as e:
         return f"An unexpected error occurred: {e}"
 
 
-def get_er_house_hold() -> str:
+async def get_er_house_hold(tool_context: ToolContext = None) -> str:
     """
     Retrieves the energy resource (ER) for a household using the latest meter ID
     associated with that ER. 
-    Assumes the ER was created for the latest meter in meter_ids_list.
+    Assumes the ER was created for the user's latest meter.
+    Served from the household graph cache until one of our own writes changes the household.
 
     Returns:
         str: A string representation of the JSON response from the API, containing the energy resource,
         or an error message. 
     """
-    global meter_ids_list # meter_ids_list contains IDs of meters, not ER households directly.
-                         # We need the ID of the ER household itself.
-                         # For now, assuming the user wants to fetch an ER whose *associated meter* is the latest.
-                         # The endpoint structure `energy-resources/{id}` suggests we need the ER ID.
-                         # If the intention is to find an ER *by its meter ID*, the API endpoint might be different
-                         # or require query parameters.
-                         # Given the current API_GET_ER_HOUSE_HOLD_ENDPOINT provided by user:
-                         # "http://world-engine-team7.becknprotocol.io/meter-data-simulator/energy-resources/1664?..."
-                         # This `1664` should be the *Energy Resource ID*, not the meter ID.
-                         # This function needs a way to get the ID of the ER that was just created or is relevant.
-
-    # Clarification: The prompt says "dynamically add the latest_meter_id to this api in the place of 1664".
-    # This implies the ID in that path *is* the meter ID, or is somehow derived from it.
-    # Or, the user assumes the ER ID is the same as the meter ID. This is unlikely.
-    # Let's assume the user *meant* that the ID in the path should be the latest *meter ID*.
-    # The API structure `energy-resources/{id}` usually means `id` is the ID of the energy resource.
-    # If the API allows fetching an energy resource *using its associated meter's ID directly in the path like this*, then it's fine.
-    # Otherwise, this function will need modification or clarification on how to get the ER ID.
-
-    if not meter_ids_list:
-        return "Error: No meter IDs available. Cannot determine which energy resource to fetch."
-
-    try:
-        # Assuming the ID in the path of API_GET_ER_HOUSE_HOLD_ENDPOINT should be the latest meter_id
-        latest_id_for_path = meter_ids_list[-1]
-        
-        # Construct the URL dynamically
-        request_url = f"{ER_HOUSE_HOLD_BASE_URL}/{latest_id_for_path}{ER_HOUSE_HOLD_GET_QUERY_PARAMS}"
-        
-        headers = {'Content-Type': 'application/json'} # GET requests usually don't need Content-Type for the body
-                                                      # but it doesn't harm to send it if API expects/tolerates it.
-        response = requests.get(request_url, headers=headers)
-        response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
-
-        return response.json()  # Return the JSON response from the API
-
-    except requests.exceptions.HTTPError as http_err:
-        error_details = ""
-        if hasattr(response, 'text'):
-            try:
-                error_details = response.text
-            except Exception:
-                pass
-        return f"HTTP error occurred while fetching ER household: {http_err} - {error_details}"
-    except requests.exceptions.RequestException as req_err:
-        return f"Error calling API to fetch ER household: {req_err}"
-    except json.JSONDecodeError as json_err: # If the response isn't valid JSON
-        error_text = ""
-        if hasattr(response, 'text'):
-            error_text = response.text
-        return f"Error decoding JSON response from ER household API: {json_err}. Response text: {error_text[:500]}"
-    except Exception as e:
-        return f"An unexpected error occurred while fetching ER household: {e}"
+    request_url, meter_id, error_msg = _er_house_hold_url(tool_context)
+    if error_msg:
+        return error_msg
+    return await household_graph.graphs.aget(meter_id, lambda: http_client.arequest_json(
+        "GET", request_url, action="energy_resource", coalesce=True, headers=http_client.JSON_HEADERS))
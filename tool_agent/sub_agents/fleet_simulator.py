@@ -0,0 +1,246 @@
+from dotenv import load_dotenv
+import os
+import time
+import asyncio
+import numpy as np
+from .tooling import async_variant
+from . import der
+from . import der_shed
+from . import meter_reading
+from . import transformer_load
+
+load_dotenv()
+
+# Fleet simulator for demand flexibility capacity planning.
+# Estimates, before households are enrolled in a program such as the Home Battery Discharge Program,
+# how much load each transformer in TRANSFORMER_IDS could shed during an event. Households are
+# generated as arrays, one entry per household: the transformer it is on (households are spread in
+# proportion to transformer capacity, FLEET_HOUSEHOLDS_PER_KW of it unless a count is given: at about
+# 1.35 kW of diversified peak per household, the default loads transformers to ~70% at peak), which APPLIANCE_MAPPING appliances it owns
+# (APPLIANCE_OWNERSHIP), how intensively it uses them and how early or late in the day (up to an hour
+# either way), the size of its rooftop solar array and whether it has a home battery.
+#
+# Loads are on a 24h x 15 min grid (96 slots, local time). Each appliance's load is its nominal kW
+# times its duty cycle per slot (APPLIANCE_USAGE), so rather than materializing a households x 96
+# matrix, the per-household weights are summed per (transformer, time shift) with one bincount per
+# appliance and multiplied by the shifted duty cycles: a million households take well under a second.
+#
+# The shed potential of a transformer during an event is the load of its sheddable appliances (shed
+# priority from 1 to FLEET_SHED_MAX_PRIORITY, see der_shed.py), up to the net load it draws during
+# the event (with rooftop solar, switching appliances off cannot lower the load below zero), plus the
+# discharge its batteries can sustain for the whole event (FLEET_BATTERY_KW, limited by the usable
+# energy of FLEET_BATTERY_KWH above the reserve, at the state of charge of the event start).
+FLEET_HOUSEHOLDS_PER_KW = float(os.getenv("FLEET_HOUSEHOLDS_PER_KW", "0.5"))
+FLEET_SOLAR_SHARE = float(os.getenv("FLEET_SOLAR_SHARE", "0.25"))
+FLEET_SOLAR_KW = float(os.getenv("FLEET_SOLAR_KW", "5.0"))
+FLEET_BATTERY_SHARE_WITH_SOLAR = float(os.getenv("FLEET_BATTERY_SHARE_WITH_SOLAR", "0.4"))
+FLEET_BATTERY_SHARE_WITHOUT_SOLAR = float(os.getenv("FLEET_BATTERY_SHARE_WITHOUT_SOLAR", "0.03"))
+FLEET_BATTERY_KW = float(os.getenv("FLEET_BATTERY_KW", "5.0"))
+FLEET_BATTERY_KWH = float(os.getenv("FLEET_BATTERY_KWH", "13.5"))
+FLEET_BATTERY_RESERVE = float(os.getenv("FLEET_BATTERY_RESERVE", "0.2"))
+FLEET_SHED_MAX_PRIORITY = int(os.getenv("FLEET_SHED_MAX_PRIORITY", "3"))
+
+SLOTS = 96
+SLOT_HOURS = 0.25
+MAX_SHIFT_SLOTS = 4
+
+SOLAR_APPLIANCE = "Solar Panel(production)"
+
+# Share of households owning each appliance
+APPLIANCE_OWNERSHIP = {
+    "Air Conditioner(1.5 Ton)": 0.45,
+    "Ceiling Fan": 0.85,
+    "Electric Geyser": 0.35,
+    "Laptop Charger": 0.75,
+    "LED Bulb(10 W)": 1.0,
+    "Microwave Oven": 0.7,
+    "Refrigerator": 0.98,
+    "Room Heater": 0.3,
+    "Television(LED)": 0.9,
+    "Washing machine": 0.75,
+    "Water pump": 0.25,
+}
+
+# Duty cycle of each appliance: (start hour, end hour, share of the time it runs)
+APPLIANCE_USAGE = {
+    "Air Conditioner(1.5 Ton)": [(0, 7, 0.1), (7, 13, 0.25), (13, 21, 0.6), (21, 24, 0.3)],
+    "Ceiling Fan": [(0, 7, 0.5), (7, 18, 0.3), (18, 24, 0.6)],
+    "Electric Geyser": [(6, 9, 0.5), (18, 21, 0.3)],
+    "Laptop Charger": [(9, 18, 0.3), (18, 23, 0.5)],
+    "LED Bulb(10 W)": [(6, 8, 0.5), (18, 24, 0.8)],
+    "Microwave Oven": [(7, 9, 0.1), (12, 14, 0.1), (18, 21, 0.15)],
+    "Refrigerator": [(0, 24, 0.4)],
+    "Room Heater": [(0, 7, 0.3), (17, 24, 0.4)],
+    "Television(LED)": [(7, 9, 0.3), (18, 24, 0.7)],
+    "Washing machine": [(8, 12, 0.15), (18, 21, 0.15)],
+    "Water pump": [(5, 8, 0.3), (17, 20, 0.2)],
+}
+
+
+def _duty_cycle(windows: list) -> np.ndarray:
+    duty = np.zeros(SLOTS)
+    for start_hour, end_hour, share in windows:
+        duty[int(start_hour / SLOT_HOURS):int(end_hour / SLOT_HOURS)] = share
+    return duty
+
+
+def _solar_profile() -> np.ndarray:
+    """Output per kW of array in each slot: a clear-sky bell between 06:30 and 19:30."""
+    hours = (np.arange(SLOTS) + 0.5) * SLOT_HOURS
+    return 0.8 * np.clip(np.sin(np.pi * (hours - 6.5) / 13), 0, None) ** 1.5
+
+
+def _battery_state_of_charge(with_solar: bool) -> np.ndarray:
+    """Expected state of charge in each slot: solar-charged batteries fill up from 09:00 to 15:00."""
+    if not with_solar:
+        return np.full(SLOTS, 0.9)
+    hours = np.arange(SLOTS) * SLOT_HOURS
+    return np.interp(hours, [0, 9, 15, 24], [0.4, 0.4, 1.0, 1.0])
+
+
+def _is_sheddable(appliance_name: str) -> bool:
+    priority = der_shed.DEFAULT_PRIORITY[der.APPLIANCE_MAPPING[appliance_name]]
+    return der_shed.NEVER_SHED < priority <= FLEET_SHED_MAX_PRIORITY
+
+
+def default_households() -> int:
+    """The fleet size matching the transformers' capacity: FLEET_HOUSEHOLDS_PER_KW per kW."""
+    capacity_kw = sum(transformer_load.get_capacity_kw(transformer_id) for transformer_id in meter_reading.TRANSFORMER_IDS)
+    return max(1, int(round(capacity_kw * FLEET_HOUSEHOLDS_PER_KW)))
+
+
+def _per_transformer(transformer_of: np.ndarray, weights: np.ndarray, transformers: int) -> np.ndarray:
+    return np.bincount(transformer_of, weights=weights, minlength=transformers)
+
+
+def simulate(households: int, event_start_hour: float = 17, event_hours: float = 3, seed: int = 0) -> dict:
+    """
+    Simulates a fleet of households over TRANSFORMER_IDS and returns the per-transformer load and
+    shed potential during the event, plus fleet totals and the fleet's hourly profile.
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    transformer_ids = list(meter_reading.TRANSFORMER_IDS)
+    transformers = len(transformer_ids)
+    capacities = np.array([transformer_load.get_capacity_kw(transformer_id) for transformer_id in transformer_ids])
+    transformer_of = rng.choice(transformers, size=households, p=capacities / capacities.sum())
+    shifts = np.arange(-MAX_SHIFT_SLOTS, MAX_SHIFT_SLOTS + 1)
+
+    consumption = np.zeros((transformers, SLOTS))
+    sheddable = np.zeros((transformers, SLOTS))
+    by_appliance = {}
+    for name, usage in APPLIANCE_USAGE.items():
+        owners = np.flatnonzero(rng.random(households) < APPLIANCE_OWNERSHIP.get(name, 0.0))
+        kw = der.APPLIANCE_NOMINAL_KW.get(name, 0.0) * rng.lognormal(0.0, 0.3, len(owners))
+        shift = rng.integers(0, len(shifts), len(owners))
+        # kW per (transformer, time shift), times the duty cycle shifted by each
+        weights = np.bincount(transformer_of[owners] * len(shifts) + shift, weights=kw, minlength=transformers * len(shifts))
+        duty = _duty_cycle(usage)
+        load = weights.reshape(transformers, len(shifts)) @ np.stack([np.roll(duty, offset) for offset in shifts])
+        consumption += load
+        if _is_sheddable(name):
+            sheddable += load
+        by_appliance[name] = load
+
+    with_solar = rng.random(households) < FLEET_SOLAR_SHARE
+    solar_kw = np.where(with_solar, FLEET_SOLAR_KW * rng.lognormal(0.0, 0.25, households), 0.0)
+    production = _per_transformer(transformer_of, solar_kw, transformers)[:, None] * _solar_profile()
+
+    battery_share = np.where(with_solar, FLEET_BATTERY_SHARE_WITH_SOLAR, FLEET_BATTERY_SHARE_WITHOUT_SOLAR)
+    with_battery = rng.random(households) < battery_share
+    batteries_solar = _per_transformer(transformer_of, with_battery & with_solar, transformers)
+    batteries_grid = _per_transformer(transformer_of, with_battery & ~with_solar, transformers)
+
+    # Discharge each battery can hold for an event starting in each slot
+    def discharge_kw(state_of_charge):
+        usable_kwh = np.clip(state_of_charge - FLEET_BATTERY_RESERVE, 0, None) * FLEET_BATTERY_KWH
+        return np.minimum(FLEET_BATTERY_KW, usable_kwh / max(event_hours, SLOT_HOURS))
+    battery = (batteries_solar[:, None] * discharge_kw(_battery_state_of_charge(True))
+               + batteries_grid[:, None] * discharge_kw(_battery_state_of_charge(False)))
+
+    net_load = consumption - production
+    first_slot = int(event_start_hour / SLOT_HOURS) % SLOTS
+    event_slots = (first_slot + np.arange(max(1, int(round(event_hours / SLOT_HOURS))))) % SLOTS
+    event_load = net_load[:, event_slots].mean(axis=1)
+    appliance_load = sheddable[:, event_slots].mean(axis=1)
+    event_sheddable = np.minimum(appliance_load, np.clip(event_load, 0, None))
+    # Share of each transformer's sheddable appliance load that counts towards its shed potential
+    shed_share = np.divide(event_sheddable, appliance_load, out=np.zeros(transformers), where=appliance_load > 0)
+    event_battery = battery[:, first_slot]
+    peak_slots = net_load.argmax(axis=1)
+    peak_load = net_load.max(axis=1)
+    households_per_transformer = np.bincount(transformer_of, minlength=transformers)
+
+    def time_of(slot):
+        minutes = int(slot) * 15
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+    transformers_report = [
+        {
+            "transformer_id": transformer_id,
+            "households": int(households_per_transformer[position]),
+            "capacity_kw": float(capacities[position]),
+            "peak_net_load_kw": round(float(peak_load[position]), 1),
+            "peak_time": time_of(peak_slots[position]),
+            "peak_utilization": round(float(peak_load[position] / capacities[position]), 3) if capacities[position] > 0 else None,
+            "event_net_load_kw": round(float(event_load[position]), 1),
+            "shed_potential_kw": round(float(event_sheddable[position] + event_battery[position]), 1),
+            "appliance_shed_kw": round(float(event_sheddable[position]), 1),
+            "battery_discharge_kw": round(float(event_battery[position]), 1),
+        }
+        for position, transformer_id in enumerate(transformer_ids)
+    ]
+    transformers_report.sort(key=lambda entry: entry["shed_potential_kw"], reverse=True)
+
+    def hourly(profile):
+        return [round(float(value), 1) for value in profile.sum(axis=0).reshape(24, 4).mean(axis=1)]
+
+    event_by_appliance = {name: float((load[:, event_slots].mean(axis=1) * shed_share).sum()) for name, load in by_appliance.items()}
+    return {
+        "households": households,
+        "with_solar": int(with_solar.sum()),
+        "with_battery": int(with_battery.sum()),
+        "event": {"start": time_of(first_slot), "hours": event_hours},
+        "fleet_shed_potential_kw": round(float((event_sheddable + event_battery).sum()), 1),
+        "fleet_battery_discharge_kw": round(float(event_battery.sum()), 1),
+        "fleet_event_net_load_kw": round(float(event_load.sum()), 1),
+        "event_shed_by_appliance_kw": {
+            name: round(value, 1)
+            for name, value in sorted(event_by_appliance.items(), key=lambda item: item[1], reverse=True)
+            if _is_sheddable(name)
+        },
+        "transformers": transformers_report,
+        "hourly_net_load_kw": hourly(net_load),  # fleet, per local hour 0..23
+        "hourly_solar_kw": hourly(production),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }
+
+
+def simulate_fleet_flexibility(households: int = 0, event_start_hour: float = 17, event_hours: float = 3, seed: int = 0) -> dict:
+    """
+    Simulates a fleet of households (appliances, rooftop solar, home batteries) over the utility's
+    transformers and estimates how much load each transformer could shed during a demand flexibility
+    event, e.g. before enrolling customers in the Home Battery Discharge Program.
+    This function will be used as a tool by the agent.
+
+    Args:
+        households: Number of households to simulate (0 to size the fleet from the transformers' capacity).
+        event_start_hour: Local hour the event starts, e.g. 17 for 5 pm.
+        event_hours: Duration of the event in hours.
+        seed: Random seed; the same seed gives the same fleet.
+
+    Returns:
+        The shed potential (appliances and battery discharge) and peak load per transformer, most
+        potential first, with fleet totals and the fleet's hourly net load, or an error message.
+    """
+    if not 0 <= int(households) <= 10_000_000:
+        return "Error: The number of households must be between 1 and 10,000,000 (0 for the default fleet)."
+    if not 0 < float(event_hours) <= 24 or not 0 <= float(event_start_hour) < 24:
+        return "Error: The event must start between hour 0 and 24 and last between 0 and 24 hours."
+    return simulate(int(households) or default_households(), float(event_start_hour), float(event_hours), int(seed))
+
+
+@async_variant(simulate_fleet_flexibility)
+async def simulate_fleet_flexibility_async(households: int = 0, event_start_hour: float = 17, event_hours: float = 3, seed: int = 0) -> dict:
+    # CPU-bound: run off the event loop
+    return await asyncio.to_thread(simulate_fleet_flexibility, households, event_start_hour, event_hours, seed)
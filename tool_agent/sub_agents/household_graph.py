@@ -0,0 +1,183 @@
+from dotenv import load_dotenv
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from . import durable_store
+
+load_dotenv()
+
+# Household graph cache.
+# get_er_house_hold reads a household's energy resource with its meter, the meter's parent and
+# children and its appliances: a joined read on the simulator, repeated on every "show my home setup"
+# turn although the graph only changes when we change it. Graphs are kept per meter id (the id the
+# GET is made with) and served from memory until one of our own writes touches the household:
+#   - create_er_house_hold: the energy resource of that meter
+#   - create_der, toggle_der and bulk dispatches: the energy resource the DER is behind
+#   - create_meter_data: the new meter and its parent
+# Writes name the energy resource rather than the meter, so energy resource ids are mapped to the
+# meters they were fetched or created with (restored on startup from the durable store's
+# energy_resources table). A graph fetched while its household is being written is not kept, so a
+# read racing a write cannot bring the old graph back.
+#
+# The graphs, the energy resource -> meter bindings and the invalidation counters are each kept for
+# at most HOUSEHOLD_GRAPH_MAX_ENTRIES meters / energy resources, least recently used dropped first.
+# Dropping a binding invalidates its meters' graphs, so a graph is never cached without the binding
+# that would invalidate it; dropped counters raise a floor that every unknown meter starts from, so
+# a fetch in flight across a dropped counter is not kept either.
+#
+# Changes made by someone else (the simulator's own UI, another backend) are only seen once a graph
+# is older than HOUSEHOLD_GRAPH_TTL seconds. Error responses are never cached. HOUSEHOLD_GRAPH_TTL=0
+# disables the cache.
+HOUSEHOLD_GRAPH_TTL = float(os.getenv("HOUSEHOLD_GRAPH_TTL", "900"))
+HOUSEHOLD_GRAPH_MAX_ENTRIES = int(os.getenv("HOUSEHOLD_GRAPH_MAX_ENTRIES", "4096"))
+
+
+class HouseholdGraphCache:
+    """
+    Household graphs per meter id, least recently used dropped first, invalidated by our own writes.
+    """
+
+    def __init__(self, ttl: float = HOUSEHOLD_GRAPH_TTL, max_entries: int = HOUSEHOLD_GRAPH_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()    # meter id -> (graph, fetched_at)
+        self._versions = OrderedDict()   # meter id -> clock of its last invalidation
+        self._clock = 0
+        self._version_floor = 0          # version of the meters without a counter
+        self._er_meters = OrderedDict()  # energy resource id -> {meter ids}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _version(self, key) -> int:
+        # Called with the lock held
+        return self._versions.get(key, self._version_floor)
+
+    def _bind(self, er_key, meter_key):
+        # Called with the lock held
+        meters = self._er_meters.get(er_key)
+        if meters is None:
+            meters = self._er_meters[er_key] = set()
+        meters.add(meter_key)
+        self._er_meters.move_to_end(er_key)
+        while len(self._er_meters) > self.max_entries:
+            _, dropped = self._er_meters.popitem(last=False)
+            for dropped_key in dropped:
+                self._invalidate(dropped_key)
+
+    def _lookup(self, key):
+        """Returns (graph or None, version of the key)."""
+        with self._lock:
+            version = self._version(key)
+            entry = self._entries.get(key) if self.ttl > 0 else None
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], version
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None, version
+
+    def _store(self, key, version, graph):
+        if not isinstance(graph, dict) or self.ttl <= 0:
+            return graph
+        with self._lock:
+            if self._version(key) != version:
+                # Invalidated while it was fetched
+                return graph
+            self._entries[key] = (graph, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            data = graph.get("data")
+            if isinstance(data, dict) and data.get("id") is not None:
+                self._bind(str(data["id"]), key)
+        return graph
+
+    def get(self, meter_id, fetch):
+        """
+        Returns the household graph of meter_id, calling fetch() when it is not cached.
+
+        Args:
+            meter_id: The meter id the graph is fetched with.
+            fetch: A callable returning the decoded response (dict) or an error message string.
+        """
+        key = str(meter_id)
+        graph, version = self._lookup(key)
+        if graph is not None:
+            return graph
+        return self._store(key, version, fetch())
+
+    async def aget(self, meter_id, afetch):
+        """
+        Async counterpart of get. afetch is a coroutine function.
+        """
+        key = str(meter_id)
+        graph, version = self._lookup(key)
+        if graph is not None:
+            return graph
+        return self._store(key, version, await afetch())
+
+    def _invalidate(self, key):
+        # Called with the lock held
+        self._clock += 1
+        self._versions[key] = self._clock
+        self._versions.move_to_end(key)
+        while len(self._versions) > self.max_entries:
+            _, dropped = self._versions.popitem(last=False)
+            self._version_floor = max(self._version_floor, dropped)
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def bind_energy_resource(self, er_id, meter_id):
+        """Records that energy resource er_id is the household of meter_id."""
+        with self._lock:
+            self._bind(str(er_id), str(meter_id))
+
+    def invalidate_meter(self, meter_id):
+        if meter_id is None:
+            return
+        with self._lock:
+            self._invalidate(str(meter_id))
+
+    def invalidate_energy_resource(self, er_id):
+        """Drops the graphs of the household of energy resource er_id."""
+        if er_id is None:
+            return
+        key = str(er_id)
+        with self._lock:
+            for meter_key in list(self._er_meters.get(key, ())):
+                self._invalidate(meter_key)
+            if key not in self._er_meters:
+                # Unknown energy resource: the graph may have been fetched with its own id
+                self._invalidate(key)
+
+    def restore(self, energy_resources):
+        """Adds (er_id, meter_id) rows."""
+        with self._lock:
+            for er_id, meter_id in energy_resources:
+                if meter_id is not None:
+                    self._bind(str(er_id), str(meter_id))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"graphs": len(self._entries), "bindings": len(self._er_meters), "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations}
+
+
+graphs = HouseholdGraphCache()
+
+
+def _restore():
+    if not durable_store.store.enabled:
+        return
+    try:
+        graphs.restore(durable_store.store.rows("SELECT er_id, meter_id FROM energy_resources"))
+    except sqlite3.Error as e:
+        print(f"Warning: Could not restore the household graph bindings from {durable_store.store.path}: {e}")
+
+
+_restore()
@@ -0,0 +1,238 @@
+import requests
+from requests.adapters import HTTPAdapter
+import httpx
+from dotenv import load_dotenv
+import os
+import threading
+import weakref
+import asyncio
+from urllib.parse import urlsplit
+from . import singleflight
+
+load_dotenv()
+
+# Shared HTTP client for every sub_agent.
+# One requests.Session (and therefore one keep-alive connection pool) is kept per upstream host,
+# so repeated search/select/init/confirm/status calls reuse the same TCP + TLS connection
+# instead of paying the handshake on every tool call.
+
+# Number of hosts to keep pools for, and max connections kept alive per host.
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+
+# Limits for the asyncio client used by the async tools. One AsyncClient is shared per event loop
+# and pools connections per host internally, so one process can keep hundreds of calls in flight.
+ASYNC_MAX_CONNECTIONS = int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "200"))
+ASYNC_MAX_KEEPALIVE = int(os.getenv("ASYNC_HTTP_MAX_KEEPALIVE", str(HTTP_POOL_MAXSIZE)))
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# (connect timeout, read timeout) in seconds per action.
+# Each entry can be overridden with an env variable, e.g. HTTP_TIMEOUT_SEARCH=20
+DEFAULT_CONNECT_TIMEOUT = 5.0
+ACTION_TIMEOUTS = {
+    "search": 20.0,
+    "select": 15.0,
+    "init": 15.0,
+    "confirm": 30.0,
+    "status": 10.0,
+    "meter": 15.0,
+    "meter_history": 30.0,
+    "energy_resource": 15.0,
+    "der": 15.0,
+    "utility": 20.0,
+}
+DEFAULT_READ_TIMEOUT = 15.0
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# event loop -> httpx.AsyncClient
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _host_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def get_timeout(action: str) -> tuple[float, float]:
+    """Returns the (connect, read) timeout tuple for the given action."""
+    env_value = os.getenv(f"HTTP_TIMEOUT_{action.upper()}")
+    if env_value:
+        try:
+            return DEFAULT_CONNECT_TIMEOUT, float(env_value)
+        except ValueError:
+            print(f"Warning: Ignoring invalid HTTP_TIMEOUT_{action.upper()} value: {env_value}")
+    return DEFAULT_CONNECT_TIMEOUT, ACTION_TIMEOUTS.get(action, DEFAULT_READ_TIMEOUT)
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    Returns the pooled session for the host of the given URL, creating it on first use.
+    """
+    key = _host_key(url)
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[key] = session
+    return session
+
+
+def post(url: str, action: str, **kwargs) -> requests.Response:
+    """
+    Sends a POST request through the pooled session for the URL's host.
+
+    Args:
+        url: The full endpoint URL.
+        action: The action name used to pick the timeout (e.g. "search", "confirm", "meter").
+        **kwargs: Passed through to requests (data, json, headers, params...).
+
+    Returns:
+        The requests.Response object. Errors raise the usual requests.exceptions.
+    """
+    kwargs.setdefault("timeout", get_timeout(action))
+    return get_session(url).post(url, **kwargs)
+
+
+def get(url: str, action: str, **kwargs) -> requests.Response:
+    """
+    Sends a GET request through the pooled session for the URL's host.
+
+    Args:
+        url: The full endpoint URL.
+        action: The action name used to pick the timeout (e.g. "meter_history", "utility").
+        **kwargs: Passed through to requests (headers, params...).
+
+    Returns:
+        The requests.Response object. Errors raise the usual requests.exceptions.
+    """
+    kwargs.setdefault("timeout", get_timeout(action))
+    return get_session(url).get(url, **kwargs)
+
+
+def request_json(method: str, url: str, action: str, text_fallback: bool = False, coalesce: bool = False, **kwargs) -> dict | str:
+    """
+    Sends a request through the pooled session and decodes the JSON body.
+
+    Args:
+        method: "GET" or "POST".
+        url: The full endpoint URL.
+        action: The action name used to pick the timeout.
+        text_fallback: If True, a non-JSON body is returned as text instead of an error.
+        coalesce: If True, concurrent identical requests share one upstream call (read-only calls only).
+        **kwargs: Passed through to requests (data, json, headers, params...).
+
+    Returns:
+        The decoded JSON response, or an error message string.
+    """
+    if coalesce:
+        key = singleflight.request_key(method, url, kwargs.get("params"), kwargs.get("data"), kwargs.get("json"))
+        return singleflight.flights.do(key, lambda: _request_json(method, url, action, text_fallback, **kwargs), action)
+    return _request_json(method, url, action, text_fallback, **kwargs)
+
+
+def _request_json(method: str, url: str, action: str, text_fallback: bool, **kwargs) -> dict | str:
+    response = None
+    try:
+        kwargs.setdefault("timeout", get_timeout(action))
+        response = get_session(url).request(method, url, **kwargs)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.HTTPError as http_err:
+        error_details = ""
+        try:
+            error_details = response.text
+        except Exception:
+            pass
+        return f"HTTP error occurred: {http_err} - {error_details}"
+    except ValueError as json_err:
+        # Checked before RequestException: requests' JSONDecodeError derives from both
+        if response is None:
+            # e.g. InvalidURL, raised before any response was received
+            return f"Error calling API: {json_err}"
+        error_details = response.text
+        if text_fallback:
+            return error_details if error_details else "Success (No content in response)"
+        return f"Error decoding JSON response: {json_err} - Response was: {error_details}"
+    except requests.exceptions.RequestException as e:
+        return f"Error calling API: {e}"
+
+
+def is_error(response_data) -> bool:
+    """True for the error message strings returned by request_json / arequest_json."""
+    return isinstance(response_data, str) and response_data.startswith(("Error", "HTTP error occurred"))
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Returns the httpx.AsyncClient bound to the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=ASYNC_MAX_KEEPALIVE,
+            ),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def arequest_json(method: str, url: str, action: str, text_fallback: bool = False, coalesce: bool = False, **kwargs) -> dict | str:
+    """
+    Async counterpart of request_json. Never blocks the event loop on the upstream round-trip.
+
+    Returns:
+        The decoded JSON response, or an error message string.
+    """
+    if coalesce:
+        key = singleflight.request_key(method, url, kwargs.get("params"), kwargs.get("data"), kwargs.get("json"))
+        return await singleflight.flights.ado(key, lambda: _arequest_json(method, url, action, text_fallback, **kwargs), action)
+    return await _arequest_json(method, url, action, text_fallback, **kwargs)
+
+
+async def _arequest_json(method: str, url: str, action: str, text_fallback: bool, **kwargs) -> dict | str:
+    response = None
+    try:
+        connect_timeout, read_timeout = get_timeout(action)
+        kwargs.setdefault("timeout", httpx.Timeout(read_timeout, connect=connect_timeout))
+        response = await get_async_client().request(method, url, **kwargs)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as http_err:
+        return f"HTTP error occurred: {http_err} - {response.text}"
+    except httpx.HTTPError as e:
+        return f"Error calling API: {e}"
+    except ValueError as json_err:
+        if response is None:
+            return f"Error calling API: {json_err}"
+        error_details = response.text
+        if text_fallback:
+            return error_details if error_details else "Success (No content in response)"
+        return f"Error decoding JSON response: {json_err} - Response was: {error_details}"
+
+
+def close_all():
+    """Closes every pooled session. Mostly useful for tests and clean shutdowns."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+async def aclose_all():
+    """Closes the async client of the running event loop."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,51 @@
+from dotenv import load_dotenv
+import os
+import threading
+from . import durable_store
+
+load_dotenv()
+
+# Meter code allocation.
+# Meter codes used to come from an unsynchronized global counter: two confirms running on different
+# threads of the ADK server could mint the same METERxxx code, and the simulator rejected the second
+# POST. Codes are now handed out from blocks of METER_CODE_BLOCK_SIZE numbers reserved per worker:
+# each thread takes numbers from its own block without any locking, and only reserving the next
+# block is serialized, through an atomic increment of the persisted high-water mark in the durable
+# store, so worker processes sharing the database never overlap and a restart never reuses a code.
+# Numbers left in a worker's block at shutdown are skipped, which only leaves gaps in the codes.
+METER_CODE_BLOCK_SIZE = int(os.getenv("METER_CODE_BLOCK_SIZE", "100"))
+
+
+class BlockAllocator:
+    """
+    Hands out increasing integers from blocks reserved per thread.
+    """
+
+    def __init__(self, name: str, floor: int = 0, block_size: int = METER_CODE_BLOCK_SIZE):
+        self.name = name
+        self.floor = floor
+        self.block_size = block_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # In-process high-water mark, used when the durable store is disabled
+        self._high_water = max(floor, int(durable_store.meta.get(name, 0)))
+        self.blocks = 0
+
+    def _reserve(self) -> list:
+        with self._lock:
+            high_water = durable_store.reserve(self.name, self.block_size, self._high_water)
+            if high_water is None:
+                high_water = self._high_water + self.block_size
+            self._high_water = high_water
+            self.blocks += 1
+        # [next value, end of the block]
+        return [high_water - self.block_size + 1, high_water + 1]
+
+    def next(self) -> int:
+        """Returns a number no other thread or worker process sharing the database gets."""
+        block = getattr(self._local, "block", None)
+        if block is None or block[0] >= block[1]:
+            block = self._local.block = self._reserve()
+        value = block[0]
+        block[0] += 1
+        return value
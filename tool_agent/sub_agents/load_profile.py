@@ -0,0 +1,153 @@
+from dotenv import load_dotenv
+import os
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import numpy as np
+from google.adk.tools import ToolContext
+from . import meter_timeseries
+from . import meter_reading
+
+load_dotenv()
+
+# Load-profile analytics over the cached meter history.
+# "When do I use the most power?" used to be answered by the model reading raw reading lists. The
+# analytics tool computes the answer with NumPy over the meter's cached time series instead (hourly
+# and day-of-week profiles, peak windows, base load, percentiles, daily and monthly totals) and
+# returns a summary of a few hundred bytes, whatever the length of the history.
+#
+# Readings are bucketed in local time (LOAD_PROFILE_TIMEZONE, the simulator's meters are in San
+# Francisco); the UTC offset is looked up once per day covered, not per reading.
+LOAD_PROFILE_TIMEZONE = os.getenv("LOAD_PROFILE_TIMEZONE", "America/Los_Angeles")
+# Length of the peak window, in hours
+LOAD_PROFILE_PEAK_WINDOW_HOURS = int(os.getenv("LOAD_PROFILE_PEAK_WINDOW_HOURS", "3"))
+LOAD_PROFILE_MONTHS = int(os.getenv("LOAD_PROFILE_MONTHS", "12"))
+
+_DAY = 86400
+_WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def _local_times(timestamps: np.ndarray, zone: ZoneInfo) -> np.ndarray:
+    """Returns the timestamps shifted to local time (still int64 seconds)."""
+    first_day = int(timestamps[0]) // _DAY
+    day_count = int(timestamps[-1]) // _DAY - first_day + 1
+    offsets = np.fromiter(
+        (datetime.fromtimestamp((first_day + day) * _DAY + _DAY // 2, zone).utcoffset().total_seconds() for day in range(day_count)),
+        dtype=np.int64, count=day_count,
+    )
+    return timestamps + offsets[timestamps // _DAY - first_day]
+
+
+def _round(values, digits: int = 3) -> list:
+    return [round(float(value), digits) for value in values]
+
+
+def analyze(timestamps: np.ndarray, kwh: np.ndarray, timezone_name: str = LOAD_PROFILE_TIMEZONE) -> dict:
+    """
+    Returns the load-profile summary of a sorted series of interval readings (epoch seconds, kWh per interval).
+    """
+    if len(timestamps) < 2:
+        return {"error": "Not enough readings to build a load profile."}
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    kwh = np.asarray(kwh, dtype=np.float64)
+    interval = int(np.median(np.diff(timestamps)))
+    if interval <= 0:
+        return {"error": "Readings have no regular interval."}
+    kw = kwh * (3600.0 / interval)
+
+    local = _local_times(timestamps, ZoneInfo(timezone_name))
+    local_days = local // _DAY
+    day_index = local_days - local_days[0]
+    hours = (local % _DAY) // 3600
+    weekdays = (local_days + 3) % 7  # 1970-01-01 was a Thursday
+
+    # Average kWh per hour of the day: total kWh in that hour over the number of days covered
+    days_covered = int(day_index[-1]) + 1
+    hourly_kwh = np.bincount(hours, weights=kwh, minlength=24) / days_covered
+    daily_kwh = np.bincount(day_index, weights=kwh)
+    daily_counts = np.bincount(day_index)
+    daily_kwh = daily_kwh[daily_counts > 0]
+    day_starts = np.r_[True, np.diff(local_days) != 0]  # first reading of each local day
+    weekday_days = np.bincount(weekdays[day_starts], minlength=7)
+    weekday_totals = np.bincount(weekdays, weights=kwh, minlength=7)
+    weekday_avg = np.divide(weekday_totals, weekday_days, out=np.zeros(7), where=weekday_days > 0)
+
+    # Peak window of the average day (circular: a window may span midnight)
+    window = max(1, min(24, LOAD_PROFILE_PEAK_WINDOW_HOURS))
+    window_sums = np.convolve(np.r_[hourly_kwh, hourly_kwh[:window - 1]], np.ones(window), mode="valid")[:24]
+    peak_start = int(np.argmax(window_sums))
+    low_start = int(np.argmin(window_sums))
+
+    peak_reading = int(np.argmax(kw))
+    percentiles = np.percentile(kw, [5, 50, 90, 95, 99])
+
+    # Calendar months in local time, the last LOAD_PROFILE_MONTHS of them. The month is computed
+    # once per covered day and the readings are already in order, so no sort is needed
+    day_months = (local_days[0] + np.arange(days_covered)).astype("datetime64[D]").astype("datetime64[M]")
+    month_starts = np.r_[True, day_months[1:] != day_months[:-1]]
+    month_keys = day_months[month_starts]
+    day_month_index = np.cumsum(month_starts) - 1
+    month_index = day_month_index[day_index]
+    month_totals = np.bincount(month_index, weights=kwh, minlength=len(month_keys))
+    month_days = np.bincount(month_index[day_starts], minlength=len(month_keys))
+    month_keys, month_totals, month_days = month_keys[-LOAD_PROFILE_MONTHS:], month_totals[-LOAD_PROFILE_MONTHS:], month_days[-LOAD_PROFILE_MONTHS:]
+    deltas = np.full(len(month_totals), np.nan)
+    deltas[1:] = np.divide(month_totals[1:] - month_totals[:-1], month_totals[:-1], out=np.full(len(month_totals) - 1, np.nan), where=month_totals[:-1] > 0)
+
+    return {
+        "timezone": timezone_name,
+        "first_reading": np.datetime_as_string(np.datetime64(int(timestamps[0]), "s")) + "Z",
+        "last_reading": np.datetime_as_string(np.datetime64(int(timestamps[-1]), "s")) + "Z",
+        "readings": int(len(timestamps)),
+        "interval_minutes": interval // 60,
+        "total_kwh": round(float(kwh.sum()), 2),
+        "hourly_profile_kwh": _round(hourly_kwh),  # average kWh per local hour 0..23
+        "weekday_profile_kwh": dict(zip(_WEEKDAYS, _round(weekday_avg, 2))),  # average kWh per day
+        "peak_window": {"start_hour": peak_start, "end_hour": (peak_start + window) % 24, "avg_kwh": round(float(window_sums[peak_start]), 3)},
+        "lowest_window": {"start_hour": low_start, "end_hour": (low_start + window) % 24, "avg_kwh": round(float(window_sums[low_start]), 3)},
+        "peak_demand": {"kw": round(float(kw[peak_reading]), 3), "at": np.datetime_as_string(np.datetime64(int(timestamps[peak_reading]), "s")) + "Z"},
+        "base_load_kw": round(float(percentiles[0]), 3),  # 5th percentile of demand
+        "demand_percentiles_kw": dict(zip(["p5", "p50", "p90", "p95", "p99"], _round(percentiles))),
+        "daily_kwh": {"avg": round(float(daily_kwh.mean()), 2), "min": round(float(daily_kwh.min()), 2), "max": round(float(daily_kwh.max()), 2)},
+        "monthly": [
+            {
+                "month": str(month),
+                "kwh": round(float(total), 2),
+                "days": int(days),
+                "change_pct": None if np.isnan(delta) else round(float(delta) * 100, 1),
+            }
+            for month, total, days, delta in zip(month_keys, month_totals, month_days, deltas)
+        ],
+    }
+
+
+def _profile_output(meter_id, series, unparsed):
+    if unparsed is not None:
+        if isinstance(unparsed, str):
+            return unparsed
+        return "Error: The meter history has no readings that can be analyzed."
+    timestamps, kwh = series.arrays()
+    summary = analyze(timestamps, kwh)
+    if "error" in summary:
+        return f"Error: {summary['error']}"
+    result = {"meter_id": meter_id, **summary}
+    warning = meter_timeseries.stale_warning(series)
+    if warning:
+        result["warning"] = warning
+    return result
+
+
+async def analyze_load_profile(tool_context: ToolContext = None) -> dict:
+    """
+    Analyzes the electricity use of the latest created meter: average use per hour of the day and
+    per day of the week, the peak and lowest usage windows, peak demand, base load, demand
+    percentiles, daily totals and monthly totals with their month-over-month change.
+    This function will be used as a tool by the agent.
+
+    Returns:
+        A compact summary of the meter's load profile, or an error message.
+    """
+    meter_id, error_msg = meter_reading._latest_meter_id(tool_context)
+    if error_msg:
+        return error_msg
+    series, unparsed = await meter_timeseries.cache.arefresh(meter_id, meter_reading.API_METER_HISTORY_ENDPOINT + f"/{meter_id}")
+    return _profile_output(meter_id, series, unparsed)
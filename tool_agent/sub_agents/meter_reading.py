@@ -1,24 +1,33 @@
-import requests
-from google.adk.agents import Agent
+from google.adk.tools import ToolContext
 from dotenv import load_dotenv
 import os
-import uuid
-from datetime import datetime, timezone
-import json
+from . import http_client
+from . import beckn_payloads
+from . import state_store
+from . import id_allocator
+from . import transformer_load
+from . import household_graph
+from . import meter_timeseries
+from . import downsampling
 
 load_dotenv()
 
 API_METER_ENDPOINT = "http://world-engine-team7.becknprotocol.io/meter-data-simulator/meters"
 API_METER_HISTORY_ENDPOINT = "http://world-engine-team7.becknprotocol.io/meter-data-simulator/meter-datasets"
 
-# Global list to store meter IDs from responses
-meter_ids_list = []
-# Global counter for meter codes, starting from 4
-current_meter_id_counter = 328
+# The meter history is downsampled to a number of points chosen per request (see downsampling.py):
+# METER_HISTORY_POINTS by default, never more than METER_HISTORY_MAX_POINTS, so the payload stays
+# bounded however long the history grows.
+METER_HISTORY_POINTS = int(os.getenv("METER_HISTORY_POINTS", "200"))
+METER_HISTORY_MAX_POINTS = int(os.getenv("METER_HISTORY_MAX_POINTS", "2000"))
+METER_HISTORY_DOWNSAMPLING = os.getenv("METER_HISTORY_DOWNSAMPLING", "lttb")
+
+# Meter code numbers, starting after 328 and handed out in blocks per worker (see id_allocator.py)
+METER_CODES = id_allocator.BlockAllocator("meter_code", floor=328)
 
 # New global variables for transformer IDs
 TRANSFORMER_IDS = [180,181,182,183,184,185,186,187,188,189,175,176,177,178,179]
-current_transformer_index = 0
+transformer_load.index.add_transformers(TRANSFORMER_IDS)
 
 
 METER_CREATE_TEMPLATE = """{
@@ -37,142 +46,155 @@ METER_CREATE_TEMPLATE = """{
         "transformer": "{{transformer}}"
     }
 }"""
+METER_CREATE_PAYLOAD = beckn_payloads.PayloadBuilder(METER_CREATE_TEMPLATE, code=("data", "code"), transformer=("data", "transformer"))
+
+def _build_meter_payload():
+    """
+    Builds the meter creation payload with the next meter code and transformer.
+    The meter code is auto-incremented and the transformer is the least-loaded one.
+    """
+    bap_id = os.getenv("bap_id")
+    bap_uri = os.getenv("bap_uri")
+    bpp_id = os.getenv("bpp_id")
+    bpp_uri = os.getenv("bpp_uri")
+
+    if not all([bap_id, bap_uri, bpp_id, bpp_uri]):
+        return None, None, None, "Error: BAP_ID, BAP_URI, BPP_ID, or BPP_URI environment variables are not set."
+
+    # Take the next meter code number and format the new meter code
+    code = f"METER{METER_CODES.next():03}"
+
+    # Place the meter on the least-loaded transformer
+    # (null for the entire transformer field if TRANSFORMER_IDS is empty)
+    transformer = transformer_load.index.place()
+
+    payload, error_msg = METER_CREATE_PAYLOAD.build(code=code, transformer=transformer)
+    if error_msg:
+        transformer_load.index.release(transformer)
+    return payload, code, transformer, error_msg
+
+
+def _parent_id(meter: dict):
+    # The parent as an id, or a populated {"id": ...} / {"data": {"id": ...}} relation
+    parent = meter.get("parent", (meter.get("attributes") or {}).get("parent"))
+    while isinstance(parent, dict):
+        parent = parent.get("data") if "data" in parent else parent.get("id")
+    return parent
+
+
+def _record_meter(response_data, code, transformer, tool_context):
+    # Extract and store the ID
+    if isinstance(response_data, dict) and "data" in response_data and "id" in response_data["data"]:
+        state_store.record(tool_context, "meter", response_data["data"]["id"], details={"code": code, "transformer": transformer})
+        transformer_load.index.bind_meter(response_data["data"]["id"], transformer)
+        # The new meter's household, and its parent's children
+        household_graph.graphs.invalidate_meter(response_data["data"]["id"])
+        household_graph.graphs.invalidate_meter(_parent_id(response_data["data"]))
+    else:
+        # The meter was not created, its placement is given back
+        transformer_load.index.release(transformer)
+
+
+def _latest_meter_id(tool_context):
+    meter_id = state_store.latest(tool_context, "meter")
+    if meter_id is None:
+        return None, "Error: No meter IDs available in the list. Please create a meter first."
+    return meter_id, None
+
+
+async def create_meter(tool_context):
+    """
+    Creates a meter with the next meter code on the least-loaded transformer, and records it for
+    tool_context (a ToolContext or a state store scope).
+
+    Returns:
+        (response_data, error_message)
+    """
+    payload, code, transformer, error_msg = _build_meter_payload()
+    if error_msg:
+        return None, error_msg
+    response_data = await http_client.arequest_json("POST", API_METER_ENDPOINT, action="meter", data=payload, headers=http_client.JSON_HEADERS)
+    _record_meter(response_data, code, transformer, tool_context)
+    return response_data, None
 
-def create_meter_data(search_query: str) -> str:
+
+async def create_meter_data(search_query: str, tool_context: ToolContext = None) -> str:
     """
     Creates a meter data based on a given search query.
     The meter code is auto-incremented for each request.
-    The ID from the response is stored in a global list.
-    The transformer ID is selected cyclically from a predefined list.
+    The ID from the response is stored in the user's state.
+    The transformer is the least-loaded one of a predefined list (meters plus DER kW).
     This function will be used as a tool by the agent.
 
      Returns:
         A string representation of the JSON response from the API, containing all meter data,
         or an error message.
     """
-    global current_meter_id_counter
-    global meter_ids_list
-    global current_transformer_index
-
     try:
-        bap_id = os.getenv("bap_id")
-        bap_uri = os.getenv("bap_uri")
-        bpp_id = os.getenv("bpp_id")
-        bpp_uri = os.getenv("bpp_uri")
-
-        if not all([bap_id, bap_uri, bpp_id, bpp_uri]):
-            return "Error: BAP_ID, BAP_URI, BPP_ID, or BPP_URI environment variables are not set."
-
-        transaction_id = str(uuid.uuid4())
-        message_id = str(uuid.uuid4())
-        timestamp = datetime.now(timezone.utc).isoformat()
-
-        # Increment meter ID counter and format the new meter code
-        current_meter_id_counter += 1
-        code = f"METER{current_meter_id_counter:03}"
-
-        # Prepare payload by parsing the template string into a dictionary
-        payload_dict = json.loads(METER_CREATE_TEMPLATE)
-        # Update the meter code
-        payload_dict["data"]["code"] = code
-        
-        # Assign transformer ID cyclically
-        if TRANSFORMER_IDS: # Check if the list is not empty
-            transformer = TRANSFORMER_IDS[current_transformer_index]
-            # payload_dict["data"]["transformer"] is now {"id": "{{transformer_id_placeholder}}"}
-            # Update the value of the "id" key within this dictionary.
-            payload_dict["data"]["transformer"] = transformer
-            current_transformer_index = (current_transformer_index + 1) % len(TRANSFORMER_IDS)
-        else:
-            # Default to null for the entire transformer field if TRANSFORMER_IDS is empty
-            # This will replace the {"id": "{{transformer_id_placeholder}}"} object.
-            payload_dict["data"]["transformer"] = None
-        
-        # Convert the dictionary back to a JSON string for the request
-        current_payload = json.dumps(payload_dict)
-        
-        # The original replacements for context variables are not in the template anymore.
-        # If they were intended to be part of the payload sent to API_METER_ENDPOINT,
-        # they should be added to the `payload_dict` before `json.dumps`.
-        # For now, assuming they are not needed directly in this specific payload.
-        # Example: If they were needed in a context block (not shown in METER_CREATE_TEMPLATE):
-        # payload_dict['context'] = {
-        #     "bap_id": bap_id, "bap_uri": bap_uri, "bpp_id": bpp_id, "bpp_uri": bpp_uri,
-        #     "transaction_id": transaction_id, "message_id": message_id, "timestamp": timestamp
-        # }
-        # current_payload = json.dumps(payload_dict)
-
-
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(API_METER_ENDPOINT, data=current_payload, headers=headers)
-        response.raise_for_status()
-        
-        response_data = response.json()
-        
-        # Extract and store the ID
-        if "data" in response_data and "id" in response_data["data"]:
-            meter_ids_list.append(response_data["data"]["id"])
-            # You can print or log the list to see it grow:
-            # print(f"Current meter IDs: {meter_ids_list}")
-        
-        return response_data
-    except requests.exceptions.HTTPError as http_err:
-        error_details = ""
-        try:
-            error_details = response.text
-        except Exception:
-            pass
-        return f"HTTP error occurred: {http_err} - {error_details}"
-    except requests.exceptions.RequestException as e:
-        return f"Error calling API: {e}"
-    except ValueError as json_err: # Catch errors from json.loads or response.json()
-        error_details = ""
-        try:
-            # If response object exists, try to get its text
-            if 'response' in locals() and response is not None:
-                error_details = response.text
-            else: # Otherwise, the error might be from parsing METER_CREATE_TEMPLATE
-                error_details = "Could not parse METER_CREATE_TEMPLATE or API response"
-        except Exception:
-            pass
-        return f"Error decoding JSON: {json_err} - Details: {error_details}"
-    except Exception as e: # Catch any other unexpected errors
+        response_data, error_msg = await create_meter(tool_context)
+        return error_msg or response_data
+    except Exception as e:
         return f"An unexpected error occurred: {e}"
 
 
-def get_meter_history() -> str:
+def _history_output(meter_id, series, unparsed, points=None, method=None, start=None, end=None):
+    if unparsed is not None:
+        # Error message, or a response without recognizable readings: returned as is
+        return unparsed
+    points = min(max(int(points or METER_HISTORY_POINTS), 1), METER_HISTORY_MAX_POINTS)
+    method = method or METER_HISTORY_DOWNSAMPLING
+    timestamps, kwh = series.window(start, end)
+    try:
+        sampled_timestamps, sampled_kwh = downsampling.downsample(timestamps, kwh, points, method)
+    except ValueError as e:
+        return f"Error: {e}"
+    result = {
+        "meter_id": meter_id,
+        "count": len(timestamps),  # readings in the history
+        "points": len(sampled_timestamps),  # readings returned
+        "method": method if len(sampled_timestamps) < len(timestamps) else "none",
+        "readings": meter_timeseries.to_readings(sampled_timestamps, sampled_kwh),  # [[ISO time, kWh], ...]
+    }
+    warning = meter_timeseries.stale_warning(series)
+    if warning:
+        result["warning"] = warning
+    return result
+
+
+async def get_meter_history(points: int = METER_HISTORY_POINTS, method: str = METER_HISTORY_DOWNSAMPLING, tool_context: ToolContext = None) -> str:
     """
-    Retrieves the history of meter readings for the latest created meter ID.
+    Retrieves the history of meter readings for the latest created meter ID, downsampled to at most
+    the requested number of points.
+
+    Args:
+        points: Max readings to return (more for a detailed answer, fewer for a quick overview).
+        method: "lttb" to keep the shape of the curve, or "minmax" to keep the lowest and highest
+            reading of every interval.
 
     Returns:
-        A string representation of the JSON response from the API, containing all meter history data,
+        The meter ID, its number of readings and the returned readings as [time, kWh] pairs, oldest first,
         or an error message if no meter IDs are available or an API error occurs.
     """
-    global meter_ids_list
+    # Get the latest meter ID of this user
+    latest_meter_id, error_msg = _latest_meter_id(tool_context)
+    if error_msg:
+        return error_msg
+    # Served from the local time-series cache, which only fetches readings newer than its last one
+    series, unparsed = await meter_timeseries.cache.arefresh(latest_meter_id, API_METER_HISTORY_ENDPOINT + f"/{latest_meter_id}")
+    return _history_output(latest_meter_id, series, unparsed, points, method)
 
-    if not meter_ids_list:
-        return "Error: No meter IDs available in the list. Please create a meter first."
 
-    try:
-        # Get the latest meter ID from the list
-        latest_meter_id = meter_ids_list[-1]
-
-        response = requests.get(API_METER_HISTORY_ENDPOINT + f"/{latest_meter_id}")
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as http_err:
-        error_details = ""
-        # It's good practice to check if 'response' exists before trying to access response.text
-        if 'response' in locals() and hasattr(response, 'text'):
-            try:
-                error_details = response.text
-            except Exception:
-                pass # Keep error_details empty if response.text is not accessible
-        return f"HTTP error occurred while retrieving meter history: {http_err} - {error_details}"
-    except requests.exceptions.RequestException as req_err:
-        return f"Error calling meter history API: {req_err}"
-    except Exception as e:
-        error_context = ""
-        if 'response' in locals() and hasattr(response, 'text'):
-             error_context = f" - Response text: {response.text[:500]}" # Show first 500 chars of response
-        return f"An unexpected error occurred while retrieving meter history: {e}{error_context}"
\ No newline at end of file
+async def get_meter_history_points(user_id: str, meter_id=None, points: int = None, method: str = None, start: int = None, end: int = None):
+    """
+    Downsampled history of a meter for the UI: the given meter (one of the user's), or the latest meter of the user.
+    start / end (epoch seconds) limit the history to [start, end) before it is downsampled.
+    """
+    if meter_id is None:
+        meter_id, error_msg = _latest_meter_id(user_id)
+        if error_msg:
+            return error_msg
+    elif str(meter_id) not in {str(owned) for owned in state_store.history(user_id, "meter")}:
+        # Only the user's own meters, and no cache files for ids nobody created
+        return f"Error: No meter with ID {meter_id} among the user's meters."
+    series, unparsed = await meter_timeseries.cache.arefresh(meter_id, API_METER_HISTORY_ENDPOINT + f"/{meter_id}")
+    return _history_output(meter_id, series, unparsed, points, method, start, end)
@@ -0,0 +1,336 @@
+from dotenv import load_dotenv
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+import numpy as np
+from . import http_client
+
+load_dotenv()
+
+# Per-meter time-series cache for the meter history.
+# get_meter_history used to download the whole meter-datasets/{id} payload on every call. Readings
+# are now kept per meter as two append-only files in METER_CACHE_DIR: timestamps (int64 epoch seconds)
+# and kWh (float32), read back through memory maps, so a meter costs 12 bytes per reading and only
+# the pages actually sliced are loaded. Within METER_HISTORY_REFRESH seconds of the last fetch a
+# history question is answered from the files; after that the history is fetched again and only the
+# readings newer than the last cached timestamp are kept, so the files stay sorted and free of
+# duplicates. If the upstream filters by time, METER_HISTORY_SINCE_PARAM (e.g.
+# "filters[timestamp][$gt]" for a Strapi API) asks it for the newer readings only; it is unset by
+# default since the meter-data-simulator is not known to support it.
+# When a refresh fails but the meter has cached readings, those are served, marked as possibly out
+# of date (MeterSeries.stale), and the next call tries again.
+# At most METER_CACHE_MAX_METERS meters are cached: past that, the files of the least recently read
+# meter are deleted (its history is fetched in full again if it is asked for later).
+#
+# Listeners (add_listener) are called with the readings each fetch appends, for the rollups kept
+# on top of the cache (see transformer_rollup.py).
+#
+# The readings are found in the response as the first list of objects with a time field and a
+# numeric value field (METER_HISTORY_TIME_FIELDS / METER_HISTORY_VALUE_FIELDS, first match wins).
+METER_CACHE_DIR = os.getenv("METER_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "meter_cache"))
+METER_CACHE_MAX_METERS = int(os.getenv("METER_CACHE_MAX_METERS", "10000"))
+METER_HISTORY_REFRESH = float(os.getenv("METER_HISTORY_REFRESH", "900"))
+METER_HISTORY_SINCE_PARAM = os.getenv("METER_HISTORY_SINCE_PARAM", "")
+METER_HISTORY_TIME_FIELDS = [field.strip() for field in os.getenv("METER_HISTORY_TIME_FIELDS", "timestamp,time,datetime,date,start,startTime,createdAt").split(",") if field.strip()]
+METER_HISTORY_VALUE_FIELDS = [field.strip() for field in os.getenv("METER_HISTORY_VALUE_FIELDS", "consumption,kwh,kWh,energy,value,reading,units").split(",") if field.strip()]
+
+TIMESTAMP_DTYPE = np.dtype("<i8")
+KWH_DTYPE = np.dtype("<f4")
+
+
+def _parse_time(value):
+    """Returns epoch seconds of an epoch (s or ms) number or an ISO 8601 string, or None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        # Epoch milliseconds are beyond year 2286 in seconds
+        return int(value / 1000) if value > 1e10 else int(value)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return int(parsed.timestamp())
+    return None
+
+
+def _reading_fields(item: dict):
+    """Returns the (time field, value field) of a reading object, or None."""
+    time_field = next((field for field in METER_HISTORY_TIME_FIELDS if field in item), None)
+    if time_field is None:
+        return None
+    for field in METER_HISTORY_VALUE_FIELDS:
+        value = item.get(field)
+        if isinstance(value, (int, float, str)) and not isinstance(value, bool):
+            try:
+                float(value)
+            except ValueError:
+                continue
+            return time_field, field
+    return None
+
+
+def _find_readings(node, depth: int = 0):
+    """Returns the first list of reading objects in the response, with their fields."""
+    if depth > 6:
+        return None
+    if isinstance(node, list):
+        for item in node[:1]:
+            if isinstance(item, dict):
+                # Strapi puts the fields under "attributes"
+                fields = _reading_fields(item.get("attributes", item) if isinstance(item.get("attributes"), dict) else item)
+                if fields:
+                    return node, fields
+        children = node
+    elif isinstance(node, dict):
+        children = node.values()
+    else:
+        return None
+    for child in children:
+        if isinstance(child, (list, dict)):
+            found = _find_readings(child, depth + 1)
+            if found:
+                return found
+    return None
+
+
+def extract_readings(response):
+    """
+    Returns the readings of a meter-datasets response as (timestamps, kwh) arrays sorted by time,
+    or None if the response has no recognizable readings.
+    """
+    found = _find_readings(response)
+    if found is None:
+        return None
+    items, (time_field, value_field) = found
+    timestamps = []
+    values = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        fields = item["attributes"] if isinstance(item.get("attributes"), dict) else item
+        timestamp = _parse_time(fields.get(time_field))
+        try:
+            value = float(fields.get(value_field))
+        except (TypeError, ValueError):
+            continue
+        if timestamp is not None:
+            timestamps.append(timestamp)
+            values.append(value)
+    timestamps = np.asarray(timestamps, dtype=TIMESTAMP_DTYPE)
+    values = np.asarray(values, dtype=KWH_DTYPE)
+    order = np.argsort(timestamps, kind="stable")
+    return timestamps[order], values[order]
+
+
+class MeterSeries:
+    """The cached readings of one meter: two append-only files mapped into memory."""
+
+    def __init__(self, directory: str, meter_id):
+        self.meter_id = meter_id
+        self.timestamps_path = os.path.join(directory, f"{meter_id}.ts")
+        self.kwh_path = os.path.join(directory, f"{meter_id}.kwh")
+        self.fetched_at = None  # monotonic time of the last upstream fetch
+        self.stale = None       # error of the last refresh, if it failed and the cached readings were served
+        self.lock = threading.Lock()
+        self._maps = None  # (count, timestamps memmap, kwh memmap)
+
+    def count(self) -> int:
+        try:
+            # A crash between the two appends leaves one file longer; the shorter one is the truth
+            return min(os.path.getsize(self.timestamps_path) // TIMESTAMP_DTYPE.itemsize,
+                       os.path.getsize(self.kwh_path) // KWH_DTYPE.itemsize)
+        except OSError:
+            return 0
+
+    def arrays(self):
+        """Returns read-only (timestamps, kwh) views of every cached reading."""
+        count = self.count()
+        if count == 0:
+            return np.empty(0, TIMESTAMP_DTYPE), np.empty(0, KWH_DTYPE)
+        maps = self._maps
+        if maps is None or maps[0] != count:
+            maps = self._maps = (
+                count,
+                np.memmap(self.timestamps_path, dtype=TIMESTAMP_DTYPE, mode="r", shape=(count,)),
+                np.memmap(self.kwh_path, dtype=KWH_DTYPE, mode="r", shape=(count,)),
+            )
+        return maps[1], maps[2]
+
+    def delete(self):
+        """Removes the files of the cached readings."""
+        self._maps = None
+        for path in (self.timestamps_path, self.kwh_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def last_timestamp(self):
+        timestamps, _ = self.arrays()
+        return int(timestamps[-1]) if len(timestamps) else None
+
+    def append(self, timestamps: np.ndarray, kwh: np.ndarray) -> int:
+        """Appends the readings newer than the last cached one and returns how many were added."""
+        last = self.last_timestamp()
+        if last is not None:
+            newer = timestamps > last
+            timestamps, kwh = timestamps[newer], kwh[newer]
+        if len(timestamps) > 1:
+            # Duplicate timestamps within the batch: the last reading wins
+            keep = np.append(timestamps[1:] != timestamps[:-1], True)
+            timestamps, kwh = timestamps[keep], kwh[keep]
+        if len(timestamps) == 0:
+            return 0
+        count = self.count()
+        with open(self.kwh_path, "r+b" if os.path.exists(self.kwh_path) else "wb") as kwh_file:
+            kwh_file.seek(count * KWH_DTYPE.itemsize)
+            kwh_file.truncate()
+            kwh_file.write(np.ascontiguousarray(kwh, dtype=KWH_DTYPE).tobytes())
+        with open(self.timestamps_path, "r+b" if os.path.exists(self.timestamps_path) else "wb") as timestamps_file:
+            timestamps_file.seek(count * TIMESTAMP_DTYPE.itemsize)
+            timestamps_file.truncate()
+            timestamps_file.write(np.ascontiguousarray(timestamps, dtype=TIMESTAMP_DTYPE).tobytes())
+        return len(timestamps)
+
+    def window(self, start: int = None, end: int = None):
+        """Returns the (timestamps, kwh) views of the readings in [start, end) (epoch seconds)."""
+        timestamps, kwh = self.arrays()
+        low = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+        high = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side="left"))
+        return timestamps[low:high], kwh[low:high]
+
+
+class TimeSeriesCache:
+    """
+    MeterSeries per meter id, plus the incremental fetch from the meter-data-simulator.
+    """
+
+    def __init__(self, directory: str = METER_CACHE_DIR, max_meters: int = METER_CACHE_MAX_METERS):
+        self.directory = directory
+        self.max_meters = max_meters
+        self._series = None  # str(meter id) -> MeterSeries, least recently read first
+        self._lock = threading.Lock()
+        self.fetches = 0
+        self.hits = 0
+        self.evicted = 0
+        self.listeners = []  # called with (meter_id, timestamps, kwh) of the readings appended
+
+    def _load(self):
+        # Called with the lock held: the meters already on disk, oldest first, so they count
+        # towards max_meters and are the first to go
+        self._series = OrderedDict()
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(".ts")]
+        except FileNotFoundError:
+            return
+        paths = {name[:-len(".ts")]: os.path.join(self.directory, name) for name in names}
+        for meter_key in sorted(paths, key=lambda key: os.path.getmtime(paths[key])):
+            self._series[meter_key] = MeterSeries(self.directory, meter_key)
+
+    def series(self, meter_id) -> MeterSeries:
+        key = str(meter_id)
+        with self._lock:
+            if self._series is None:
+                self._load()
+            series = self._series.get(key)
+            if series is None:
+                os.makedirs(self.directory, exist_ok=True)
+                series = self._series[key] = MeterSeries(self.directory, meter_id)
+                while len(self._series) > self.max_meters:
+                    _, dropped = self._series.popitem(last=False)
+                    dropped.delete()
+                    self.evicted += 1
+            else:
+                # Found on disk at startup: keep the id as the callers give it (e.g. an int)
+                series.meter_id = meter_id
+                self._series.move_to_end(key)
+            return series
+
+    def _is_fresh(self, series: MeterSeries) -> bool:
+        return series.fetched_at is not None and time.monotonic() - series.fetched_at < METER_HISTORY_REFRESH
+
+    def _since_params(self, series: MeterSeries):
+        last = series.last_timestamp()
+        if last is None or not METER_HISTORY_SINCE_PARAM:
+            return None
+        return {METER_HISTORY_SINCE_PARAM: datetime.fromtimestamp(last, timezone.utc).isoformat().replace("+00:00", "Z")}
+
+    def _ingest(self, series: MeterSeries, response):
+        """Appends the readings of a response. Returns None, or the response itself if it has no readings."""
+        if not isinstance(response, dict):
+            if series.count() == 0:
+                return response
+            # Error message: the cached readings are served as they are
+            series.stale = response
+            return None
+        series.stale = None
+        readings = extract_readings(response)
+        if readings is None:
+            if series.count() == 0:
+                return response
+            # An incremental fetch with nothing newer (e.g. an empty list)
+            readings = np.empty(0, TIMESTAMP_DTYPE), np.empty(0, KWH_DTYPE)
+        added = series.append(*readings)
+        series.fetched_at = time.monotonic()
+        self.fetches += 1
+        if added:
+            timestamps, kwh = series.arrays()
+            for listener in self.listeners:
+                try:
+                    listener(series.meter_id, timestamps[-added:], kwh[-added:])
+                except Exception as e:
+                    print(f"Warning: Meter readings listener failed: {e}")
+        return None
+
+    def refresh(self, meter_id, url: str):
+        """
+        Brings a meter's cache up to date, fetching only newer readings once it is older than
+        METER_HISTORY_REFRESH. Returns (series, unparsed): unparsed is the upstream response (or error
+        message) when it could not be read as readings and nothing is cached, for the caller to return
+        as is. series.stale is set when the cached readings are served after a failed refresh.
+        """
+        series = self.series(meter_id)
+        with series.lock:
+            if self._is_fresh(series):
+                self.hits += 1
+                return series, None
+            response = http_client.request_json("GET", url, action="meter_history", coalesce=True, params=self._since_params(series))
+            return series, self._ingest(series, response)
+
+    async def arefresh(self, meter_id, url: str):
+        """Async counterpart of refresh."""
+        series = self.series(meter_id)
+        if self._is_fresh(series):
+            self.hits += 1
+            return series, None
+        response = await http_client.arequest_json("GET", url, action="meter_history", coalesce=True, params=self._since_params(series))
+        with series.lock:
+            return series, self._ingest(series, response)
+
+
+cache = TimeSeriesCache()
+
+
+def stale_warning(series: MeterSeries):
+    """The warning to add to a tool output served from cached readings after a failed refresh, or None."""
+    if series.stale is None:
+        return None
+    return f"Newer readings could not be fetched, the history may be out of date: {series.stale}"
+
+
+def add_listener(listener):
+    """
+    Registers listener(meter_id, timestamps, kwh), called with the readings each fetch appends.
+    """
+    cache.listeners.append(listener)
+
+
+def to_readings(timestamps: np.ndarray, kwh: np.ndarray) -> list:
+    """Returns [[ISO 8601 time, kWh], ...] for the tool output."""
+    times = np.datetime_as_string(np.asarray(timestamps, dtype=TIMESTAMP_DTYPE).astype("datetime64[s]"), unit="s")
+    return [[f"{time_string}Z", round(float(value), 4)] for time_string, value in zip(times, np.asarray(kwh, dtype=np.float64))]
@@ -0,0 +1,180 @@
+from dotenv import load_dotenv
+import os
+import json
+import threading
+
+load_dotenv()
+
+# Response projection for the Beckn tools.
+# The BAP returns whole catalogs and orders (long descriptions, images, tags, locations...), and
+# every byte a tool returns is tokenized into the model context. Each tool's response is reduced
+# to the fields the agent actually uses: ids, descriptor names, prices, fulfillment state and
+# quote totals, declared below as field selectors per (domain, action).
+#
+# A selector is a dotted path; "[]" maps over a list and the last key keeps its whole value:
+#   "responses[].message.catalog.providers[].items[].price"
+# Responses that are not dicts (error messages) and responses none of the selectors match are
+# returned unchanged. RESPONSE_PROJECTION=0 disables the projection.
+#
+# The byte sizes in stats() need both responses JSON-encoded, which costs more than the projection
+# itself on a large (e.g. cached) catalog, so they are measured on one call in
+# PROJECTION_STATS_EVERY per (domain, action) only (0 never measures them).
+RESPONSE_PROJECTION = os.getenv("RESPONSE_PROJECTION", "1") != "0"
+PROJECTION_STATS_EVERY = int(os.getenv("PROJECTION_STATS_EVERY", "100"))
+
+_CONTEXT_SELECTORS = [
+    "responses[].context.domain",
+    "responses[].context.action",
+    "responses[].error",
+]
+
+SEARCH_SELECTORS = _CONTEXT_SELECTORS + [
+    "responses[].message.catalog.descriptor.name",
+    "responses[].message.catalog.providers[].id",
+    "responses[].message.catalog.providers[].descriptor.name",
+    "responses[].message.catalog.providers[].items[].id",
+    "responses[].message.catalog.providers[].items[].descriptor.name",
+    "responses[].message.catalog.providers[].items[].price",
+]
+
+ORDER_SELECTORS = _CONTEXT_SELECTORS + [
+    "responses[].message.order.id",
+    "responses[].message.order.status",
+    "responses[].message.order.provider.id",
+    "responses[].message.order.provider.descriptor.name",
+    "responses[].message.order.items[].id",
+    "responses[].message.order.items[].descriptor.name",
+    "responses[].message.order.items[].price",
+    "responses[].message.order.quote.price",
+    "responses[].message.order.fulfillments[].id",
+    "responses[].message.order.fulfillments[].state.descriptor",
+]
+
+# The simulator's create-der response, attached to solar retail confirms
+DER_SELECTORS = [
+    "id",
+    "data.id",
+    "error",
+]
+
+_MISSING = object()
+
+
+def _compile(selectors: list) -> dict:
+    """Turns the selectors into a tree: key -> subtree, "[]" -> subtree for list items, True -> keep the value."""
+    tree = {}
+    for selector in selectors:
+        node = tree
+        parts = []
+        for part in selector.split("."):
+            if part.endswith("[]"):
+                parts.extend([part[:-2], "[]"])
+            else:
+                parts.append(part)
+        for part in parts[:-1]:
+            child = node.get(part)
+            if child is True:
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = True
+    return tree
+
+
+def _apply(tree, value):
+    if tree is True:
+        return value
+    if "[]" in tree:
+        if not isinstance(value, list):
+            return _MISSING
+        projected = [_apply(tree["[]"], item) for item in value]
+        # Positions are kept, so an item with nothing selected becomes {}
+        return [{} if item is _MISSING else item for item in projected]
+    if not isinstance(value, dict):
+        return _MISSING
+    projected = {}
+    for key, subtree in tree.items():
+        if key in value:
+            item = _apply(subtree, value[key])
+            if item is not _MISSING:
+                projected[key] = item
+    return projected if projected else _MISSING
+
+
+class Projection:
+    """A set of field selectors compiled once."""
+
+    def __init__(self, selectors: list):
+        self.selectors = list(selectors)
+        self._tree = _compile(self.selectors)
+
+    def apply(self, response):
+        projected = _apply(self._tree, response)
+        return response if projected is _MISSING else projected
+
+
+# (domain, action) -> Projection. A domain of None applies to every domain without its own entry.
+PROJECTIONS = {
+    (None, "search"): Projection(SEARCH_SELECTORS),
+    (None, "select"): Projection(ORDER_SELECTORS),
+    (None, "init"): Projection(ORDER_SELECTORS),
+    (None, "confirm"): Projection(ORDER_SELECTORS),
+    (None, "status"): Projection(ORDER_SELECTORS),
+    (None, "der"): Projection(DER_SELECTORS),
+}
+
+# "domain/action" -> {"calls", "sampled", "bytes_in", "bytes_out"} (bytes of the sampled calls)
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def register(action: str, selectors: list, domain: str = None):
+    """Sets the selectors of an action, for one domain or (domain=None) all of them."""
+    PROJECTIONS[(domain, action)] = Projection(selectors)
+
+
+def _size(value) -> int:
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+def project(response, action: str, domain: str = None):
+    """
+    Returns the response reduced to the selected fields of its (domain, action), and records its
+    size before and after on one call in PROJECTION_STATS_EVERY.
+
+    Args:
+        response: The decoded response of the tool, or an error message string (returned as is).
+        action: The Beckn action, e.g. "search" or "confirm".
+        domain: The Beckn domain, e.g. "deg:retail".
+    """
+    if not RESPONSE_PROJECTION or not isinstance(response, dict):
+        return response
+    projection = PROJECTIONS.get((domain, action)) or PROJECTIONS.get((None, action))
+    if projection is None:
+        return response
+    projected = projection.apply(response)
+
+    key = f"{domain}/{action}"
+    with _stats_lock:
+        counters = _stats.setdefault(key, {"calls": 0, "sampled": 0, "bytes_in": 0, "bytes_out": 0})
+        counters["calls"] += 1
+        sample = PROJECTION_STATS_EVERY > 0 and counters["calls"] % PROJECTION_STATS_EVERY == 1 % PROJECTION_STATS_EVERY
+    if sample:
+        bytes_in, bytes_out = _size(response), _size(projected)
+        with _stats_lock:
+            counters["sampled"] += 1
+            counters["bytes_in"] += bytes_in
+            counters["bytes_out"] += bytes_out
+    return projected
+
+
+def stats() -> dict:
+    """
+    Returns, per "domain/action", the number of projected responses, and the number sampled with
+    their total size in bytes before and after.
+    """
+    with _stats_lock:
+        return {
+            key: {**counters, "reduction": round(1 - counters["bytes_out"] / counters["bytes_in"], 3) if counters["bytes_in"] else 0.0}
+            for key, counters in _stats.items()
+        }
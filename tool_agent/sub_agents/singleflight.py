@@ -0,0 +1,145 @@
+import json
+import threading
+import asyncio
+import weakref
+from urllib.parse import urlencode
+
+# Request coalescing ("single flight").
+# When several sessions ask for the same catalog, order status or utility data at the same moment,
+# only the first caller goes upstream; the others wait for that call and share its result.
+# Requests are identified by method + URL + query + body, with the per-request Beckn context
+# fields (message_id, timestamp and transaction_id) removed, since they differ on every build
+# without changing what is asked.
+#
+# Only read-only calls (search, status, GETs) are coalesced. select/init/confirm and the
+# simulator create/toggle calls have side effects and always go upstream.
+
+_VOLATILE_CONTEXT_FIELDS = ("message_id", "timestamp", "transaction_id")
+
+
+def request_key(method: str, url: str, params=None, data=None, json_body=None) -> str:
+    """
+    Returns the canonical key of a request.
+
+    Args:
+        method: "GET" or "POST".
+        url: The full endpoint URL.
+        params: Query parameters, if any.
+        data: A JSON body as str / bytes, if any.
+        json_body: A JSON body as a dict, if any.
+    """
+    body = json_body
+    if body is None and data is not None:
+        try:
+            body = json.loads(data)
+        except (TypeError, ValueError):
+            body = data.decode("utf-8", "replace") if isinstance(data, bytes) else str(data)
+    if isinstance(body, dict) and isinstance(body.get("context"), dict):
+        context = {key: value for key, value in body["context"].items() if key not in _VOLATILE_CONTEXT_FIELDS}
+        body = {**body, "context": context}
+    query = urlencode(sorted(params.items()) if isinstance(params, dict) else params or [], doseq=True)
+    return f"{method.upper()} {url}?{query} {json.dumps(body, sort_keys=True, separators=(',', ':'))}"
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls. Sync callers are coalesced across threads,
+    async callers across the tasks of one event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call
+        self._async_calls = weakref.WeakKeyDictionary()  # event loop -> {key: asyncio.Task}
+        self.upstream = {}   # action -> calls that went upstream
+        self.coalesced = {}  # action -> calls answered by another caller's upstream call
+
+    def _count(self, counters: dict, action: str):
+        counters[action] = counters.get(action, 0) + 1
+
+    def do(self, key: str, fn, action: str = "other"):
+        """
+        Returns fn(), or the result of the identical call already in flight.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._count(self.upstream, action)
+            else:
+                self._count(self.coalesced, action)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def ado(self, key: str, afn, action: str = "other"):
+        """
+        Async counterpart of do. afn is a coroutine function.
+
+        The upstream call runs in its own task, owned by none of the callers: a caller that is
+        cancelled (e.g. its client disconnected) stops waiting, while the call goes on for the others.
+        """
+        loop = asyncio.get_running_loop()
+        calls = self._async_calls.get(loop)
+        if calls is None:
+            calls = self._async_calls[loop] = {}
+
+        task = calls.get(key)
+        if task is not None:
+            with self._lock:
+                self._count(self.coalesced, action)
+        else:
+            task = calls[key] = loop.create_task(afn())
+            with self._lock:
+                self._count(self.upstream, action)
+            task.add_done_callback(lambda done: self._finish(calls, key, done))
+        # shield: a cancelled caller must not cancel the call the others are waiting for
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _finish(calls: dict, key: str, task):
+        if calls.get(key) is task:
+            del calls[key]
+        if not task.cancelled():
+            # Retrieved here so a call nobody waits for any more does not log "exception was never retrieved"
+            task.exception()
+
+    def stats(self) -> dict:
+        """
+        Returns the per-action counts of upstream and coalesced calls since startup.
+        """
+        with self._lock:
+            actions = sorted(set(self.upstream) | set(self.coalesced))
+            per_action = {action: {"upstream": self.upstream.get(action, 0), "coalesced": self.coalesced.get(action, 0)} for action in actions}
+        return {
+            "upstream": sum(counts["upstream"] for counts in per_action.values()),
+            "coalesced": sum(counts["coalesced"] for counts in per_action.values()),
+            "per_action": per_action,
+        }
+
+
+flights = SingleFlight()
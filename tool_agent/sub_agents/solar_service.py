@@ -1,14 +1,17 @@
-import requests
-from google.adk.agents import Agent
+from google.adk.tools import ToolContext
 from dotenv import load_dotenv
 import os
-import uuid
-from datetime import datetime, timezone
-import json
+from . import http_client
+from . import beckn_payloads
+from . import catalog_cache
+from . import catalog_index
+from . import status_watcher
+from . import state_store
+from . import projection
 
 load_dotenv()
 
-# --- Mappings for Solar Service ---
+# --- Mappings for Solar Service (seed entries of CATALOG, which is extended from search responses) ---
 provider_name_to_id = {
     "Luminalt": "329",
     "Sunrun": "330",
@@ -38,8 +41,6 @@ provider_id_to_items = {
     },
 }
 
-# Global list to store Solar Service order IDs
-solar_service_order_ids = []
 # --- End Mappings ---
 
 API_CONFIRM_ENDPOINT = os.getenv("base_url") + "confirm"
@@ -233,323 +234,128 @@ STATUS_PAYLOAD_TEMPLATE = """
 }
 """
 
+# Templates parsed once at import; build() fills only the per-request fields
+SEARCH_PAYLOAD = beckn_payloads.PayloadBuilder(SEARCH_PAYLOAD_TEMPLATE)
+SELECT_PAYLOAD = beckn_payloads.PayloadBuilder(SELECT_PAYLOAD_TEMPLATE, **beckn_payloads.ORDER_FIELDS)
+INIT_PAYLOAD = beckn_payloads.PayloadBuilder(INIT_PAYLOAD_TEMPLATE, **beckn_payloads.ORDER_FIELDS)
+CONFIRM_PAYLOAD = beckn_payloads.PayloadBuilder(CONFIRM_PAYLOAD_TEMPLATE, **beckn_payloads.ORDER_FIELDS)
+STATUS_PAYLOAD = beckn_payloads.PayloadBuilder(STATUS_PAYLOAD_TEMPLATE, **beckn_payloads.STATUS_FIELDS)
+
+# Providers and items, seeded with the mappings above and extended from every search response
+CATALOG = catalog_index.for_search(SEARCH_PAYLOAD, provider_name_to_id, provider_id_to_items)
+
+# Confirmed orders are polled in the background; the status tools read its table
+status_watcher.register("solar_service", STATUS_PAYLOAD, API_STATUS_ENDPOINT)
+
+
 def _extract_provider_and_item_solar_service(search_query: str):
-    found_provider_name = None
-    found_item_name = None
-    search_query_lower = search_query.lower()
-
-    for p_name in provider_name_to_id.keys():
-        if p_name.lower() in search_query_lower:
-            found_provider_name = p_name
-            break
-    
-    # Adjusted item search for solar_service structure
-    for p_id_map, items_map in provider_id_to_items.items():
-        for i_name in items_map.keys(): # i_name is like "sp-resi-001"
-            if i_name.lower() in search_query_lower:
-                found_item_name = i_name
-                if found_provider_name and provider_name_to_id.get(found_provider_name) == p_id_map:
-                    break 
-                elif not found_provider_name:
-                    break 
-        if found_item_name and (not found_provider_name or provider_name_to_id.get(found_provider_name) == p_id_map):
-            break
-            
+    found_provider_name = CATALOG.find_provider(search_query)
+    provider_id = CATALOG.provider_id(found_provider_name)
+    # Items of the named provider are preferred over items of other providers
+    found_item_name = CATALOG.find_item(search_query, provider_id)
+
     if not found_provider_name and not found_item_name:
         return None, None, "Error: Could not identify a provider or item. Please specify provider (e.g., 'Luminalt') and item (e.g., 'sp-resi-001')."
 
     if found_provider_name and not found_item_name:
-        provider_id_for_items = provider_name_to_id[found_provider_name]
-        available_items = list(provider_id_to_items.get(provider_id_for_items, {}).keys())
+        available_items = CATALOG.item_names(provider_id)
         if not available_items:
             return None, None, f"Error: No items found for provider '{found_provider_name}'."
         return None, None, f"Error: Please specify the item for provider '{found_provider_name}'. Available items: {', '.join(available_items)}."
 
     if not found_provider_name and found_item_name:
-        possible_providers = []
-        for p_name, p_id_val in provider_name_to_id.items():
-            if found_item_name in provider_id_to_items.get(p_id_val, {}):
-                possible_providers.append(p_name)
+        possible_providers = CATALOG.providers_for_item(found_item_name)
         if possible_providers:
             return None, None, f"Error: Please specify the provider for item '{found_item_name}'. This item is available from: {', '.join(possible_providers)}."
         else: 
             return None, None, f"Error: Item '{found_item_name}' found, but no associated provider. Please also specify a provider name."
 
-    provider_id = provider_name_to_id.get(found_provider_name)
-    item_id = provider_id_to_items.get(provider_id, {}).get(found_item_name)
+    item_id = CATALOG.item_id(provider_id, found_item_name)
 
     if not item_id:
-        actual_items = list(provider_id_to_items.get(provider_id, {}).keys())
+        actual_items = CATALOG.item_names(provider_id)
         return None, None, (f"Error: Item '{found_item_name}' is not valid for provider '{found_provider_name}'. "
                            f"Available items for this provider: {', '.join(actual_items) if actual_items else 'No items available'}.")
     
     return provider_id, item_id, None
 
 
-def search_solar_service_data(search_query: str) -> str:
+def _build_order_payload(builder: beckn_payloads.PayloadBuilder, search_query: str):
+    provider_id, item_id, error_msg = _extract_provider_and_item_solar_service(search_query)
+    if error_msg:
+        return None, error_msg
+
+    return builder.build(provider_id=provider_id, item_id=item_id)
+
+
+def _latest_order_id(tool_context):
+    order_id = state_store.latest(tool_context, "solar_service_order")
+    if order_id is None:
+        return None, "Error: No Solar Service order ID available. Please confirm an order first."
+    return order_id, None
+
+
+def _record_confirm(confirm_response_data, tool_context):
+    """Extracts and stores the order ID of a successful confirm response."""
+    try:
+        order_id_val = confirm_response_data['responses'][0]['message']['order']['id']
+        state_store.record(tool_context, "solar_service_order", order_id_val)
+        status_watcher.watch("solar_service", order_id_val)
+        # The order may have used up stock or a quota the cached catalog still shows
+        catalog_cache.invalidate(SEARCH_PAYLOAD.domain)
+    except (KeyError, IndexError, TypeError) as e:
+        print(f"Warning: Could not extract order_id from Solar Service confirm response: {e} - Response: {confirm_response_data}")
+
+
+async def search_solar_service_data(search_query: str) -> str:
     """
     Searches for solar service data based on a given search query.
     """
-    try:
-        bap_id = os.getenv("bap_id")
-        bap_uri = os.getenv("bap_uri")
-        bpp_id = os.getenv("bpp_id")
-        bpp_uri = os.getenv("bpp_uri")
-
-        if not all([bap_id, bap_uri, bpp_id, bpp_uri]):
-            return "Error: BAP_ID, BAP_URI, BPP_ID, or BPP_URI environment variables are not set."
-
-        transaction_id = str(uuid.uuid4())
-        message_id = str(uuid.uuid4())
-        timestamp = datetime.now(timezone.utc).isoformat()
-
-        payload_dict = json.loads(SEARCH_PAYLOAD_TEMPLATE)
-        payload_dict["context"]["bap_id"] = bap_id
-        payload_dict["context"]["bap_uri"] = bap_uri
-        payload_dict["context"]["bpp_id"] = bpp_id
-        payload_dict["context"]["bpp_uri"] = bpp_uri
-        payload_dict["context"]["transaction_id"] = transaction_id
-        payload_dict["context"]["message_id"] = message_id
-        payload_dict["context"]["timestamp"] = timestamp
-        # search_query can be used to modify payload_dict["message"]["intent"]["descriptor"]["name"] if needed
-        # For now, it uses the default "resi"
-        
-        current_payload = json.dumps(payload_dict)
-
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(API_SEARCH_ENDPOINT, data=current_payload, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as http_err:
-        error_details = ""
-        try: error_details = response.text
-        except Exception: pass
-        return f"HTTP error occurred: {http_err} - {error_details}"
-    except requests.exceptions.RequestException as e:
-        return f"Error calling API: {e}"
-    except ValueError as json_err: # Catches json.loads or response.json() errors
-        error_details = ""
-        try: 
-            if 'response' in locals() and hasattr(response, 'text'): error_details = response.text
-        except Exception: pass
-        return f"Error decoding JSON: {json_err} - Response: {error_details}"
+    return projection.project(await catalog_cache.asearch(SEARCH_PAYLOAD, API_SEARCH_ENDPOINT), "search", SEARCH_PAYLOAD.domain)
 
-    
-def select_solar_service_data(search_query: str) -> str:
+
+async def select_solar_service_data(search_query: str) -> str:
     """
     Selects solar service data based on provider and item names in search_query.
     """
-    try:
-        provider_id, item_id, error_msg = _extract_provider_and_item_solar_service(search_query)
-        if error_msg:
-            return error_msg
-
-        bap_id = os.getenv("bap_id")
-        bap_uri = os.getenv("bap_uri")
-        bpp_id = os.getenv("bpp_id")
-        bpp_uri = os.getenv("bpp_uri")
-
-        if not all([bap_id, bap_uri, bpp_id, bpp_uri]):
-            return "Error: BAP_ID, BAP_URI, BPP_ID, or BPP_URI environment variables are not set."
-
-        transaction_id = str(uuid.uuid4())
-        message_id = str(uuid.uuid4())
-        timestamp = datetime.now(timezone.utc).isoformat()
-
-        payload_dict = json.loads(SELECT_PAYLOAD_TEMPLATE)
-        payload_dict["context"]["bap_id"] = bap_id
-        payload_dict["context"]["bap_uri"] = bap_uri
-        payload_dict["context"]["bpp_id"] = bpp_id
-        payload_dict["context"]["bpp_uri"] = bpp_uri
-        payload_dict["context"]["transaction_id"] = transaction_id
-        payload_dict["context"]["message_id"] = message_id
-        payload_dict["context"]["timestamp"] = timestamp
-        payload_dict["message"]["order"]["provider"]["id"] = provider_id
-        payload_dict["message"]["order"]["items"][0]["id"] = item_id
-        
-        current_payload = json.dumps(payload_dict)
-
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(API_SELECT_ENDPOINT, data=current_payload, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as http_err:
-        error_details = ""
-        try: error_details = response.text
-        except Exception: pass
-        return f"HTTP error occurred: {http_err} - {error_details}"
-    except requests.exceptions.RequestException as e:
-        return f"Error calling API: {e}"
-    except ValueError as json_err:
-        error_details = ""
-        try: 
-            if 'response' in locals() and hasattr(response, 'text'): error_details = response.text
-        except Exception: pass
-        return f"Error decoding JSON: {json_err} - Response: {error_details}"
+    current_payload, error_msg = _build_order_payload(SELECT_PAYLOAD, search_query)
+    if error_msg:
+        return error_msg
+    return projection.project(await http_client.arequest_json("POST", API_SELECT_ENDPOINT, action="select", data=current_payload, headers=http_client.JSON_HEADERS), "select", SELECT_PAYLOAD.domain)
 
-    
-def init_solar_service_data(search_query: str) -> str:
+
+async def init_solar_service_data(search_query: str) -> str:
     """
     Initializes solar service order based on provider and item names in search_query.
     """
-    try:
-        provider_id, item_id, error_msg = _extract_provider_and_item_solar_service(search_query)
-        if error_msg:
-            return error_msg
-
-        bap_id = os.getenv("bap_id")
-        bap_uri = os.getenv("bap_uri")
-        bpp_id = os.getenv("bpp_id")
-        bpp_uri = os.getenv("bpp_uri")
-
-        if not all([bap_id, bap_uri, bpp_id, bpp_uri]):
-            return "Error: BAP_ID, BAP_URI, BPP_ID, or BPP_URI environment variables are not set."
-
-        transaction_id = str(uuid.uuid4())
-        message_id = str(uuid.uuid4())
-        timestamp = datetime.now(timezone.utc).isoformat()
-
-        payload_dict = json.loads(INIT_PAYLOAD_TEMPLATE)
-        payload_dict["context"]["bap_id"] = bap_id
-        payload_dict["context"]["bap_uri"] = bap_uri
-        payload_dict["context"]["bpp_id"] = bpp_id
-        payload_dict["context"]["bpp_uri"] = bpp_uri
-        payload_dict["context"]["transaction_id"] = transaction_id
-        payload_dict["context"]["message_id"] = message_id
-        payload_dict["context"]["timestamp"] = timestamp
-        payload_dict["message"]["order"]["provider"]["id"] = provider_id
-        payload_dict["message"]["order"]["items"][0]["id"] = item_id
-        
-        current_payload = json.dumps(payload_dict)
-
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(API_INITIATE_ENDPOINT, data=current_payload, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as http_err:
-        error_details = ""
-        try: error_details = response.text
-        except Exception: pass
-        return f"HTTP error occurred: {http_err} - {error_details}"
-    except requests.exceptions.RequestException as e:
-        return f"Error calling API: {e}"
-    except ValueError as json_err:
-        error_details = ""
-        try: 
-            if 'response' in locals() and hasattr(response, 'text'): error_details = response.text
-        except Exception: pass
-        return f"Error decoding JSON: {json_err} - Response: {error_details}"
+    current_payload, error_msg = _build_order_payload(INIT_PAYLOAD, search_query)
+    if error_msg:
+        return error_msg
+    return projection.project(await http_client.arequest_json("POST", API_INITIATE_ENDPOINT, action="init", data=current_payload, headers=http_client.JSON_HEADERS), "init", INIT_PAYLOAD.domain)
 
-    
-def confirm_solar_service_data(search_query: str) -> str:
+
+async def confirm_solar_service_data(search_query: str, tool_context: ToolContext = None) -> str:
     """
     Confirms solar service order based on provider and item names in search_query.
     Stores order ID on success.
     """
-    try:
-        provider_id, item_id, error_msg = _extract_provider_and_item_solar_service(search_query)
-        if error_msg:
-            return error_msg
-
-        bap_id = os.getenv("bap_id")
-        bap_uri = os.getenv("bap_uri")
-        bpp_id = os.getenv("bpp_id")
-        bpp_uri = os.getenv("bpp_uri")
-
-        if not all([bap_id, bap_uri, bpp_id, bpp_uri]):
-            return "Error: BAP_ID, BAP_URI, BPP_ID, or BPP_URI environment variables are not set."
-
-        transaction_id = str(uuid.uuid4())
-        message_id = str(uuid.uuid4())
-        timestamp = datetime.now(timezone.utc).isoformat()
-
-        payload_dict = json.loads(CONFIRM_PAYLOAD_TEMPLATE)
-        payload_dict["context"]["bap_id"] = bap_id
-        payload_dict["context"]["bap_uri"] = bap_uri
-        payload_dict["context"]["bpp_id"] = bpp_id
-        payload_dict["context"]["bpp_uri"] = bpp_uri
-        payload_dict["context"]["transaction_id"] = transaction_id
-        payload_dict["context"]["message_id"] = message_id
-        payload_dict["context"]["timestamp"] = timestamp
-        payload_dict["message"]["order"]["provider"]["id"] = provider_id
-        payload_dict["message"]["order"]["items"][0]["id"] = item_id
-        
-        current_payload = json.dumps(payload_dict)
-
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(API_CONFIRM_ENDPOINT, data=current_payload, headers=headers)
-        response.raise_for_status()
-
-        confirm_response_data = response.json()
-        try:
-            order_id_val = confirm_response_data['responses'][0]['message']['order']['id']
-            solar_service_order_ids.append(order_id_val)
-        except (KeyError, IndexError, TypeError) as e:
-            print(f"Warning: Could not extract order_id from Solar Service confirm response: {e} - Response: {confirm_response_data}")
+    current_payload, error_msg = _build_order_payload(CONFIRM_PAYLOAD, search_query)
+    if error_msg:
+        return error_msg
 
+    confirm_response_data = await http_client.arequest_json("POST", API_CONFIRM_ENDPOINT, action="confirm", data=current_payload, headers=http_client.JSON_HEADERS)
+    if isinstance(confirm_response_data, str):
         return confirm_response_data
-    except requests.exceptions.HTTPError as http_err:
-        error_details = ""
-        try: error_details = response.text
-        except Exception: pass
-        return f"HTTP error occurred: {http_err} - {error_details}"
-    except requests.exceptions.RequestException as e:
-        return f"Error calling API: {e}"
-    except ValueError as json_err:
-        error_details = ""
-        try: 
-            if 'response' in locals() and hasattr(response, 'text'): error_details = response.text
-        except Exception: pass
-        return f"Error decoding JSON: {json_err} - Response: {error_details}"
+    _record_confirm(confirm_response_data, tool_context)
+    return projection.project(confirm_response_data, "confirm", CONFIRM_PAYLOAD.domain)
 
-    
-def status_solar_service_data(search_query: str) -> str: # search_query is not used here
+
+async def status_solar_service_data(search_query: str, tool_context: ToolContext = None) -> str:
     """
     Gets status for the latest confirmed solar service order.
     """
-    try:
-        if not solar_service_order_ids:
-            return "Error: No Solar Service order ID available. Please confirm an order first."
-        latest_order_id = solar_service_order_ids[-1]
-
-        bap_id = os.getenv("bap_id")
-        bap_uri = os.getenv("bap_uri")
-        bpp_id = os.getenv("bpp_id")
-        bpp_uri = os.getenv("bpp_uri")
-
-        if not all([bap_id, bap_uri, bpp_id, bpp_uri]):
-            return "Error: BAP_ID, BAP_URI, BPP_ID, or BPP_URI environment variables are not set."
-
-        transaction_id = str(uuid.uuid4())
-        message_id = str(uuid.uuid4())
-        timestamp = datetime.now(timezone.utc).isoformat()
-
-        payload_dict = json.loads(STATUS_PAYLOAD_TEMPLATE)
-        payload_dict["context"]["bap_id"] = bap_id
-        payload_dict["context"]["bap_uri"] = bap_uri
-        payload_dict["context"]["bpp_id"] = bpp_id
-        payload_dict["context"]["bpp_uri"] = bpp_uri
-        payload_dict["context"]["transaction_id"] = transaction_id
-        payload_dict["context"]["message_id"] = message_id
-        payload_dict["context"]["timestamp"] = timestamp
-        payload_dict["message"]["order_id"] = latest_order_id
-
-        current_payload = json.dumps(payload_dict)
-
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(API_STATUS_ENDPOINT, data=current_payload, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as http_err:
-        error_details = ""
-        try: error_details = response.text
-        except Exception: pass
-        return f"HTTP error occurred: {http_err} - {error_details}"
-    except requests.exceptions.RequestException as e:
-        return f"Error calling API: {e}"
-    except ValueError as json_err:
-        error_details = ""
-        try: 
-            if 'response' in locals() and hasattr(response, 'text'): error_details = response.text
-        except Exception: pass
-        return f"Error decoding JSON: {json_err} - Response: {error_details}"
\ No newline at end of file
+    order_id, error_msg = _latest_order_id(tool_context)
+    if error_msg:
+        return error_msg
+    # Answered from the status watcher's table; only an order never polled yet goes upstream
+    return projection.project(await status_watcher.watcher.astatus("solar_service", order_id), "status", STATUS_PAYLOAD.domain)
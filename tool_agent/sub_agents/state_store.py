@@ -0,0 +1,171 @@
+from dotenv import load_dotenv
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from . import durable_store
+from . import status_watcher
+
+load_dotenv()
+
+# Per-user state of the tools.
+# Order, meter, energy resource and DER ids used to live in module-level lists shared by every
+# session, so one user's "check my order status" answered with another user's latest order, and
+# the lists grew for as long as the process ran.
+#
+# Ids are now recorded per ADK user (falling back to the session id, then to "local" when a tool is
+# called outside of an agent run) and per kind ("subsidy_order", "meter", "er_household"...). The
+# latest id of a kind, and optionally the latest id per key within a kind, is a plain dict lookup. Retention is bounded on both axes: each kind keeps its last STATE_HISTORY_LIMIT
+# ids, and at most STATE_MAX_USERS users are kept, the least recently active being dropped first,
+# as are users idle for more than STATE_IDLE_TTL seconds.
+# Every recorded id is also written to the durable store, which rebuilds this state on startup.
+STATE_MAX_USERS = int(os.getenv("STATE_MAX_USERS", "10000"))
+STATE_HISTORY_LIMIT = int(os.getenv("STATE_HISTORY_LIMIT", "20"))
+STATE_IDLE_TTL = float(os.getenv("STATE_IDLE_TTL", "86400"))
+
+LOCAL_SCOPE = "local"
+
+
+def scope_of(tool_context) -> str:
+    """
+    Returns the key the state of a tool call is stored under: the ADK user id, else the session id,
+    else "local" (tools called directly, without a tool context).
+    A string is taken as the key itself, for callers outside of the agent (e.g. bulk provisioning).
+    """
+    if tool_context is None:
+        return LOCAL_SCOPE
+    if isinstance(tool_context, str):
+        return tool_context
+    # Older ADK versions only expose these on the invocation context
+    source = tool_context if hasattr(tool_context, "user_id") else getattr(tool_context, "_invocation_context", None)
+    user_id = getattr(source, "user_id", None)
+    if user_id:
+        return str(user_id)
+    session = getattr(source, "session", None)
+    session_id = getattr(session, "id", None)
+    return str(session_id) if session_id else LOCAL_SCOPE
+
+
+class UserState:
+    """The ids recorded for one user."""
+    __slots__ = ("latest", "latest_by_key", "history", "touched_at")
+
+    def __init__(self):
+        self.latest = {}         # kind -> latest value
+        self.latest_by_key = {}  # (kind, key) -> latest value recorded with that key
+        self.history = {}        # kind -> deque of the last STATE_HISTORY_LIMIT values
+        self.touched_at = time.monotonic()
+
+
+class StateStore:
+    """
+    Bounded LRU of UserState, keyed by scope_of(tool_context).
+    """
+
+    def __init__(self, max_users: int = STATE_MAX_USERS, history_limit: int = STATE_HISTORY_LIMIT, idle_ttl: float = STATE_IDLE_TTL):
+        self.max_users = max_users
+        self.history_limit = history_limit
+        self.idle_ttl = idle_ttl
+        self._users = OrderedDict()  # scope -> UserState, least recently active first
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def _state(self, scope: str, create: bool) -> UserState | None:
+        # Called with the lock held
+        state = self._users.get(scope)
+        now = time.monotonic()
+        if state is not None and now - state.touched_at > self.idle_ttl:
+            del self._users[scope]
+            self.evicted += 1
+            state = None
+        if state is None:
+            if not create:
+                return None
+            state = self._users[scope] = UserState()
+        else:
+            self._users.move_to_end(scope)
+        state.touched_at = now
+        self._evict(now)
+        return state
+
+    def _evict(self, now: float):
+        # The LRU end is checked only, so eviction is O(1) per call
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+            self.evicted += 1
+        while self._users:
+            scope, state = next(iter(self._users.items()))
+            if now - state.touched_at <= self.idle_ttl:
+                break
+            del self._users[scope]
+            self.evicted += 1
+
+    def record(self, tool_context, kind: str, value, key=None, details: dict = None):
+        """
+        Records a new value of a kind (e.g. the order id of a confirm) for the user of the tool call.
+        With a key, the value is also the latest one for that key (e.g. the DER of an appliance id).
+        details are extra columns for the durable store (see durable_store.save).
+        """
+        scope = scope_of(tool_context)
+        self.restore(scope, kind, value, key)
+        durable_store.save(scope, kind, value, key, details)
+
+    def restore(self, scope: str, kind: str, value, key=None):
+        """Records a value for a scope without writing it to the durable store."""
+        with self._lock:
+            state = self._state(scope, create=True)
+            state.latest[kind] = value
+            if key is not None:
+                state.latest_by_key[(kind, key)] = value
+            history = state.history.get(kind)
+            if history is None:
+                history = state.history[kind] = deque(maxlen=self.history_limit)
+            if len(history) == history.maxlen:
+                # The value falling out of the history no longer needs its key entry
+                dropped = history[0]
+                for entry_key in [k for k, v in state.latest_by_key.items() if k[0] == kind and v is dropped]:
+                    del state.latest_by_key[entry_key]
+            history.append(value)
+
+    def latest(self, tool_context, kind: str, key=None):
+        """Returns the latest value of a kind (for a key, if given) for the user of the tool call, or None."""
+        with self._lock:
+            state = self._state(scope_of(tool_context), create=False)
+            if state is None:
+                return None
+            if key is None:
+                return state.latest.get(kind)
+            return state.latest_by_key.get((kind, key))
+
+    def history(self, tool_context, kind: str) -> list:
+        """Returns the retained values of a kind for the user of the tool call, oldest first."""
+        with self._lock:
+            state = self._state(scope_of(tool_context), create=False)
+            if state is None:
+                return []
+            return list(state.history.get(kind, ()))
+
+    def scopes_with(self, kind: str) -> list:
+        """Returns the scopes of the retained users with at least one value of a kind."""
+        with self._lock:
+            return [scope for scope, state in self._users.items() if kind in state.latest]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"users": len(self._users), "evicted": self.evicted}
+
+
+store = StateStore()
+durable_store.restore(store, status_watcher.watcher)
+
+
+def record(tool_context, kind: str, value, key=None, details: dict = None):
+    store.record(tool_context, kind, value, key, details)
+
+
+def latest(tool_context, kind: str, key=None):
+    return store.latest(tool_context, kind, key)
+
+
+def history(tool_context, kind: str) -> list:
+    return store.history(tool_context, kind)
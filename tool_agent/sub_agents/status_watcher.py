@@ -0,0 +1,260 @@
+from dotenv import load_dotenv
+import os
+import time
+import asyncio
+import threading
+from . import http_client
+from . import durable_store
+
+load_dotenv()
+
+# Background order status watcher.
+# Every confirmed order is tracked here and its /status is polled in the background, so the
+# status_* tools answer from the local status table instead of calling the BAP while the user waits.
+#
+# Polling is adaptive per order: it starts every STATUS_POLL_MIN_INTERVAL seconds, doubles each time
+# the state comes back unchanged (up to STATUS_POLL_MAX_INTERVAL), drops back to the minimum when the
+# state changes, and once the order reaches a terminal state it is polled one last time
+# STATUS_POLL_TERMINAL_INTERVAL seconds later, then dropped from the table (a later status read
+# fetches it again). Failed polls back off the same way and never overwrite the last good status.
+# Orders that are due together are polled as one concurrent batch of up to STATUS_POLL_BATCH_SIZE.
+# State changes are written to the durable store, which restores the orders not yet in a terminal
+# state on startup.
+STATUS_POLL_MIN_INTERVAL = float(os.getenv("STATUS_POLL_MIN_INTERVAL", "5"))
+STATUS_POLL_MAX_INTERVAL = float(os.getenv("STATUS_POLL_MAX_INTERVAL", "120"))
+STATUS_POLL_TERMINAL_INTERVAL = float(os.getenv("STATUS_POLL_TERMINAL_INTERVAL", "1800"))
+STATUS_POLL_BATCH_SIZE = int(os.getenv("STATUS_POLL_BATCH_SIZE", "20"))
+TERMINAL_STATES = set(
+    state.strip().upper()
+    for state in os.getenv("STATUS_TERMINAL_STATES", "COMPLETED,COMPLETE,DELIVERED,CANCELLED,CANCELED,REJECTED,FAILED,CLOSED").split(",")
+    if state.strip()
+)
+
+
+def extract_state(status_response) -> str | None:
+    """
+    Returns the order state of a Beckn status response: the first fulfillment's state code,
+    or the order's own status when there is no fulfillment state.
+    """
+    try:
+        order = status_response["responses"][0]["message"]["order"]
+    except (KeyError, IndexError, TypeError):
+        return None
+    try:
+        return str(order["fulfillments"][0]["state"]["descriptor"]["code"]).upper()
+    except (KeyError, IndexError, TypeError):
+        pass
+    status = order.get("status") if isinstance(order, dict) else None
+    return str(status).upper() if status else None
+
+
+class OrderStatus:
+    """One row of the status table."""
+    __slots__ = ("name", "order_id", "state", "response", "updated_at", "polled_at", "interval", "next_poll_at", "failures")
+
+    def __init__(self, name: str, order_id: str):
+        self.name = name
+        self.order_id = order_id
+        self.state = None
+        self.response = None     # last successful status response
+        self.updated_at = None   # when response was received
+        self.polled_at = None
+        self.interval = STATUS_POLL_MIN_INTERVAL
+        self.next_poll_at = time.monotonic()
+        self.failures = 0
+
+    @property
+    def terminal(self) -> bool:
+        return self.state in TERMINAL_STATES
+
+
+class StatusWatcher:
+    """
+    Status table plus the background thread polling it. The thread runs its own event loop,
+    started on the first watched order.
+    """
+
+    def __init__(self):
+        self._sources = {}  # name -> (status payload builder, status endpoint)
+        self._orders = {}   # (name, order_id) -> OrderStatus
+        self._lock = threading.Lock()
+        self._thread = None
+        self._loop = None
+        self._wakeup = None
+        self.polls = 0
+
+    def register(self, name: str, builder, url: str):
+        """
+        Declares a status source, e.g. register("subsidy", STATUS_PAYLOAD, API_STATUS_ENDPOINT).
+        The builder must take an order_id field.
+        """
+        self._sources[name] = (builder, url)
+
+    def _track(self, name: str, order_id) -> OrderStatus:
+        key = (name, str(order_id))
+        with self._lock:
+            entry = self._orders.get(key)
+            if entry is None:
+                entry = self._orders[key] = OrderStatus(name, str(order_id))
+        return entry
+
+    def watch(self, name: str, order_id):
+        """Starts tracking a confirmed order. Its first poll is due immediately."""
+        self._track(name, order_id)
+        self._ensure_running()
+        self._wake()
+
+    def restore(self, name: str, order_id, state: str = None):
+        """
+        Tracks an order confirmed before a restart, with its last known state, unless that state is
+        terminal. Polling starts with the next watched order or status read.
+        """
+        if state is not None and str(state).upper() in TERMINAL_STATES:
+            return
+        entry = self._track(name, order_id)
+        if entry.state is None:
+            entry.state = state
+
+    def lookup(self, name: str, order_id) -> OrderStatus | None:
+        return self._orders.get((name, str(order_id)))
+
+    def table(self) -> list:
+        """Returns the status table as a list of dicts."""
+        return [
+            {"source": entry.name, "order_id": entry.order_id, "state": entry.state, "terminal": entry.terminal,
+             "updated_at": entry.updated_at, "next_poll_in": max(0.0, round(entry.next_poll_at - time.monotonic(), 1))}
+            for entry in list(self._orders.values())
+        ]
+
+    # --- Reads used by the status tools ---
+
+    def status(self, name: str, order_id):
+        """
+        Returns the latest known status response of an order, polling upstream only if
+        it has not been received yet.
+        """
+        entry = self._track(name, order_id)
+        if entry.response is not None:
+            return entry.response
+        response = self._fetch(name, order_id)
+        self._apply(name, order_id, response)
+        # Orders confirmed before a restart are picked up here
+        self._ensure_running()
+        return response
+
+    async def astatus(self, name: str, order_id):
+        """Async counterpart of status."""
+        entry = self._track(name, order_id)
+        if entry.response is not None:
+            return entry.response
+        response = await self._afetch(name, order_id)
+        self._apply(name, order_id, response)
+        # Orders confirmed before a restart are picked up here
+        self._ensure_running()
+        return response
+
+    # --- Polling ---
+
+    def _fetch(self, name: str, order_id):
+        builder, url = self._sources[name]
+        payload, error_msg = builder.build(order_id=str(order_id))
+        if error_msg:
+            return error_msg
+        return http_client.request_json("POST", url, action="status", coalesce=True, data=payload, headers=http_client.JSON_HEADERS)
+
+    async def _afetch(self, name: str, order_id):
+        builder, url = self._sources[name]
+        payload, error_msg = builder.build(order_id=str(order_id))
+        if error_msg:
+            return error_msg
+        return await http_client.arequest_json("POST", url, action="status", coalesce=True, data=payload, headers=http_client.JSON_HEADERS)
+
+    def _apply(self, name: str, order_id, response):
+        """Records a poll result and schedules the order's next poll, or drops the order after its final poll."""
+        entry = self.lookup(name, order_id)
+        if entry is None:
+            return
+        # Already terminal when polled: this was its final poll
+        final = entry.terminal and entry.response is not None
+        now = time.monotonic()
+        entry.polled_at = now
+        if not isinstance(response, dict):
+            entry.failures += 1
+            entry.interval = min(entry.interval * 2, STATUS_POLL_MAX_INTERVAL)
+        else:
+            state = extract_state(response)
+            if state != entry.state or entry.response is None:
+                entry.interval = STATUS_POLL_MIN_INTERVAL
+            else:
+                entry.interval = min(entry.interval * 2, STATUS_POLL_MAX_INTERVAL)
+            if state is not None and state != entry.state:
+                durable_store.update_order_status(name, entry.order_id, state)
+            entry.state = state
+            entry.response = response
+            entry.updated_at = time.time()
+            entry.failures = 0
+            if entry.terminal:
+                entry.interval = STATUS_POLL_TERMINAL_INTERVAL
+        if final and entry.terminal:
+            with self._lock:
+                self._orders.pop((name, entry.order_id), None)
+            return
+        entry.next_poll_at = now + entry.interval
+
+    async def _poll(self, entry: OrderStatus, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            try:
+                response = await self._afetch(entry.name, entry.order_id)
+            except Exception as e:
+                response = f"Error polling status: {e}"
+            self.polls += 1
+            self._apply(entry.name, entry.order_id, response)
+
+    async def _run(self):
+        self._wakeup = asyncio.Event()
+        semaphore = asyncio.Semaphore(STATUS_POLL_BATCH_SIZE)
+        while True:
+            now = time.monotonic()
+            entries = list(self._orders.values())
+            due = [entry for entry in entries if entry.next_poll_at <= now]
+            if due:
+                await asyncio.gather(*(self._poll(entry, semaphore) for entry in due))
+                continue
+            delay = min((entry.next_poll_at for entry in entries), default=now + STATUS_POLL_MAX_INTERVAL) - now
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, delay))
+            except asyncio.TimeoutError:
+                pass
+
+    def _ensure_running(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            started = threading.Event()
+
+            def run():
+                self._loop = asyncio.new_event_loop()
+                self._loop.call_soon(started.set)
+                self._loop.run_until_complete(self._run())
+
+            self._thread = threading.Thread(target=run, name="status-watcher", daemon=True)
+            self._thread.start()
+            started.wait()
+
+    def _wake(self):
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+
+watcher = StatusWatcher()
+
+
+def register(name: str, builder, url: str):
+    watcher.register(name, builder, url)
+
+
+def watch(name: str, order_id):
+    watcher.watch(name, order_id)
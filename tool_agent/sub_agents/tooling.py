@@ -0,0 +1,14 @@
+def async_variant(sync_func):
+    """
+    Decorator for the `async def` version of a sync tool.
+    The async function takes over the sync tool's name and docstring, so it can be registered
+    on the agent in place of the sync one without changing the tool names used in the instruction.
+
+    Args:
+        sync_func: The synchronous tool function this coroutine function replaces.
+    """
+    def decorator(async_func):
+        async_func.__name__ = sync_func.__name__
+        async_func.__doc__ = sync_func.__doc__
+        return async_func
+    return decorator
@@ -0,0 +1,248 @@
+from dotenv import load_dotenv
+import os
+import heapq
+import sqlite3
+import threading
+from collections import Counter
+from .tooling import async_variant
+from . import durable_store
+
+load_dotenv()
+
+# Transformer load index.
+# New meters used to be assigned to TRANSFORMER_IDS round-robin, whatever was already connected.
+# Each transformer's load is now tracked as its meters (METER_BASELINE_KW each) plus the nominal kW of
+# the DERs created behind those meters, against its capacity (TRANSFORMER_CAPACITY_KW, or
+# TRANSFORMER_CAPACITY_KW_<ID> for one transformer). A min-heap ordered by utilization gives the
+# least-loaded transformer for every new meter in O(log n); entries are invalidated by version
+# instead of being removed, and the heap is rebuilt once it holds too many stale entries.
+#
+# The counts are rebuilt on startup from the durable store's meters, energy_resources and ders tables.
+METER_BASELINE_KW = float(os.getenv("METER_BASELINE_KW", "2.0"))
+TRANSFORMER_CAPACITY_KW = float(os.getenv("TRANSFORMER_CAPACITY_KW", "500"))
+
+
+def get_capacity_kw(transformer_id) -> float:
+    env_value = os.getenv(f"TRANSFORMER_CAPACITY_KW_{transformer_id}")
+    if env_value:
+        try:
+            return float(env_value)
+        except ValueError:
+            print(f"Warning: Ignoring invalid TRANSFORMER_CAPACITY_KW_{transformer_id} value: {env_value}")
+    return TRANSFORMER_CAPACITY_KW
+
+
+class TransformerLoad:
+    """Load of one transformer."""
+    __slots__ = ("transformer_id", "capacity_kw", "meters", "appliances", "der_kw", "version")
+
+    def __init__(self, transformer_id):
+        self.transformer_id = transformer_id
+        self.capacity_kw = get_capacity_kw(transformer_id)
+        self.meters = 0
+        self.appliances = Counter()  # appliance id -> DERs behind this transformer
+        self.der_kw = 0.0
+        self.version = 0
+
+    @property
+    def load_kw(self) -> float:
+        return self.meters * METER_BASELINE_KW + self.der_kw
+
+    @property
+    def utilization(self) -> float:
+        return self.load_kw / self.capacity_kw if self.capacity_kw > 0 else float("inf")
+
+
+class TransformerLoadIndex:
+    """
+    Per-transformer load plus the heap of placeable transformers.
+    """
+
+    def __init__(self):
+        self._loads = {}      # transformer id -> TransformerLoad
+        self._positions = {}  # placeable transformer id -> position in the configured list (tie-break)
+        self._heap = []       # (utilization, meters, position, version, transformer id)
+        self._meter_transformers = {}  # meter id -> transformer id
+        self._er_transformers = {}     # energy resource id -> transformer id
+        self._appliance_kw = {}        # appliance id -> nominal kW
+        self._lock = threading.Lock()
+
+    def _load(self, transformer_id) -> TransformerLoad:
+        load = self._loads.get(transformer_id)
+        if load is None:
+            load = self._loads[transformer_id] = TransformerLoad(transformer_id)
+        return load
+
+    def _entry(self, load: TransformerLoad) -> tuple:
+        return (load.utilization, load.meters, self._positions[load.transformer_id], load.version, load.transformer_id)
+
+    def _changed(self, load: TransformerLoad):
+        # Called with the lock held, after any change of the load
+        load.version += 1
+        if load.transformer_id not in self._positions:
+            return
+        heapq.heappush(self._heap, self._entry(load))
+        if len(self._heap) > 2 * len(self._positions) + 64:
+            self._heap = [self._entry(self._loads[transformer_id]) for transformer_id in self._positions]
+            heapq.heapify(self._heap)
+
+    def _update_der_kw(self, load: TransformerLoad):
+        load.der_kw = sum(count * self._appliance_kw.get(appliance_id, 0.0) for appliance_id, count in load.appliances.items())
+
+    def add_transformers(self, transformer_ids: list):
+        """Makes transformers available for placement, in order of preference on equal load."""
+        with self._lock:
+            for transformer_id in transformer_ids:
+                if transformer_id not in self._positions:
+                    self._positions[transformer_id] = len(self._positions)
+                    self._changed(self._load(transformer_id))
+
+    def set_appliance_kw(self, appliance_kw: dict):
+        """Sets the nominal kW of each appliance id, used for the DER load."""
+        with self._lock:
+            self._appliance_kw = dict(appliance_kw)
+            for load in self._loads.values():
+                self._update_der_kw(load)
+                self._changed(load)
+
+    def place(self):
+        """
+        Returns the least-loaded transformer and counts one more meter on it,
+        or None if no transformer is configured.
+        """
+        with self._lock:
+            while self._heap:
+                utilization, meters, position, version, transformer_id = self._heap[0]
+                load = self._loads[transformer_id]
+                if version != load.version:
+                    heapq.heappop(self._heap)
+                    continue
+                load.meters += 1
+                load.version += 1
+                heapq.heapreplace(self._heap, self._entry(load))
+                return transformer_id
+            return None
+
+    def release(self, transformer_id):
+        """Takes back a placement whose meter could not be created."""
+        if transformer_id is None:
+            return
+        with self._lock:
+            load = self._load(transformer_id)
+            load.meters = max(0, load.meters - 1)
+            self._changed(load)
+
+    def bind_meter(self, meter_id, transformer_id):
+        """Records the transformer of a created meter (already counted by place)."""
+        with self._lock:
+            self._meter_transformers[meter_id] = transformer_id
+
+    def transformer_of(self, meter_id):
+        """The transformer a meter was placed on, or None."""
+        return self._meter_transformers.get(meter_id)
+
+    def bind_energy_resource(self, er_id, meter_id):
+        with self._lock:
+            transformer_id = self._meter_transformers.get(meter_id)
+            if transformer_id is not None:
+                self._er_transformers[er_id] = transformer_id
+
+    def add_der(self, er_id, appliance_id):
+        """Adds a created DER to the load of its energy resource's transformer, if known."""
+        with self._lock:
+            transformer_id = self._er_transformers.get(er_id)
+            if transformer_id is None:
+                return None
+            load = self._load(transformer_id)
+            load.appliances[appliance_id] += 1
+            self._update_der_kw(load)
+            self._changed(load)
+            return transformer_id
+
+    def restore(self, meters: list, energy_resources: list, ders: list):
+        """
+        Rebuilds the counts from (meter_id, transformer_id), (er_id, meter_id) and (er_id, appliance_id) rows.
+        """
+        with self._lock:
+            for meter_id, transformer_id in meters:
+                if transformer_id is None:
+                    continue
+                self._meter_transformers[meter_id] = transformer_id
+                self._load(transformer_id).meters += 1
+            for er_id, meter_id in energy_resources:
+                transformer_id = self._meter_transformers.get(meter_id)
+                if transformer_id is not None:
+                    self._er_transformers[er_id] = transformer_id
+            for er_id, appliance_id in ders:
+                transformer_id = self._er_transformers.get(er_id)
+                if transformer_id is not None:
+                    self._load(transformer_id).appliances[appliance_id] += 1
+            for load in self._loads.values():
+                self._update_der_kw(load)
+                self._changed(load)
+
+    def report(self) -> dict:
+        with self._lock:
+            loads = sorted(self._loads.values(), key=lambda load: load.utilization, reverse=True)
+            transformers = [
+                {
+                    "transformer_id": load.transformer_id,
+                    "meters": load.meters,
+                    "der_count": sum(load.appliances.values()),
+                    "der_kw": round(load.der_kw, 3),
+                    "load_kw": round(load.load_kw, 3),
+                    "capacity_kw": load.capacity_kw,
+                    "utilization": round(load.utilization, 4),
+                    "placeable": load.transformer_id in self._positions,
+                }
+                for load in loads
+            ]
+        return {
+            "transformers": transformers,
+            "total_meters": sum(entry["meters"] for entry in transformers),
+            "total_der_kw": round(sum(entry["der_kw"] for entry in transformers), 3),
+            "next_placement": self._peek(),
+        }
+
+    def _peek(self):
+        with self._lock:
+            while self._heap and self._heap[0][3] != self._loads[self._heap[0][4]].version:
+                heapq.heappop(self._heap)
+            return self._heap[0][4] if self._heap else None
+
+
+index = TransformerLoadIndex()
+
+
+def _restore():
+    if not durable_store.store.enabled:
+        return
+    try:
+        index.restore(
+            durable_store.store.rows("SELECT meter_id, transformer FROM meters"),
+            durable_store.store.rows("SELECT er_id, meter_id FROM energy_resources"),
+            durable_store.store.rows("SELECT er_id, appliance_id FROM ders"),
+        )
+    except sqlite3.Error as e:
+        print(f"Warning: Could not restore the transformer loads from {durable_store.store.path}: {e}")
+
+
+_restore()
+
+
+def get_transformer_placement_report() -> dict:
+    """
+    Reports the load of every transformer new meters are placed on: its number of meters,
+    the DERs created behind it and their nominal kW, its total load against its capacity,
+    and the transformer the next new meter will be placed on.
+    This function will be used as a tool by the agent.
+
+    Returns:
+        A dict with the transformers, most loaded first, the fleet totals and the next placement.
+    """
+    return index.report()
+
+
+@async_variant(get_transformer_placement_report)
+async def get_transformer_placement_report_async() -> dict:
+    return index.report()
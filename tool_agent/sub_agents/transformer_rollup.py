@@ -0,0 +1,198 @@
+from dotenv import load_dotenv
+import os
+import sqlite3
+import threading
+import numpy as np
+from .tooling import async_variant
+from . import durable_store
+from . import meter_timeseries
+from . import transformer_load
+
+load_dotenv()
+
+# Transformer and utility consumption rollups.
+# The meters created by create_meter_data are each placed on a transformer, but their readings were
+# only ever looked at one meter at a time. Every reading the meter time-series cache appends is now
+# also added to its transformer's rollup and to the utility's: sums of kWh and reading counts per
+# 15-minute bucket, in NumPy arrays (one row per transformer, plus the utility row). The buckets form
+# a ring over the last TRANSFORMER_ROLLUP_DAYS days: a bucket's slot is its number modulo the ring
+# size, and slots are cleared as the newest reading moves the ring forward. Adding a reading is O(1),
+# and "the load on transformer 183 right now" is the newest bucket of its row, with no rescan of
+# the meters.
+#
+# Readings reach the rollup when a meter's history is fetched (get_meter_history, the load profile,
+# the UI), so a bucket counts the readings of the meters fetched so far, reported as readings (a
+# count of readings, not of distinct meters: a meter read twice in a bucket counts twice). Meters
+# whose transformer is unknown count towards the utility only. The rollups are rebuilt on startup
+# from the cached readings of the durable store's meters.
+TRANSFORMER_ROLLUP_DAYS = int(os.getenv("TRANSFORMER_ROLLUP_DAYS", "90"))
+
+BUCKET_SECONDS = 900
+BUCKETS_PER_HOUR = 3600 // BUCKET_SECONDS
+UTILITY = "utility"
+
+
+def _iso(bucket: int) -> str:
+    return f"{np.datetime_as_string(np.datetime64(int(bucket) * BUCKET_SECONDS, 's'), unit='s')}Z"
+
+
+class TransformerRollup:
+    """
+    kWh and reading counts per (transformer, 15-minute bucket), in a ring of buckets over the last days.
+    """
+
+    def __init__(self, days: int = TRANSFORMER_ROLLUP_DAYS):
+        self.slots = max(1, days) * 24 * BUCKETS_PER_HOUR
+        self._rows = {UTILITY: 0}  # transformer id -> row
+        self._kwh = np.zeros((1, self.slots))
+        self._readings = np.zeros((1, self.slots), dtype=np.int32)
+        self._latest = np.full(1, -1, dtype=np.int64)  # newest bucket with readings, per row
+        self._meters = [set()]                         # meters added, per row
+        self._newest = None                            # newest bucket of the ring
+        self._lock = threading.Lock()
+
+    def _row(self, transformer_id) -> int:
+        # Called with the lock held
+        row = self._rows.get(transformer_id)
+        if row is None:
+            row = self._rows[transformer_id] = len(self._rows)
+            self._kwh = np.vstack([self._kwh, np.zeros(self.slots)])
+            self._readings = np.vstack([self._readings, np.zeros(self.slots, dtype=np.int32)])
+            self._latest = np.append(self._latest, -1)
+            self._meters.append(set())
+        return row
+
+    def _advance(self, newest: int):
+        # Called with the lock held: clears the slots of the buckets the ring moves over
+        if self._newest is not None and newest <= self._newest:
+            return
+        first = newest - self.slots + 1 if self._newest is None else max(self._newest + 1, newest - self.slots + 1)
+        cleared = np.arange(first, newest + 1) % self.slots
+        self._kwh[:, cleared] = 0.0
+        self._readings[:, cleared] = 0
+        self._newest = newest
+
+    def add(self, meter_id, timestamps, kwh):
+        """Adds readings of a meter ((epoch seconds, kWh) arrays) to its transformer and the utility."""
+        buckets = np.asarray(timestamps, dtype=np.int64) // BUCKET_SECONDS
+        kwh = np.asarray(kwh, dtype=np.float64)
+        if len(buckets) == 0:
+            return
+        transformer_id = transformer_load.index.transformer_of(meter_id)
+        with self._lock:
+            self._advance(int(buckets.max()))
+            in_ring = buckets > self._newest - self.slots
+            buckets, kwh = buckets[in_ring], kwh[in_ring]
+            if len(buckets) == 0:
+                return
+            rows = [0] if transformer_id is None else [0, self._row(transformer_id)]
+            slots = buckets % self.slots
+            for row in rows:
+                np.add.at(self._kwh[row], slots, kwh)
+                np.add.at(self._readings[row], slots, 1)
+                self._latest[row] = max(self._latest[row], int(buckets.max()))
+                self._meters[row].add(meter_id)
+
+    def _bucket_load(self, row: int, bucket: int) -> dict:
+        slot = bucket % self.slots
+        kwh = float(self._kwh[row, slot])
+        return {
+            "bucket": _iso(bucket),
+            "kwh": round(kwh, 4),
+            "kw": round(kwh * BUCKETS_PER_HOUR, 3),  # average over the 15 minutes
+            "readings": int(self._readings[row, slot]),
+        }
+
+    def _profile(self, row: int, hours: float) -> list:
+        last = int(self._latest[row])
+        count = min(self.slots, max(1, int(hours * BUCKETS_PER_HOUR)))
+        buckets = np.arange(last - count + 1, last + 1)
+        buckets = buckets[buckets > self._newest - self.slots]
+        kw = self._kwh[row, buckets % self.slots] * BUCKETS_PER_HOUR
+        return [[_iso(bucket), round(float(value), 3)] for bucket, value in zip(buckets, kw)]
+
+    def load(self, transformer_id=UTILITY, hours: float = 0) -> dict | None:
+        """
+        The newest bucket of a transformer (or the utility), with its last hours of kW per bucket
+        when hours > 0. None if no reading of it was added.
+        """
+        with self._lock:
+            row = self._rows.get(transformer_id)
+            if row is None or self._latest[row] < 0 or self._latest[row] <= self._newest - self.slots:
+                # Nothing added, or only readings the ring has moved past
+                return None
+            result = {
+                "transformer_id": transformer_id,
+                "meters": len(self._meters[row]),
+                **self._bucket_load(row, int(self._latest[row])),
+            }
+            if transformer_id != UTILITY:
+                capacity_kw = transformer_load.get_capacity_kw(transformer_id)
+                result["capacity_kw"] = capacity_kw
+                result["utilization"] = round(result["kw"] / capacity_kw, 4) if capacity_kw else None
+            if hours > 0:
+                result["profile_kw"] = self._profile(row, hours)  # [[bucket start, kW], ...]
+            return result
+
+    def transformer_ids(self) -> list:
+        with self._lock:
+            return [transformer_id for transformer_id in self._rows if transformer_id != UTILITY]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"transformers": len(self._rows) - 1, "slots": self.slots, "bytes": self._kwh.nbytes + self._readings.nbytes}
+
+
+rollup = TransformerRollup()
+meter_timeseries.add_listener(rollup.add)
+
+
+def _restore():
+    if not durable_store.store.enabled:
+        return
+    try:
+        meter_ids = [meter_id for (meter_id,) in durable_store.store.rows("SELECT meter_id FROM meters")]
+    except sqlite3.Error as e:
+        print(f"Warning: Could not restore the transformer rollups from {durable_store.store.path}: {e}")
+        return
+    for meter_id in meter_ids:
+        series = meter_timeseries.cache.series(meter_id)
+        if series.count():
+            rollup.add(meter_id, *series.arrays())
+
+
+_restore()
+
+
+def get_transformer_rollup(transformer_id: int = None, hours: float = 24) -> dict:
+    """
+    Reports the consumption of a transformer, or of the whole utility, from the readings of the
+    meters behind it: the load of the latest 15-minute interval ("what is the load on transformer
+    183 right now?") and the kW of each interval over the last hours.
+    This function will be used as a tool by the agent.
+
+    Args:
+        transformer_id: The transformer, e.g. 183. Omit it for the utility total and every transformer's latest load.
+        hours: Hours of 15-minute loads to include (0 for the latest interval only).
+
+    Returns:
+        A dict with the latest interval (kWh, average kW, readings in it, utilization of a
+        transformer's capacity) and the recent profile, or an error message.
+    """
+    if transformer_id is not None:
+        result = rollup.load(transformer_id, hours)
+        if result is None:
+            return f"Error: No meter readings for transformer {transformer_id} yet. Readings are added as meter histories are fetched."
+        return result
+    result = rollup.load(UTILITY, hours)
+    if result is None:
+        return "Error: No meter readings yet. Readings are added as meter histories are fetched."
+    # Transformers whose readings have all aged out of the ring have no load to report
+    transformers = [load for load in (rollup.load(transformer) for transformer in rollup.transformer_ids()) if load is not None]
+    result["transformers"] = sorted(transformers, key=lambda load: load["kw"], reverse=True)
+    return result
+
+
+@async_variant(get_transformer_rollup)
+async def get_transformer_rollup_async(transformer_id: int = None, hours: float = 24) -> dict:
+    return get_transformer_rollup(transformer_id, hours)
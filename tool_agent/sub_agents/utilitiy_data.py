@@ -1,10 +1,10 @@
-import requests
-from google.adk.agents import Agent
 from dotenv import load_dotenv
 import os
 import uuid
-from datetime import datetime, timezone
 import json
+import asyncio
+from . import http_client
+from .client_registry import clients
 
 # Vertex AI specific imports
 from google.cloud import aiplatform
@@ -35,11 +35,22 @@ VECTOR_STORE_CACHE = {}
 # Lower is more similar. Adjust based on experimentation.
 SIMILARITY_THRESHOLD = 0.5
 
+# The embedding model and the Vector Search handles are resolved once per process (see
+# client_registry.py) instead of on every query. VERTEX_WARM_UP=1 resolves them at server start.
+VERTEX_WARM_UP = os.getenv("VERTEX_WARM_UP", "0").lower() in ("1", "true", "yes")
+EMBEDDING_MODEL = "vertex_embedding_model"
+INDEX_ENDPOINT = "vertex_index_endpoint"
+INDEX = "vertex_index"
+
+clients.register(EMBEDDING_MODEL, lambda: aiplatform.TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL_ID))
+clients.register(INDEX_ENDPOINT, lambda: aiplatform.MatchingEngineIndexEndpoint(index_endpoint_name=VERTEX_AI_INDEX_ENDPOINT_ID))
+clients.register(INDEX, lambda: aiplatform.MatchingEngineIndex(index_name=VERTEX_AI_INDEX_ID))
+
 
 def get_text_embedding(text: str) -> list[float] | None:
     """Generates embedding for a given text using Vertex AI."""
     try:
-        model = aiplatform.TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL_ID)
+        model = clients.get(EMBEDDING_MODEL)
         embeddings = model.get_embeddings([text])
         if embeddings and embeddings[0].values:
             return embeddings[0].values
@@ -48,33 +59,15 @@ def get_text_embedding(text: str) -> list[float] | None:
         print(f"Error generating text embedding: {e}")
         return None
 
-def get_utility_data(search_query: str) -> str:
+def _lookup_vector_cache(query_embedding: list[float]) -> str | None:
     """
-    Gets utility data. Tries to fetch from Vertex AI Vector Search first.
-    If not found or not relevant, calls the external API, then caches the result.
-    Args:
-        search_query: The query string to search for utility data.
+    Queries Vertex AI Vector Search for the closest stored response.
+
     Returns:
-        A string representation of the JSON response, either from cache or fresh from API.
+        The cached response text if a relevant match is in the local demo cache, otherwise None.
     """
-    if not all([GOOGLE_PROJECT_ID, GOOGLE_PROJECT_REGION, VERTEX_AI_INDEX_ID, VERTEX_AI_INDEX_ENDPOINT_ID]):
-        print("Warning: Vertex AI configuration missing. Falling back to direct API call.")
-        return _fetch_from_api(search_query)
-
-    print(f"Searching utility data for: {search_query}")
-
-    # 1. Generate embedding for the search query
-    query_embedding = get_text_embedding(search_query)
-
-    if not query_embedding:
-        print("Failed to generate query embedding. Falling back to direct API call.")
-        return _fetch_from_api(search_query)
-
-    # 2. Query Vertex AI Vector Search
     try:
-        index_endpoint = aiplatform.MatchingEngineIndexEndpoint(
-            index_endpoint_name=VERTEX_AI_INDEX_ENDPOINT_ID
-        )
+        index_endpoint = clients.get(INDEX_ENDPOINT)
         # Deployments can have multiple deployed indexes, usually one.
         # The deployed_index_id is often the same as the index_id if not specified otherwise during deployment.
         # You might need to fetch this dynamically or ensure it's set correctly.
@@ -104,27 +97,20 @@ def get_utility_data(search_query: str) -> str:
 
     except Exception as e:
         print(f"Error querying Vertex AI Vector Search: {e}. Falling back to API.")
+        # The endpoint may have been redeployed: resolved again on the next query
+        clients.reset(INDEX_ENDPOINT)
+    return None
 
-    # 3. If not found in cache or not relevant, fetch from API and update vector store
-    print("Cache miss or no relevant match. Fetching from API.")
-    api_response_json = _fetch_from_api_json(search_query)
-
-    if isinstance(api_response_json, str) and api_response_json.startswith("Error:"):
-        return api_response_json
-
-    try:
-        api_response_text = json.dumps(api_response_json)
-    except TypeError as e:
-        print(f"Error serializing API response to JSON string: {e}")
-        return f"Error: Could not serialize API response. {e}"
 
+def _store_in_vector_index(api_response_text: str):
+    """Embeds the API response and upserts it to Vertex AI Vector Search and the local demo cache."""
     # 4. Generate embedding for the API response
     response_embedding = get_text_embedding(api_response_text)
 
     if response_embedding:
         # 5. Upsert to Vertex AI Vector Search
         try:
-            index = aiplatform.MatchingEngineIndex(index_name=VERTEX_AI_INDEX_ID)
+            index = clients.get(INDEX)
             new_doc_id = uuid.uuid4().hex
             
             datapoint = aiplatform.MatchingEngineIndexDatapoint(
@@ -141,33 +127,91 @@ def get_utility_data(search_query: str) -> str:
     else:
         print("Failed to generate embedding for API response. Skipping vector store update.")
 
+
+def _vertex_configured() -> bool:
+    return all([GOOGLE_PROJECT_ID, GOOGLE_PROJECT_REGION, VERTEX_AI_INDEX_ID, VERTEX_AI_INDEX_ENDPOINT_ID])
+
+
+def warm_up_vertex_clients() -> dict | str:
+    """
+    Resolves the embedding model and the Vector Search index and endpoint ahead of the first query.
+
+    Returns:
+        The seconds each client took to resolve (or its error), or an error message if Vertex AI is not configured.
+    """
+    if not _vertex_configured():
+        return "Error: Vertex AI configuration missing, nothing to warm up."
+    return clients.warm_up([EMBEDDING_MODEL, INDEX_ENDPOINT, INDEX])
+
+
+def _serialize_api_response(api_response_json) -> str:
+    try:
+        return json.dumps(api_response_json)
+    except TypeError as e:
+        print(f"Error serializing API response to JSON string: {e}")
+        return f"Error: Could not serialize API response. {e}"
+
+
+async def get_utility_data(search_query: str) -> str:
+    """
+    Gets utility data. Tries to fetch from Vertex AI Vector Search first.
+    If not found or not relevant, calls the external API, then caches the result.
+    Args:
+        search_query: The query string to search for utility data.
+    Returns:
+        A string representation of the JSON response, either from cache or fresh from API.
+    """
+    # The Vertex AI SDK calls are blocking, so they run in worker threads;
+    # the utility API call itself goes through the async HTTP client.
+    if not _vertex_configured():
+        print("Warning: Vertex AI configuration missing. Falling back to direct API call.")
+        return await _fetch_from_api(search_query)
+
+    print(f"Searching utility data for: {search_query}")
+
+    # 1. Generate embedding for the search query
+    query_embedding = await asyncio.to_thread(get_text_embedding, search_query)
+    if not query_embedding:
+        print("Failed to generate query embedding. Falling back to direct API call.")
+        return await _fetch_from_api(search_query)
+
+    # 2. Query Vertex AI Vector Search
+    cached_response = await asyncio.to_thread(_lookup_vector_cache, query_embedding)
+    if cached_response is not None:
+        return cached_response
+
+    # 3. If not found in cache or not relevant, fetch from API and update vector store
+    print("Cache miss or no relevant match. Fetching from API.")
+    api_response_json = await _fetch_from_api_json(search_query)
+
+    if isinstance(api_response_json, str) and api_response_json.startswith("Error:"):
+        return api_response_json
+
+    api_response_text = _serialize_api_response(api_response_json)
+    if api_response_text.startswith("Error:"):
+        return api_response_text
+
+    await asyncio.to_thread(_store_in_vector_index, api_response_text)
     return api_response_text
 
-def _fetch_from_api_json(search_query: str) -> dict | str:
+
+async def _fetch_from_api_json(search_query: str) -> dict | str:
     """Helper function to fetch data from the API and return JSON object or error string."""
-    try:
-        params = {"q": search_query}
-        response = requests.get(API_UTILITY_ENDPOINT, params=params)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"API request failed: {e}")
-        return f"Error: API request failed. {e}"
-    except json.JSONDecodeError as e:
-        print(f"Failed to decode API JSON response: {e}")
-        return f"Error: API response was not valid JSON. {e}"
+    result = await http_client.arequest_json("GET", API_UTILITY_ENDPOINT, action="utility", coalesce=True, params={"q": search_query})
+    if isinstance(result, str):
+        print(f"API request failed: {result}")
+        return f"Error: API request failed. {result}"
+    return result
+
 
 # Keep a version that just returns string for cases where Vertex AI is not configured
-def _fetch_from_api(search_query: str) -> str:
+async def _fetch_from_api(search_query: str) -> str:
     """Directly fetches from API and returns string representation of JSON or error."""
-    result = _fetch_from_api_json(search_query)
-    if isinstance(result, str) and result.startswith("Error:"):
+    result = await _fetch_from_api_json(search_query)
+    if isinstance(result, str):
         return result
     try:
         return json.dumps(result)
     except TypeError as e:
         print(f"Error serializing API response to JSON string (fallback): {e}")
         return f"Error: Could not serialize API response (fallback). {e}"
-
-
-        